@@ -0,0 +1,243 @@
+import threading
+import time
+from collections import OrderedDict
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.encoding import force_bytes, force_text
+
+__author__ = 'szpytfire'
+
+# Prefix of the cache keys holding each model's version
+VERSION_KEY_PREFIX = 'api_tools:version:'
+# Prefix of the cache keys holding cached responses
+RESPONSE_KEY_PREFIX = 'api_tools:response:'
+# Prefix of the cache keys holding the encoded dictifications of instances
+FRAGMENT_KEY_PREFIX = 'api_tools:fragment:'
+# Prefix of the cache keys holding cached instances
+INSTANCE_KEY_PREFIX = 'api_tools:instance:'
+
+# The number of model versions changed by the current thread
+_local = threading.local()
+
+def get_cache():
+    """
+    Gets the cache used by the API, set by the API_TOOLS_CACHE setting (defaults to 'default')
+    :return: A Django cache
+    """
+    return caches[getattr(settings, 'API_TOOLS_CACHE', 'default')]
+
+def get_model_label(model):
+    """
+    Gets a label identifying a model's database table, shared by proxy models
+    :param model: A model class
+    :return: '<app_label>.<model_name>' of the concrete model
+    """
+    opts = model._meta.concrete_model._meta
+    return '{}.{}'.format(opts.app_label, opts.model_name)
+
+def new_version():
+    """
+    Creates a version which won't clash with the versions given out before
+    (in case a model's version has been evicted from the cache)
+    :return: A version number
+    """
+    return int(time.time() * 1000000)
+
+def get_model_versions(models):
+    """
+    Gets the current version of each model.
+    A model's version changes every time one of its instances is saved or deleted,
+    so any cache entry keyed by the version is invalidated by the change.
+
+    :param models: A list of model classes
+    :return: A list of the models' versions
+    """
+    cache = get_cache()
+    keys = [VERSION_KEY_PREFIX + get_model_label(model) for model in models]
+    versions = cache.get_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_version(), None)
+            versions[key] = cache.get(key)
+
+    return [versions[key] for key in keys]
+
+def bump_model_version(model):
+    """
+    Changes the version of a model, invalidating any cache entries keyed by the version
+    :param model: A model class
+    :return: None
+    """
+    cache = get_cache()
+    key = VERSION_KEY_PREFIX + get_model_label(model)
+    _local.changes = get_change_count() + 1
+
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, new_version(), None)
+
+def get_change_count():
+    """
+    Counts the model versions changed by the current thread (see bump_model_version()),
+    so that callers can tell whether handling a request has changed any model
+    :return: The number of changes
+    """
+    return getattr(_local, 'changes', 0)
+
+def make_digest(*parts):
+    """
+    Creates a digest out of the parts identifying a response
+    :param parts: Values identifying the response
+    :return: A hex digest
+    """
+    return md5(force_bytes(':'.join(force_text(part) for part in parts))).hexdigest()
+
+def make_response_key(*parts):
+    """
+    Creates a cache key for a response out of the parts identifying it
+    :param parts: Values identifying the response
+    :return: The cache key
+    """
+    return RESPONSE_KEY_PREFIX + make_digest(*parts)
+
+def make_fragment_key(*parts):
+    """
+    Creates a cache key for an instance's encoded dictification out of the parts identifying it
+    :param parts: Values identifying the dictification
+    :return: The cache key
+    """
+    return FRAGMENT_KEY_PREFIX + make_digest(*parts)
+
+def make_instance_key(model, pk):
+    """
+    Creates a cache key for a model instance
+    :param model: A model class
+    :param pk: The primary key of the instance
+    :return: The cache key
+    """
+    return INSTANCE_KEY_PREFIX + make_digest(get_model_label(model), pk)
+
+class LocalCache(object):
+    """
+    Bounded cache held in process memory, which evicts the least recently used entries once it's full.
+    Entries expire after their timeout. Can be shared between threads.
+    """
+
+    def __init__(self, max_size):
+        """
+        :param max_size: The most entries held at once
+        :return: None
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Looks up an entry, marking it as the most recently used
+        :param key: The key of the entry
+        :return: The entry's value, or None if it isn't cached (or has expired)
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is None or entry[1] < time.time():
+                return None
+
+            self._entries[key] = entry
+            return entry[0]
+
+    def set(self, key, value, timeout):
+        """
+        Caches an entry, evicting the least recently used entry if the cache is full
+        :param key: The key of the entry
+        :param value: The entry's value
+        :param timeout: The number of seconds the entry expires after
+        :return: None
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time() + timeout)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Removes an entry (if it's cached)
+        :param key: The key of the entry
+        :return: None
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes all the entries
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+
+class SingleFlight(object):
+    """
+    Coalesces identical calls made at the same time by different threads: the first thread
+    to make a call runs it, while the others wait for its result rather than running it themselves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function, timeout):
+        """
+        Runs a function, unless another thread is already running it under the same key,
+        in which case that thread's result is waited for.
+
+        Threads which time out waiting, or whose leading thread raised an exception,
+        fall through to running the function themselves.
+
+        :param key: A key identifying the call
+        :param function: The function to run, taking no arguments
+        :param timeout: The most seconds to wait for another thread's result
+        :return: A tuple of (the result, whether it was shared by another thread)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leading = call is None
+
+            if leading:
+                call = self._calls[key] = _Call()
+
+        if not leading:
+            call.done.wait(timeout)
+
+            if call.done.is_set() and call.succeeded:
+                return call.result, True
+
+            return function(), False
+
+        try:
+            call.result = function()
+            call.succeeded = True
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.done.set()
+
+        return call.result, False
+
+class _Call(object):
+    """
+    A call being run by SingleFlight
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.succeeded = False
+        self.result = None
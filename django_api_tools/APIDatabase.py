@@ -0,0 +1,142 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from django_api_tools.APICache import get_cache
+
+__author__ = 'szpytfire'
+
+# Prefix of the cache keys marking the users whose reads are pinned to the primary database
+STICKY_KEY_PREFIX = 'api_tools:sticky:'
+
+# The database read from by the current thread, set while an API GET request is handled
+_local = threading.local()
+
+
+def get_replica_database():
+    """
+    Gets the database API GET requests read from, set by the API_TOOLS_READ_DATABASE setting
+    :return: A database alias, or None if reads aren't routed to a replica
+    """
+    return getattr(settings, 'API_TOOLS_READ_DATABASE', None)
+
+def get_read_database():
+    """
+    Gets the database the current thread is reading from
+    :return: A database alias, or None for the default routing
+    """
+    return getattr(_local, 'read_database', None)
+
+@contextmanager
+def use_read_database(alias):
+    """
+    Routes the reads made by the current thread to a database (see ReplicaRouter)
+    :param alias: A database alias, or None for the default routing
+    """
+    previous_alias = get_read_database()
+    _local.read_database = alias
+
+    try:
+        yield
+    finally:
+        _local.read_database = previous_alias
+
+def iterate_using(alias, iterable):
+    """
+    Iterates over an iterable which reads from the database lazily (e.g. a streamed response),
+    routing its reads to a database while it's iterated over.
+
+    :param alias: A database alias, or None for the default routing
+    :param iterable: The iterable
+    :return: A generator over the iterable's items
+    """
+    iterator = iter(iterable)
+
+    while True:
+        with use_read_database(alias):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+
+        yield item
+
+def get_sticky_key(request):
+    """
+    Gets the cache key marking the request's user as pinned to the primary database
+    :param request: The request object
+    :return: The cache key, or None if the request can't be told apart from other anonymous requests
+    """
+    if request.user.is_authenticated():
+        return '{}user:{}'.format(STICKY_KEY_PREFIX, request.user.pk)
+
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return '{}session:{}'.format(STICKY_KEY_PREFIX, session.session_key)
+
+    return None
+
+def pin_to_primary(request):
+    """
+    Pins the reads of the request's user to the primary database for API_TOOLS_READ_STICKINESS seconds
+    (5 by default), so that the user reads their own writes rather than a replica which is catching up.
+
+    :param request: The request object, after a write has been made
+    :return: None
+    """
+    stickiness = getattr(settings, 'API_TOOLS_READ_STICKINESS', 5)
+
+    if get_replica_database() is None or not stickiness:
+        return
+
+    key = get_sticky_key(request)
+    if key is not None:
+        get_cache().set(key, True, stickiness)
+
+def get_request_read_database(request):
+    """
+    Gets the database a GET request reads from
+    :param request: The request object
+    :return: The replica's database alias, or None if the request reads from the primary database
+    (either no replica has been set, or the user has made a write recently)
+    """
+    alias = get_replica_database()
+
+    if alias is None:
+        return None
+
+    key = get_sticky_key(request)
+    if key is not None and get_cache().get(key):
+        return None
+
+    return alias
+
+class ReplicaRouter(object):
+    """
+    Database router sending the reads made while an API GET request is handled to the replica
+    set by API_TOOLS_READ_DATABASE. Everything else is left to the default routing.
+
+    Add it to the DATABASE_ROUTERS setting:
+
+    DATABASE_ROUTERS = ['django_api_tools.APIDatabase.ReplicaRouter']
+    """
+
+    def db_for_read(self, model, **hints):
+        return get_read_database()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # instances read from the replica are the same rows as on the primary
+        databases = (DEFAULT_DB_ALIAS, get_replica_database())
+
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+
+        return None
+
+    def allow_migrate(self, db, model):
+        return None
@@ -0,0 +1,188 @@
+import json
+from uuid import UUID
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+__author__ = 'szpytfire'
+
+
+class APIJSONEncoder(DjangoJSONEncoder):
+    """
+    Subclass of DjangoJSONEncoder which also knows how to encode UUIDs.
+    All the JSON backends encode dictified model instances in the same way as this encoder.
+    """
+    def default(self, o):
+        if isinstance(o, UUID):
+            return str(o)
+
+        return super(APIJSONEncoder, self).default(o)
+
+class JSONBackend(object):
+    """
+    Encodes data into JSON with a particular JSON library.
+    Subclasses must provide a name and implement dumps().
+    """
+
+    # The name used to select the backend
+    name = None
+
+    def dumps(self, data):
+        """
+        Encodes data into a JSON string
+        :param data: the data to be json-ified
+        :return: JSON string (or bytes)
+        """
+        raise NotImplementedError
+
+class StdlibJSONBackend(JSONBackend):
+    """
+    JSON backend using Python's built-in json module, whose encoder is written in C.
+    Always available, and used by default.
+    """
+    name = 'json'
+
+    def dumps(self, data):
+        return json.dumps(data, cls=APIJSONEncoder)
+
+class SimpleJSONBackend(JSONBackend):
+    """
+    JSON backend using simplejson's C speedups.
+    Only used when chosen by name, as the built-in json module is as fast on most platforms.
+    """
+    name = 'simplejson'
+
+    def __init__(self):
+        import simplejson
+        self._simplejson = simplejson
+        self._default = APIJSONEncoder().default
+
+    def dumps(self, data):
+        # decimals are left to the default function, so that they are encoded as strings
+        return self._simplejson.dumps(data, default=self._default, use_decimal=False)
+
+class UltraJSONBackend(JSONBackend):
+    """
+    JSON backend using ujson's C encoder. Only used when chosen by name: ujson has no hook for
+    encoding other types, and would encode decimals as floats, so dictified data has to be checked
+    for such values in Python before it is encoded, which costs more than ujson saves
+    over the built-in json module (see the benchmarks).
+    """
+    name = 'ujson'
+
+    # The types ujson encodes in the same way as the built-in json module
+    native_types = frozenset([str, unicode, int, long, float, bool, type(None)])
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+        self._default = APIJSONEncoder().default
+
+    def dumps(self, data):
+        converted = self.convert(data)
+
+        try:
+            return self._ujson.dumps(data if converted is None else converted, escape_forward_slashes=False)
+        except OverflowError:
+            # integers beyond 64 bits are left to the built-in json module
+            return json.dumps(data, cls=APIJSONEncoder)
+
+    def convert(self, data):
+        """
+        Converts the values of data which aren't JSON types (e.g. datetimes, decimals and UUIDs)
+        into the form APIJSONEncoder gives them. Data is only copied where it holds such values.
+
+        :param data: the data to be json-ified
+        :return: The converted data, or None if data is made up of JSON types only
+        """
+        native_types = self.native_types
+
+        if isinstance(data, dict):
+            converted_dict = None
+
+            for key, value in data.iteritems():
+                if type(value) not in native_types:
+                    converted = self.convert(value)
+
+                    if converted is not None:
+                        if converted_dict is None:
+                            converted_dict = dict(data)
+                        converted_dict[key] = converted
+
+            return converted_dict
+
+        if isinstance(data, (list, tuple)):
+            converted_list = None
+
+            for index, value in enumerate(data):
+                if type(value) not in native_types:
+                    converted = self.convert(value)
+
+                    if converted is not None:
+                        if converted_list is None:
+                            converted_list = list(data)
+                        converted_list[index] = converted
+
+            return converted_list
+
+        if isinstance(data, (basestring, int, long, float)) or data is None:
+            return None
+
+        return self._default(data)
+
+# The JSON backends in order of preference.
+# The built-in backend is always available, so the backends following it are only used when chosen by name
+JSON_BACKENDS = (StdlibJSONBackend, UltraJSONBackend, SimpleJSONBackend)
+
+# Backends which have already been instantiated, keyed by name
+_json_backends = {}
+
+def get_json_backend(name=None):
+    """
+    Gets a JSON backend by name.
+
+    If no name is given, the API_TOOLS_JSON_BACKEND setting is used, and failing that,
+    the first backend of JSON_BACKENDS which is installed.
+
+    :param name: The name of the backend ('json', 'ujson' or 'simplejson')
+    :return: A JSONBackend, or raises an ImportError if the backend isn't installed
+    (or a ValueError if there's no backend with the name)
+    """
+    name = name or getattr(settings, 'API_TOOLS_JSON_BACKEND', None)
+
+    if name in _json_backends:
+        return _json_backends[name]
+
+    backend = None
+
+    for backend_class in JSON_BACKENDS:
+        if name is None:
+            try:
+                backend = backend_class()
+            except ImportError:
+                continue
+            break
+        elif backend_class.name == name:
+            backend = backend_class()
+            break
+
+    if backend is None:
+        raise ValueError("Unknown JSON backend: {}".format(name))
+
+    _json_backends[name] = backend
+    return backend
+
+def available_json_backends():
+    """
+    Gets all the JSON backends which are installed
+    :return: A list of JSONBackends
+    """
+    backends = []
+
+    for backend_class in JSON_BACKENDS:
+        try:
+            backends.append(get_json_backend(backend_class.name))
+        except ImportError:
+            pass
+
+    return backends
@@ -1,8 +1,23 @@
+import json
 from abc import abstractmethod
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime
+from itertools import islice
 
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import F, Prefetch
+from django.db.models.expressions import ExpressionNode
+from django.db.models.query import prefetch_related_objects
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.db.models.fields import FieldDoesNotExist
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.six.moves import cPickle as pickle
+
+from django_api_tools.APICache import LocalCache, bump_model_version, get_cache, make_instance_key
+from django_api_tools.APITiming import phase
 
 __author__ = 'szpytfire'
 
@@ -28,6 +43,85 @@ class ReservedPrefix(object):
     MANY_TO_MANY_SHORT = 'm2m_short'
     MANY_TO_MANY_LONG = 'm2m_long'
 
+    # Prefixes whose related models are dictified into a list
+    MANY = (REL_SHORT, REL_LONG, MANY_TO_MANY_SHORT, MANY_TO_MANY_LONG)
+    # Prefixes whose related models are only short dictified
+    SHORT = (FK_SHORT, REL_SHORT, ONE_TO_ONE_SHORT, MANY_TO_MANY_SHORT)
+
+class InvalidCursor(Exception):
+    """
+    Raised when a pagination cursor passed in by a client can't be decoded
+    """
+    pass
+
+# Cached in place of instances which don't exist
+MISSING_INSTANCE = 'missing'
+
+class ConcurrentUpdate(Exception):
+    """
+    Raised when an instance can't be updated because its row has changed since the instance was loaded
+    (its version no longer matches), or no longer matches the condition of an atomic operation
+    """
+    pass
+
+class AtomicOperation(object):
+    """
+    Describes a change to a field which is made by the database, as part of a single UPDATE query,
+    so that concurrent requests can't overwrite each other's changes.
+    Subclasses must implement compile().
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def compile(self, model, value):
+        """
+        Compiles the operation into the arguments of an UPDATE query
+        :param model: The model class the operation is declared on
+        :param value: The value of the request parameter which triggered the operation
+        :return: A tuple of (field values or F() expressions keyed by field name,
+        lookups the row must match for the update to go ahead)
+        """
+        raise NotImplementedError
+
+class Increment(AtomicOperation):
+    """
+    Adds an amount to a numeric field, e.g. Increment('views').
+    If no amount is given, the amount is taken from the request parameter.
+    """
+
+    def __init__(self, field, amount=1):
+        super(Increment, self).__init__(field)
+        self.amount = amount
+
+    def compile(self, model, value):
+        amount = self.amount
+
+        if amount is None:
+            try:
+                amount = model._meta.get_field(self.field).to_python(value)
+            except ValidationError, e:
+                raise ValueError(e)
+
+        return {self.field: F(self.field) + amount}, {}
+
+class SetIf(AtomicOperation):
+    """
+    Sets a field to the value of the request parameter, only if the row matches the lookups given,
+    e.g. SetIf('status', status='draft'). The update is a conflict if the row doesn't match.
+    """
+
+    def __init__(self, field, **lookups):
+        super(SetIf, self).__init__(field)
+        self.lookups = lookups
+
+    def compile(self, model, value):
+        field = model._meta.get_field(self.field)
+        value = field.to_python(value)
+        field.run_validators(value)
+
+        return {self.field: value}, self.lookups
+
 class APIModel(models.Model):
     """
     Abstract Model which all API endpoints must inherit from.
@@ -38,6 +132,8 @@ class APIModel(models.Model):
     # by default
     active = models.IntegerField(default=1)
     date_deactivated = models.DateTimeField(null=True)
+    # Updated on every save, allowing clients to make conditional requests
+    date_modified = models.DateTimeField(auto_now=True, null=True)
 
     # Model fields which are publicly readable via the API
     public_fields = ()
@@ -54,9 +150,56 @@ class APIModel(models.Model):
 
     # The default number of model instances to return in a get_all() request
     pagination = 10
+    # The most model instances which can be requested at once by id (see get_many())
+    max_requested_ids = 100
+
+    # Fields which can be set when creating instances in bulk (see api_bulk_create())
+    bulk_create_fields = ()
+    # Fields which can be changed when updating instances in bulk (see api_bulk_update())
+    bulk_update_fields = ()
+
+    # Whether get_all() requests page through instances with an opaque cursor
+    # rather than a page number. Cursor pagination never counts the instances,
+    # and its cost doesn't grow with the depth of the page
+    cursor_pagination = False
+    # The unique, indexed field cursor pagination orders by (prefix with '-' for descending)
+    cursor_ordering = 'id'
+
+    # The number of model instances read from the database at a time when dictifying lazily
+    iterator_chunk_size = 100
+
+    # Whether instances requested by primary key are cached (see get_cached_instance()),
+    # in process memory and in the API cache. Ids which don't match an instance are cached too
+    cache_instances = False
+    # The number of seconds instances are cached for in the API cache
+    instance_cache_timeout = 60
+    # The number of seconds instances are cached for in process memory.
+    # Saves made by other processes can go unseen in process memory for up to this long
+    instance_cache_local_timeout = 5
+    # The most instances of the model cached in process memory
+    instance_cache_size = 1000
+
+    # The name of an integer field holding the version of each instance, or None.
+    # Versioned instances are updated with compare-and-swap: save_changes() only writes changed fields
+    # if the version hasn't changed since the instance was loaded, raising a ConcurrentUpdate otherwise
+    version_field = None
+    # Atomic operations applied by api_update(), keyed by the request parameter which triggers them
+    atomic_operations = {}
+
+    # Whether to leave the columns of description fields which won't be dictified out of queries.
+    # Models whose properties or is_owner() read other description fields should turn this off
+    defer_unused_fields = True
 
     # The default readability of the model instance is set to a Public User
     _user_auth = UserAuthCode.PUBLIC
+    # Authentication levels on related models which have already been resolved in bulk
+    _related_user_auths = None
+    # The fields requested by the client, or None for all the fields
+    _requested_fields = None
+    # The relations requested by the client to be dictified, or None for all the relations
+    _expanded_fields = None
+    # The values of the instance's fields when it was loaded (or last saved)
+    _loaded_values = None
 
     # Prefixes which are used in field descriptions to indicate foreign model relationships
     _reserved_prefixes = [
@@ -70,35 +213,177 @@ class APIModel(models.Model):
         ReservedPrefix.MANY_TO_MANY_LONG
     ]
 
+    def __init__(self, *args, **kwargs):
+        super(APIModel, self).__init__(*args, **kwargs)
+        self.snapshot_fields()
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        super(APIModel, self).save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+        self.snapshot_fields(update_fields)
+
+    def snapshot_fields(self, field_names=None):
+        """
+        Records the current values of the instance's (loaded) fields,
+        so that changes to them can be found later on (see get_changed_fields()).
+
+        :param field_names: The names (or attribute names, as accepted by save()) of the fields to record,
+        or None for all the fields
+        :return: None
+        """
+        instance_dict = self.__dict__
+
+        if field_names is None or self._loaded_values is None:
+            self._loaded_values = dict((attname, instance_dict[attname]) for attname in self.get_field_attnames() if attname in instance_dict)
+        else:
+            field_attnames = self.get_field_attname_map()
+
+            for name in field_names:
+                attname = field_attnames[name]
+                if attname in instance_dict:
+                    self._loaded_values[attname] = instance_dict[attname]
+
+    @classmethod
+    def get_field_attnames(cls):
+        """
+        Gets the attribute names of the model's concrete fields, computed once per model class
+        :return: A tuple of attribute names
+        """
+        attnames = cls.get_class_cache('_field_attnames')
+
+        if 'attnames' not in attnames:
+            attnames['attnames'] = tuple(field.attname for field in cls._meta.concrete_fields)
+
+        return attnames['attnames']
+
+    @classmethod
+    def get_field_attname_map(cls):
+        """
+        Maps both the names and the attribute names of the model's concrete fields
+        (e.g. 'owner' and 'owner_id') to their attribute names, computed once per model class
+        :return: A dictionary of attribute names
+        """
+        attnames = cls.get_class_cache('_field_attnames')
+
+        if 'map' not in attnames:
+            attnames['map'] = dict((name, field.attname) for field in cls._meta.concrete_fields for name in (field.name, field.attname))
+
+        return attnames['map']
+
+    def get_changed_fields(self):
+        """
+        Finds the fields whose values have changed since the instance was loaded (or last saved).
+        Deferred fields which have since been set are treated as changed.
+
+        :return: A list of the names of the changed fields
+        """
+        instance_dict = self.__dict__
+        loaded_values = self._loaded_values or {}
+        missing = object()
+
+        return [
+            field.name for field in self._meta.concrete_fields
+            if field.attname in instance_dict and loaded_values.get(field.attname, missing) != instance_dict[field.attname]
+        ]
+
+    def save_changes(self, changes=None, **lookups):
+        """
+        Saves only the fields which have changed since the instance was loaded,
+        skipping the write altogether if nothing has changed.
+        New instances are saved in full.
+
+        Versioned instances (see version_field), and instances given atomic changes, are written
+        with update_atomically() rather than save(), so no signals are sent for them.
+
+        :param changes: Field values or F() expressions to write alongside the changed fields (see atomic_operations)
+        :param lookups: Lookups the instance's row must match for the changes to be written
+        :return: Whether or not the instance was written to the database. Raises a ConcurrentUpdate
+        if the row has changed since the instance was loaded, or doesn't match the lookups
+        """
+        if self._state.adding:
+            self.save()
+
+            if not changes:
+                return True
+
+        changes = dict(changes or {})
+        changed_fields = [name for name in self.get_changed_fields() if name not in changes and name != self.version_field]
+
+        if not changed_fields and not changes:
+            return False
+
+        if changes or lookups or self.version_field is not None:
+            for name in changed_fields:
+                changes[name] = getattr(self, self._meta.get_field(name).attname)
+
+            # the changed values may have been worked out from stale ones, so are only written if the version still matches
+            if changed_fields and self.version_field is not None:
+                lookups.setdefault(self.version_field, getattr(self, self.version_field))
+
+            self.update_atomically(changes, **lookups)
+        else:
+            # auto_now fields are only updated if they're saved
+            self.save(update_fields=changed_fields + [field.name for field in self._meta.concrete_fields if getattr(field, 'auto_now', False) and field.name not in changed_fields])
+
+        return True
+
+    def update_atomically(self, changes, **lookups):
+        """
+        Writes changes to the instance's row with a single UPDATE query, which only goes ahead
+        if the row matches the lookups given. The version of versioned instances is incremented,
+        and the fields changed by F() expressions are read back onto the instance.
+
+        :param changes: Field values or F() expressions keyed by field name
+        :param lookups: Lookups the row must match
+        :return: None, or raises a ConcurrentUpdate if the row didn't match
+        """
+        cls = type(self)
+        changes = dict(changes)
+
+        # update() doesn't set auto_now fields
+        for field in self._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) and field.name not in changes:
+                changes[field.name] = field.pre_save(self, False)
+
+        if self.version_field is not None:
+            changes[self.version_field] = F(self.version_field) + 1
+
+        objects = cls._default_manager.using(router.db_for_write(cls, instance=self)).filter(pk=self.pk)
+
+        if not objects.filter(**lookups).update(**changes):
+            raise ConcurrentUpdate("{} {} has changed since it was loaded".format(cls.__name__, self.pk))
+
+        expressions = [name for name, value in changes.items() if isinstance(value, ExpressionNode)]
+        if expressions:
+            values = objects.values_list(*expressions).get()
+            for name, value in zip(expressions, values):
+                setattr(self, self._meta.get_field(name).attname, value)
+
+        for name, value in changes.items():
+            if name not in expressions:
+                setattr(self, self._meta.get_field(name).attname, value)
+
+        self.snapshot_fields(changes.keys())
+
+        # update() doesn't send post_save signals
+        bump_model_version(cls)
+        cls.forget_cached_instances([self.pk])
+
     def dictify(self, fields_to_include, ommit_related_fields):
         """
         Initiates the dictification process on the model instance using the fields passed in.
         Goes through each auth level up to the current user's auth level
-        and calls dictify_helper with the fields corresponding to that level.
-
-        Concatenates the result dictionaries together and returns.
+        and collects the fields corresponding to that level.
 
         :param fields_to_include: Either the long or short description fields
         :param ommit_related_fields: Boolean denoting whether or not to dictify the related model fields.
         :return: A dictionary representation of the current instance.
         """
-        dictified_fields = {}
-
-        # always include public fields
-        dictified_fields.update(self.dictify_helper(self.public_fields, fields_to_include, ommit_related_fields))
-
-        # conditionally include registered user/owner fields
-        if self._user_auth >= UserAuthCode.REGISTERED_USER:
-            dictified_fields.update(self.dictify_helper(self.registered_user_fields, fields_to_include, ommit_related_fields))
-
-            if self._user_auth == UserAuthCode.OWNER:
-                dictified_fields.update(self.dictify_helper(self.owner_only_fields, fields_to_include, ommit_related_fields))
-
-        return dictified_fields
+        plan = self.compile_serialization_plan(self.get_auth_level_fields(self._user_auth), fields_to_include, ommit_related_fields)
+        return self.dictify_from_plan(plan)
 
     def dictify_helper(self, auth_level_fields, fields_to_include, ommit_related_fields):
         """
-        Performs the actual dictification.
+        Performs the dictification of a single authentication level.
         Decides whether or not, based on the authentication level, whether the field should be
         added to the object dictionary.
         If the attribute begins with a reserved prefix (indicating a related model),
@@ -107,201 +392,1447 @@ class APIModel(models.Model):
         :param auth_level_fields: Object fields to include for a given authentication level
         :param fields_to_include: Either short description or long description fields
         :param ommit_related_fields: Boolean to denote wehther or not to dictify related models
-        :return:
+        :return: A dictionary representation of the fields for the authentication level
+        """
+        plan = self.compile_serialization_plan(auth_level_fields, fields_to_include, ommit_related_fields)
+        return self.dictify_from_plan(plan)
+
+    def dictify_from_plan(self, plan):
         """
+        Walks a compiled serialization plan and reads each attribute from the instance.
+
+        Related models are dictified according to their reserved prefix:
+        SHORT prefixes force a short dictification and LONG prefixes a full one.
+        REL/M2M fields denote a one/many to many relationship and are dictified into a list.
+        Relations which haven't been expanded are given as bare primary keys instead.
 
-        # dictionary representation of the object
+        :param plan: A serialization plan, as produced by compile_serialization_plan()
+        :return: A dictionary representation of the current instance
+        """
         dictified_fields = {}
+        related_user_auths = self._related_user_auths or {}
+        expanded_fields = self._expanded_fields
 
-        # go through each field and add it to the dictionary
-        # if it's in list of fields for the authentication level
-        for field in fields_to_include:
-            if field in auth_level_fields:
-                # extract the reserved prefix
-                prefix = filter(lambda prefix: field.startswith(prefix), self._reserved_prefixes)
-
-                # if the field doesn't begin with a reserved prefix
-                # get the regular attribute/property
-                if not prefix:
-                    dictified_fields[field] = getattr(self, field, None)
-
-                # do something special with the related model field
-                # if we're allowed to dictify related models
-                elif prefix and not ommit_related_fields:
-                    # separate the prefix and actual related field name
-                    prefix = prefix[0]
-                    relation = field[len(prefix) + 1:]
-
-                    # try and get the related model
-                    val = getattr(self, relation, None)
-
-                    # ommit the field if we can't find the related model
-                    if val is None:
-                      dictified_fields[relation] = None
-
-                    # Perform a different dictification depending on what reserved prefix is used
-                    # foreign models denoted by the related SHORT prefixes will be dictified short
-                    # and similarly, related LONG will force a full dictification
-                    # REL fields denote a one to many relationship. Thus, the corresponding models will be
-                    # dictified into a list
-                    elif prefix in [ReservedPrefix.FK_SHORT, ReservedPrefix.ONE_TO_ONE_SHORT]:
-                        dictified_fields[relation] = val.dictify_with_auth(self._curr_user, ommit_related_fields=True)
-                    elif prefix in [ReservedPrefix.FK_LONG, ReservedPrefix.ONE_TO_ONE_LONG]:
-                        dictified_fields[relation] = val.dictify_with_auth(self._curr_user, short_dict=False, ommit_related_fields=True)
-                    elif prefix in [ReservedPrefix.REL_SHORT, ReservedPrefix.MANY_TO_MANY_SHORT]:
-                        dictified_fields[relation] = [rel.dictify_with_auth(self._curr_user, ommit_related_fields=True) for rel in val.all()]
-                    elif prefix in [ReservedPrefix.REL_LONG, ReservedPrefix.MANY_TO_MANY_LONG]:
-                        dictified_fields[relation] = [rel.dictify_with_auth(self._curr_user, short_dict=False, ommit_related_fields=True) for rel in val.all()]
+        for name, is_related, is_many, is_short in plan:
+            # regular attribute/property
+            if not is_related:
+                dictified_fields[name] = getattr(self, name, None)
+                continue
+
+            if expanded_fields is not None and name not in expanded_fields:
+                dictified_fields[name] = self.get_related_pks(name, is_many)
+                continue
+
+            # try and get the related model
+            val = getattr(self, name, None)
+
+            if val is None:
+                dictified_fields[name] = None
+            elif is_many:
+                dictified_fields[name] = val.model.dictify_many(val.all(), self._curr_user, short_dict=is_short, ommit_related_fields=True, user_auths=related_user_auths.get(name))
+            else:
+                dictified_fields[name] = val.dictify_with_auth(self._curr_user, short_dict=is_short, ommit_related_fields=True, user_auth=related_user_auths.get(name, {}).get(val.pk))
 
         return dictified_fields
 
-    def dictify_short(self, ommit_related_fields):
+    def get_related_pks(self, name, is_many):
         """
-        Dictifies only short description fields.
+        Gets the primary key(s) of a relation without dictifying the related models.
+        FK/ONE_TO_ONE fields are read straight from their column, without loading the related model.
 
-        :param ommit_related_fields: Boolean to determine whether to dictify related models
-        :return: A short dictionary description of the model instance
+        :param name: The name of the relation
+        :param is_many: Whether the relation holds a list of related models
+        :return: A primary key, a list of primary keys, or None
         """
-        return self.dictify(self.short_description_fields, ommit_related_fields)
+        column = self.get_relation_column(name)
 
-    def dictify_long(self, ommit_related_fields):
+        if column is not None:
+            return getattr(self, column)
+
+        val = getattr(self, name, None)
+
+        if val is None:
+            return None
+        elif is_many:
+            return [rel.pk for rel in val.all() if getattr(rel, 'active', True)]
+
+        return val.pk if getattr(val, 'active', True) else None
+
+    @classmethod
+    def get_auth_level_fields(cls, user_auth):
         """
-        Dictifies both short and long description fields.
+        Gets all the fields readable at a given authentication level.
 
-        :param ommit_related_fields: Boolean to determine whether to dictify related models
-        :return: A full dictionary description of the model instance
+        :param user_auth: A UserAuthCode
+        :return: A tuple of the fields readable at (and below) the authentication level
         """
-        return self.dictify(self.short_description_fields + self.long_description_fields, ommit_related_fields)
+        fields = tuple(cls.public_fields)
+
+        if user_auth >= UserAuthCode.REGISTERED_USER:
+            fields += tuple(cls.registered_user_fields)
 
-    def dictify_with_auth(self, user, short_dict=True, ommit_related_fields=False):
+            if user_auth == UserAuthCode.OWNER:
+                fields += tuple(cls.owner_only_fields)
+
+        return fields
+
+    @classmethod
+    def parse_field(cls, field):
         """
-        Sets the authentication level on the model instance
-        before dictifying.
+        Splits a description field into its attribute name and relationship type.
 
-        :param user: The request user
-        :param short_dict: By default, only creates a short dictification.
-        :param ommit_related_fields: By default allows dictifying of related models.
-        :return: A dictionary representation of the model instance
+        :param field: A field from the description fields, possibly beginning with a reserved prefix
+        :return: A tuple of (attribute name, is related, is a list of related models, is short dictified)
         """
+        for prefix in cls._reserved_prefixes:
+            if field.startswith(prefix):
+                return (
+                    field[len(prefix) + 1:],
+                    True,
+                    prefix in ReservedPrefix.MANY,
+                    prefix in ReservedPrefix.SHORT
+                )
 
-        # If the instance has been deactivated, the API will treat the resource as if it doesn't exist
-        if not self.active:
-            return None
+        return (field, False, False, False)
 
-        self.set_user_auth(user)
+    @classmethod
+    def compile_serialization_plan(cls, auth_level_fields, fields_to_include, ommit_related_fields):
+        """
+        Resolves reserved prefixes, relation names and authentication level membership
+        of the fields to include into a flat serialization plan.
 
-        return self.dictify_short(ommit_related_fields) if short_dict else self.dictify_long(ommit_related_fields)
+        :param auth_level_fields: Object fields readable at the authentication level
+        :param fields_to_include: Either short description or long description fields
+        :param ommit_related_fields: Boolean to denote whether or not to leave out related models
+        :return: A tuple of parsed fields (see parse_field()) in the order they should be dictified
+        """
+        auth_level_fields = set(auth_level_fields)
+        seen = set()
+        plan = []
+
+        for field in fields_to_include:
+            if field not in auth_level_fields or field in seen:
+                continue
+            seen.add(field)
+
+            parsed_field = cls.parse_field(field)
+
+            if parsed_field[1] and ommit_related_fields:
+                continue
+
+            plan.append(parsed_field)
+
+        return tuple(plan)
 
     @classmethod
-    def get_all(cls, page_number, user):
+    def get_serialization_plan(cls, short_dict, user_auth, ommit_related_fields, fields=None):
         """
-        Dictifies endpoint model instances for the given page number.
-        Returns up to the number of instances specified by the pagination variable.
-        Dictifies the instances with dictify_with_auth which takes into consideration
-        the user being passed in.
+        Gets the serialization plan for a (short/long, auth level, related fields) combination.
+        Plans are compiled once per model class and cached on the class.
 
-        :param page_number: The page number given to the paginator
-        :param user: The request user
-        :return: A list of short dictified model instances
+        :param short_dict: Whether the plan is for a short or a long dictification
+        :param user_auth: The UserAuthCode of the requesting user
+        :param ommit_related_fields: Whether or not related models are left out
+        :param fields: The names of the fields requested by the client, or None for all the fields.
+        Requested fields the user isn't allowed to read are left out.
+        :return: A serialization plan, as produced by compile_serialization_plan()
         """
-        objects = cls.objects.filter(active=1)
-        p = Paginator(objects, cls.pagination)
-        return [object.dictify_with_auth(user) for object in p.page(page_number).object_list]
+        plans = cls.get_class_cache('_serialization_plans')
+        key = (short_dict, user_auth, ommit_related_fields)
+        plan = plans.get(key)
+
+        if plan is None:
+            fields_to_include = cls.short_description_fields if short_dict else cls.short_description_fields + cls.long_description_fields
+            plan = cls.compile_serialization_plan(cls.get_auth_level_fields(user_auth), fields_to_include, ommit_related_fields)
+            plans[key] = plan
+
+        # requested fields aren't cached, as clients can request any combination of them
+        if fields is not None:
+            plan = tuple(field for field in plan if field[0] in fields)
+
+        return plan
 
     @classmethod
-    def get_model_instance(cls, rest_param):
+    def get_class_cache(cls, name):
         """
-        Provides a default implementation for getting an endpoint instance by its ID.
+        Gets a dictionary used to cache per model class computations.
 
-        :param rest_param: The endpoint instance criteria which has been passed in via the format:
-        /<endpoint>/<endpoint_instance>/
-        :return: The endpoint instance, or raises an ObjectDoesNotExist exception
+        :param name: The name of the cache
+        :return: The cache dictionary belonging to the model class
         """
-        return cls.objects.get(id=rest_param)
+        # look in the class' own __dict__, so that subclasses don't share their parent's caches
+        cache = cls.__dict__.get(name)
+        if cache is None:
+            cache = {}
+            setattr(cls, name, cache)
 
-    @abstractmethod
-    def is_owner(self, request_user):
+        return cache
+
+    @classmethod
+    def get_relation(cls, name):
         """
-        This method has been left intentionally abstract to allow custom ownership of models.
-        For example, a particular model may be owned by multiple users, or by a specific group of users.
+        Looks up a relation of the model by its attribute name.
 
-        :param request_user: reference to request.user
-        :return: True if the user has owner rights on the model
+        :param name: The name of the forward or reverse relation
+        :return: A tuple of (related model, whether the relation is single valued),
+        or None if the attribute isn't a relation
         """
-        raise NotImplementedError
+        try:
+            field, model, direct, m2m = cls._meta.get_field_by_name(name)
+        except FieldDoesNotExist:
+            return None
+
+        # forward ForeignKey/OneToOneField/ManyToManyField
+        if direct:
+            return (field.rel.to, not m2m) if field.rel else None
+
+        # reverse relations only hold a single model for OneToOneFields
+        return field.model, not m2m and field.field.unique
 
-    def set_user_auth(self, user):
+    @classmethod
+    def get_relation_column(cls, name):
         """
-        The default permission level set on all models is Public.
-        This method takes in a user object and raises the permission
-        level accordingly.
+        Gets the column holding the primary key of a forward ForeignKey/OneToOneField,
+        so that the primary key can be read without loading the related model.
 
-        :param user: The request user object
-        :return: None
+        :param name: The name of the relation
+        :return: The attribute name of the column (e.g. 'owner_id'), or None if the relation
+        isn't a forward ForeignKey/OneToOneField
+        """
+        columns = cls.get_class_cache('_relation_columns')
+
+        if name not in columns:
+            try:
+                field, model, direct, m2m = cls._meta.get_field_by_name(name)
+            except FieldDoesNotExist:
+                field = None
+                direct = m2m = False
+
+            columns[name] = field.attname if direct and not m2m and field.rel else None
+
+        return columns[name]
+
+    @classmethod
+    def get_field_column(cls, name):
+        """
+        Gets the column of a plain (non relation) field of the model.
+
+        :param name: The name of a description field
+        :return: The attribute name of the column, or None if the field is
+        a property or a relation
+        """
+        columns = cls.get_class_cache('_field_columns')
+
+        if name not in columns:
+            try:
+                field = cls._meta.get_field(name)
+            except FieldDoesNotExist:
+                field = None
+
+            columns[name] = field.attname if field is not None and not field.rel else None
+
+        return columns[name]
+
+    @classmethod
+    def get_column_plan(cls, short_dict, user, fields=None, expand=None):
+        """
+        Works out whether dictifying instances for the user only reads the model's own columns
+        (plain fields, and FK/ONE_TO_ONE primary keys which aren't expanded), in which case
+        the instances can be dictified straight from values_list() rows without being instantiated.
+
+        This is only possible if the user would read the same fields whether or not they own an instance.
+
+        :param short_dict: Whether the instances will be short or long dictified
+        :param user: The request user
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: A tuple of (field name, column) pairs, or None if instances have to be instantiated
         """
-        self._curr_user = user
         if user.is_authenticated():
-            self._user_auth = UserAuthCode.REGISTERED_USER
+            plan = cls.get_serialization_plan(short_dict, UserAuthCode.OWNER, False, fields)
+            if plan != cls.get_serialization_plan(short_dict, UserAuthCode.REGISTERED_USER, False, fields):
+                return None
+        else:
+            plan = cls.get_serialization_plan(short_dict, UserAuthCode.PUBLIC, False, fields)
 
-            if self.is_owner(user):
-                self._user_auth = UserAuthCode.OWNER
+        columns = []
+
+        for name, is_related, is_many, is_short in plan:
+            if not is_related:
+                column = cls.get_field_column(name)
+            elif expand is not None and name not in expand:
+                column = cls.get_relation_column(name)
+            else:
+                column = None
+
+            if column is None:
+                return None
+
+            columns.append((name, column))
+
+        return tuple(columns)
 
     @classmethod
-    def api_create(cls, request):
+    def get_related_key_fields(cls, name):
         """
-        Allows a model instance to be created via the API.
+        Gets the fields of a related model which have to be read to list the primary keys
+        of a REL/M2M relation.
 
-        By default the model is set to read only (the method returns None,
-        which at an APIView level is exposed as a 404 error).
+        :param name: The name of the relation
+        :return: A tuple of field names of the related model
+        """
+        field, model, direct, m2m = cls._meta.get_field_by_name(name)
+        related_model = cls.get_relation(name)[0]
+        key_fields = (related_model._meta.pk.name, 'active')
 
-        Any model wishing to allow creation should override this method,
-        making use of the request parameter.
+        # reverse ForeignKeys are matched up with the instances by the related model's ForeignKey
+        if not direct and not m2m:
+            key_fields += (field.field.name,)
 
-        :param request: The request object
-        :return: The newly created object (or None if one wasn't created).
+        return key_fields
+
+    @classmethod
+    def get_related_lookups(cls, short_dict, user_auth, fields=None, expand=None):
         """
-        return None
+        Works out which related models a dictification will read, so that they can be
+        fetched in bulk rather than once per instance.
 
-    def api_update(self, request):
+        FK/ONE_TO_ONE prefixed fields are joined with select_related(), whilst
+        REL/M2M prefixed fields are fetched with prefetch_related().
+        Lookups are computed once per model class and cached on the class.
+
+        :param short_dict: Whether the lookups are for a short or a long dictification
+        :param user_auth: The highest UserAuthCode the requesting user could have
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them.
+        FK/ONE_TO_ONE relations which aren't expanded aren't joined, as their primary keys are read from their column
+        :return: A tuple of (select_related names, prefetch_related (name, related model) pairs)
         """
-        Allows a model instance to be updated via the API.
+        if fields is not None or expand is not None:
+            select_related, prefetch_related = cls.get_related_lookups(short_dict, user_auth)
+            return (
+                tuple(
+                    name for name in select_related
+                    if (fields is None or name in fields) and (expand is None or name in expand or cls.get_relation_column(name) is None)
+                ),
+                tuple((name, related_model) for name, related_model in prefetch_related if fields is None or name in fields)
+            )
 
-        By default, it handles the process of deactivating a model instance,
-        by looking out for the 'deactivate' parameter in the request.
+        lookups = cls.get_class_cache('_related_lookups')
+        key = (short_dict, user_auth)
 
-        It also handles the save of any updates and returning the updated model.
+        if key not in lookups:
+            select_related = []
+            prefetch_related = []
 
-        If this method is overwritten by a subclass, the subclass should call
-        super api_update() at the END of the overwriting method to make use of this logic.
+            for name, is_related, is_many, is_short in cls.get_serialization_plan(short_dict, user_auth, False):
+                relation = cls.get_relation(name) if is_related else None
 
-        Alternatively, subclasses can fully overwrite the method as they please.
+                if relation is None:
+                    continue
 
-        :param request: The request object
-        :return: Updated instance of the model instance
+                related_model, single_valued = relation
+
+                if single_valued and not is_many:
+                    select_related.append(name)
+                elif not single_valued and is_many:
+                    prefetch_related.append((name, related_model))
+
+            lookups[key] = (tuple(select_related), tuple(prefetch_related))
+
+        return lookups[key]
+
+    @classmethod
+    def get_deferrable_fields(cls, short_dict, user_auth, fields=None):
         """
-        if self.is_owner(request.user) and request.POST.get('deactivate'):
-            self.active = 0
-            self.date_deactivated = datetime.now()
+        Works out which columns a dictification won't read, so that they can be left out of
+        queries with defer() rather than being transferred and thrown away.
 
-        self.save()
+        Only the columns of plain description fields are deferred. Primary keys, relations,
+        the active flag and columns which aren't description fields are always read,
+        as they are used outside of dictification (e.g. by is_owner()).
 
-        return self if self.active else None
+        :param short_dict: Whether the dictification is short or long
+        :param user_auth: The highest UserAuthCode the requesting user could have
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :return: A tuple of field names
+        """
+        if not cls.defer_unused_fields:
+            return ()
+
+        read = set(field[0] for field in cls.get_serialization_plan(short_dict, user_auth, False, fields))
+        deferred = []
+
+        for name, is_related, is_many, is_short in cls.compile_serialization_plan(cls.get_auth_level_fields(UserAuthCode.OWNER), cls.short_description_fields + cls.long_description_fields, True):
+            if name in read or name == 'active':
+                continue
+
+            try:
+                field = cls._meta.get_field(name)
+            except FieldDoesNotExist:
+                # properties
+                continue
+
+            if not field.rel and not field.primary_key:
+                deferred.append(name)
+
+        return tuple(deferred)
 
     @classmethod
-    def api_custom_request(cls, request):
+    def get_dependent_models(cls):
         """
-        Any "custom request" sent to the API for an endpoint will be
-        forwarded to this method. Any model overriding this method
-        will have access to the whole request so that it determine how to
-        serve the custom request.
+        Gets the models whose instances can appear in a dictification of this model:
+        the model itself and the related models of its REL/FK/ONE_TO_ONE/M2M fields.
 
-        The method defaults to returning False, which at an API level
-        translates to the endpoint not supporting custom requests by default.
+        :return: A tuple of model classes
+        """
+        dependent_models = cls.get_class_cache('_dependent_models')
 
-        :param request: The request object
-        :return: Default to False, which propagates up as a 404 error.s
+        if 'models' not in dependent_models:
+            models = [cls]
+
+            for short_dict in (True, False):
+                for name, is_related, is_many, is_short in cls.get_serialization_plan(short_dict, UserAuthCode.OWNER, False):
+                    relation = cls.get_relation(name) if is_related else None
+
+                    if relation is not None and relation[0] not in models:
+                        models.append(relation[0])
+
+            dependent_models['models'] = tuple(models)
+
+        return dependent_models['models']
+
+    @classmethod
+    def is_owner_dependent(cls, short_dict):
+        """
+        Works out whether a dictification for a registered user can vary depending on which
+        instances (or related models) the user owns.
+
+        :param short_dict: Whether the dictification is short or long
+        :return: True if owners could be shown more fields than other registered users
+        """
+        if cls.get_serialization_plan(short_dict, UserAuthCode.REGISTERED_USER, False) != cls.get_serialization_plan(short_dict, UserAuthCode.OWNER, False):
+            return True
+
+        for name, is_related, is_many, is_short in cls.get_serialization_plan(short_dict, UserAuthCode.OWNER, False):
+            relation = cls.get_relation(name) if is_related else None
+
+            if relation is not None and issubclass(relation[0], APIModel):
+                related_model = relation[0]
+                if related_model.get_serialization_plan(is_short, UserAuthCode.REGISTERED_USER, True) != related_model.get_serialization_plan(is_short, UserAuthCode.OWNER, True):
+                    return True
+
+        return False
+
+    @classmethod
+    def get_cache_tier(cls, user, short_dict):
+        """
+        Gets a label for the fields a user can see in a dictification, so that
+        cached dictifications are only shared between users who would see the same fields.
+
+        :param user: The request user
+        :param short_dict: Whether the dictification is short or long
+        :return: 'public', 'registered', or a label unique to the user if the dictification
+        depends on what the user owns
+        """
+        if not user.is_authenticated():
+            return 'public'
+
+        if cls.is_owner_dependent(short_dict):
+            return 'user:{}'.format(user.pk)
+
+        return 'registered'
+
+    @classmethod
+    def get_max_user_auth(cls, user):
+        """
+        Gets the highest authentication level a user could have on any instance of the model.
+
+        :param user: The request user (or None)
+        :return: A UserAuthCode
+        """
+        if user is not None and user.is_authenticated():
+            return UserAuthCode.OWNER
+
+        return UserAuthCode.PUBLIC
+
+    @classmethod
+    def get_prefetch_lookups(cls, user, short_dict=True, fields=None, expand=None):
+        """
+        Gets the prefetch_related() lookups for the REL/M2M fields read when dictifying for the given user.
+        Deactivated related models are filtered out of the lookups.
+        Only the primary keys of relations which aren't expanded are read.
+
+        :param user: The request user (or None)
+        :param short_dict: Whether the instances will be short or long dictified
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: A list of Prefetch objects/lookup names
+        """
+        select_related, prefetch_related = cls.get_related_lookups(short_dict, cls.get_max_user_auth(user), fields, expand)
+        prefetch_lookups = []
+
+        for name, related_model in prefetch_related:
+            if not issubclass(related_model, APIModel):
+                prefetch_lookups.append(name)
+            elif expand is not None and name not in expand:
+                prefetch_lookups.append(Prefetch(name, queryset=related_model.objects.filter(active=1).only(*cls.get_related_key_fields(name))))
+            else:
+                prefetch_lookups.append(Prefetch(name, queryset=related_model.annotate_ownership(related_model.objects.filter(active=1), user)))
+
+        return prefetch_lookups
+
+    @classmethod
+    def optimise_queryset(cls, queryset, user, short_dict=True, prefetch=True, fields=None, defer=True, expand=None):
+        """
+        Applies select_related() and prefetch_related() to a queryset, so that dictifying
+        its instances for the given user takes a constant number of queries.
+        Deactivated related models are filtered out of prefetched relations.
+        Columns which won't be dictified are deferred (see get_deferrable_fields()).
+        The instances (and prefetched related models) are annotated with the user's
+        ownership if the model implements owner_q().
+
+        :param queryset: A queryset of the model
+        :param user: The request user (or None)
+        :param short_dict: Whether the instances will be short or long dictified
+        :param prefetch: Whether to apply prefetch_related(). Querysets which will be read
+        with iterator() should prefetch separately (see dictify_iterator())
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param defer: Whether to defer the columns which won't be dictified
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: The optimised queryset
+        """
+        max_user_auth = cls.get_max_user_auth(user)
+        select_related, prefetch_related = cls.get_related_lookups(short_dict, max_user_auth, fields, expand)
+
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+
+        if prefetch_related and prefetch:
+            queryset = queryset.prefetch_related(*cls.get_prefetch_lookups(user, short_dict, fields, expand))
+
+        deferred_fields = cls.get_deferrable_fields(short_dict, max_user_auth, fields) if defer else ()
+
+        if deferred_fields:
+            queryset = queryset.defer(*deferred_fields)
+
+        return cls.annotate_ownership(queryset, user)
+
+    @classmethod
+    def annotate_ownership(cls, queryset, user):
+        """
+        Annotates each instance of a queryset with whether or not the user owns it,
+        so that ownership is worked out by the database rather than by is_owner().
+        The annotation is read by set_user_auth() in place of calling is_owner().
+
+        Querysets are left untouched for the public, or if the model doesn't implement owner_q().
+
+        :param queryset: A queryset of the model
+        :param user: The request user (or None)
+        :return: The annotated queryset
+        """
+        if user is None or not user.is_authenticated():
+            return queryset
+
+        owner_q = cls.owner_q(user)
+
+        if owner_q is None:
+            return queryset
+
+        owned = cls._default_manager.filter(owner_q).values('pk').query
+        owned_sql, owned_params = owned.get_compiler(queryset.db).as_sql()
+        quote_name = connections[queryset.db].ops.quote_name
+
+        is_owner_sql = '{}.{} IN ({})'.format(quote_name(cls._meta.db_table), quote_name(cls._meta.pk.column), owned_sql)
+
+        return queryset.extra(select={'_is_owner': is_owner_sql}, select_params=owned_params)
+
+    def dictify_short(self, ommit_related_fields):
+        """
+        Dictifies only short description fields.
+
+        :param ommit_related_fields: Boolean to determine whether to dictify related models
+        :return: A short dictionary description of the model instance
+        """
+        return self.dictify_from_plan(self.get_serialization_plan(True, self._user_auth, ommit_related_fields, self._requested_fields))
+
+    def dictify_long(self, ommit_related_fields):
+        """
+        Dictifies both short and long description fields.
+
+        :param ommit_related_fields: Boolean to determine whether to dictify related models
+        :return: A full dictionary description of the model instance
+        """
+        return self.dictify_from_plan(self.get_serialization_plan(False, self._user_auth, ommit_related_fields, self._requested_fields))
+
+    def dictify_with_auth(self, user, short_dict=True, ommit_related_fields=False, user_auth=None, related_user_auths=None, fields=None, expand=None):
+        """
+        Sets the authentication level on the model instance
+        before dictifying.
+
+        :param user: The request user
+        :param short_dict: By default, only creates a short dictification.
+        :param ommit_related_fields: By default allows dictifying of related models.
+        :param user_auth: The UserAuthCode of the user, if it has already been resolved
+        :param related_user_auths: The UserAuthCodes of the user on related models, if they have
+        already been resolved (see resolve_related_user_auths())
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them.
+        Other relations are given as bare primary keys (see get_relation_column())
+        :return: A dictionary representation of the model instance
+        """
+
+        # If the instance has been deactivated, the API will treat the resource as if it doesn't exist
+        if not self.active:
+            return None
+
+        self.set_user_auth(user, user_auth)
+        self._related_user_auths = related_user_auths
+        self._requested_fields = fields
+        self._expanded_fields = expand
+
+        return self.dictify_short(ommit_related_fields) if short_dict else self.dictify_long(ommit_related_fields)
+
+    @classmethod
+    def dictify_many(cls, objects, user, short_dict=True, ommit_related_fields=False, user_auths=None, fields=None, expand=None):
+        """
+        Dictifies a list of model instances, resolving the authentication level of the user
+        on all of the instances (and their related models) in bulk rather than once per instance.
+        Deactivated instances are left out.
+
+        :param objects: An iterable of model instances
+        :param user: The request user
+        :param short_dict: By default, only creates short dictifications.
+        :param ommit_related_fields: By default allows dictifying of related models.
+        :param user_auths: The UserAuthCodes of the user on the instances, if they have already
+        been resolved (see resolve_user_auths())
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them.
+        Other relations are given as bare primary keys (see get_relation_column())
+        :return: A list of dictified model instances
+        """
+        objects = [object for object in objects if object.active]
+
+        # the instances have been read (and their related models prefetched) by now
+        with phase('dictify'):
+            if user_auths is None:
+                user_auths = cls.resolve_user_auths(user, objects)
+
+            related_user_auths = None if ommit_related_fields else cls.resolve_related_user_auths(user, objects, user_auths, short_dict, fields, expand)
+
+            return [
+                object.dictify_with_auth(user, short_dict, ommit_related_fields, user_auth=user_auths.get(object.pk), related_user_auths=related_user_auths, fields=fields, expand=expand)
+                for object in objects
+            ]
+
+    @classmethod
+    def resolve_user_auths(cls, user, objects):
+        """
+        Resolves the authentication level of a user on many instances at once.
+        Ownership is read from the instances' annotations if they have been annotated
+        (see annotate_ownership()), or resolved with owned_ids() if the model implements it.
+        Otherwise is_owner() is called on each instance.
+
+        :param user: The request user
+        :param objects: A list of model instances
+        :return: A dictionary mapping each instance's primary key to a UserAuthCode
+        """
+        if not user.is_authenticated():
+            return dict((object.pk, UserAuthCode.PUBLIC) for object in objects)
+
+        if all(getattr(object, '_is_owner', None) is not None for object in objects):
+            owned_ids = [object.pk for object in objects if object._is_owner]
+        else:
+            owned_ids = cls.owned_ids(user, objects)
+
+        if owned_ids is None:
+            return dict((object.pk, UserAuthCode.OWNER if object.is_owner(user) else UserAuthCode.REGISTERED_USER) for object in objects)
+
+        owned_ids = set(owned_ids)
+        return dict((object.pk, UserAuthCode.OWNER if object.pk in owned_ids else UserAuthCode.REGISTERED_USER) for object in objects)
+
+    @classmethod
+    def resolve_related_user_auths(cls, user, objects, user_auths, short_dict, fields=None, expand=None):
+        """
+        Resolves the authentication level of a user on the related models which will
+        be dictified alongside a list of instances, with one resolution per relation.
+
+        Related models should have been fetched in bulk beforehand (see optimise_queryset()),
+        as they are read from each instance.
+
+        :param user: The request user
+        :param objects: A list of (active) model instances
+        :param user_auths: The UserAuthCodes of the user on the instances
+        :param short_dict: Whether the instances will be short or long dictified
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: A dictionary mapping each relation name to the resolved UserAuthCodes
+        of its related models (see resolve_user_auths())
+        """
+        related_user_auths = {}
+
+        if not objects:
+            return related_user_auths
+
+        plan = cls.get_serialization_plan(short_dict, max(user_auths.values()), False, fields)
+
+        for name, is_related, is_many, is_short in plan:
+            if not is_related or (expand is not None and name not in expand):
+                continue
+
+            related_model = None
+            related_objects = []
+
+            for object in objects:
+                val = getattr(object, name, None)
+
+                if val is None:
+                    continue
+                elif is_many:
+                    related_model = val.model
+                    related_objects.extend(rel for rel in val.all() if rel.active)
+                elif val.active:
+                    related_model = type(val)
+                    related_objects.append(val)
+
+            if related_objects:
+                related_user_auths[name] = related_model.resolve_user_auths(user, related_objects)
+
+        return related_user_auths
+
+    @classmethod
+    def get_all(cls, page_number, user, fields=None, expand=None):
+        """
+        Dictifies endpoint model instances for the given page number.
+        Returns up to the number of instances specified by the pagination variable.
+        Dictifies the instances with dictify_with_auth which takes into consideration
+        the user being passed in.
+
+        Related models read during dictification are fetched in bulk,
+        and columns which won't be dictified aren't read at all.
+        Pages which only read the model's own columns are dictified straight from
+        values_list() rows, without instantiating the instances (see get_column_plan()).
+
+        :param page_number: The page number given to the paginator
+        :param user: The request user
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: A list of short dictified model instances
+        """
+        columns = cls.get_column_plan(True, user, fields, expand)
+
+        if columns is not None:
+            names = [name for name, column in columns]
+            objects = cls.objects.filter(active=1).values_list(*[column for name, column in columns])
+            p = Paginator(objects, cls.pagination)
+            return [dict(zip(names, row)) for row in p.page(page_number).object_list]
+
+        objects = cls.optimise_queryset(cls.objects.filter(active=1), user, fields=fields, expand=expand)
+        p = Paginator(objects, cls.pagination)
+        return cls.dictify_many(p.page(page_number).object_list, user, fields=fields, expand=expand)
+
+    @classmethod
+    def iter_all(cls, page_number, user, fields=None, expand=None):
+        """
+        Lazy counterpart to get_all(), which dictifies the instances of the page as
+        they are read from the database rather than all at once.
+
+        The page number is validated straight away, so that invalid pages
+        raise an exception before any of the instances are read.
+
+        :param page_number: The page number given to the paginator
+        :param user: The request user
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: An iterator of short dictified model instances
+        """
+        objects = cls.optimise_queryset(cls.objects.filter(active=1), user, prefetch=False, fields=fields, expand=expand)
+        p = Paginator(objects, cls.pagination)
+        return cls.dictify_iterator(p.page(page_number).object_list, user, fields=fields, expand=expand)
+
+    @classmethod
+    def dictify_iterator(cls, queryset, user, short_dict=True, fields=None, expand=None):
+        """
+        Dictifies the instances of a queryset as they are read with iterator(),
+        so that only iterator_chunk_size instances are held in memory at a time.
+        Related models are prefetched, and authentication levels resolved, once per chunk.
+
+        :param queryset: A queryset of the model, without prefetch_related() lookups
+        :param user: The request user
+        :param short_dict: By default, only creates short dictifications.
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: A generator of dictified model instances
+        """
+        objects = queryset.iterator()
+        chunks = iter(lambda: list(islice(objects, cls.iterator_chunk_size)), [])
+
+        return cls.dictify_chunks(chunks, user, short_dict, fields, expand)
+
+    @classmethod
+    def dictify_chunks(cls, chunks, user, short_dict=True, fields=None, expand=None):
+        """
+        Dictifies chunks of model instances one chunk at a time.
+        Related models are prefetched, and authentication levels resolved, once per chunk.
+
+        :param chunks: An iterable of lists of model instances
+        :param user: The request user
+        :param short_dict: By default, only creates short dictifications.
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: A generator of dictified model instances
+        """
+        prefetch_lookups = cls.get_prefetch_lookups(user, short_dict, fields, expand)
+
+        for chunk in chunks:
+            if prefetch_lookups:
+                prefetch_related_objects(chunk, prefetch_lookups)
+
+            for dictified_object in cls.dictify_many(chunk, user, short_dict=short_dict, fields=fields, expand=expand):
+                yield dictified_object
+
+    @classmethod
+    def export_all(cls, user):
+        """
+        Long dictifies every active instance of the model, for exporting a whole endpoint.
+
+        Instances are read in chunks of iterator_chunk_size ordered by primary key, each chunk
+        being a separate query which carries on from the last primary key of the previous chunk.
+        This keeps memory use bounded regardless of the size of the table, and avoids
+        both counting the instances and skipping over rows with OFFSET.
+
+        :param user: The request user
+        :return: A generator of long dictified model instances
+        """
+        objects = cls.optimise_queryset(cls.objects.filter(active=1), user, short_dict=False, prefetch=False)
+        return cls.dictify_chunks(cls.iter_chunks(objects), user, short_dict=False)
+
+    @classmethod
+    def iter_chunks(cls, queryset):
+        """
+        Reads a queryset in chunks of iterator_chunk_size instances, ordered by primary key.
+
+        :param queryset: A queryset of the model
+        :return: A generator of lists of model instances
+        """
+        queryset = queryset.order_by('pk')
+        chunk = list(queryset[:cls.iterator_chunk_size])
+
+        while chunk:
+            yield chunk
+
+            if len(chunk) < cls.iterator_chunk_size:
+                break
+
+            chunk = list(queryset.filter(pk__gt=chunk[-1].pk)[:cls.iterator_chunk_size])
+
+    @classmethod
+    def get_many(cls, ids, user, fields=None, expand=None):
+        """
+        Long dictifies the endpoint instances with the given ids, in the order requested.
+        The instances are read with a single in_bulk() query, and dictified in bulk.
+
+        :param ids: A list of endpoint instance ids (no more than max_requested_ids)
+        :param user: The request user
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: A list of long dictified model instances, with None in place of ids which
+        don't match an active instance. Raises a ValueError if an id is invalid or there are too many ids
+        """
+        ids = cls.clean_ids(ids)
+
+        objects = cls.optimise_queryset(cls.objects.filter(active=1), user, short_dict=False, fields=fields, expand=expand)
+        objects = objects.in_bulk(ids).values()
+        dictified_objects = dict(zip([object.pk for object in objects], cls.dictify_many(objects, user, short_dict=False, fields=fields, expand=expand)))
+
+        return [dictified_objects.get(id) for id in ids]
+
+    @classmethod
+    def clean_ids(cls, ids):
+        """
+        Converts ids requested by a client into primary key values
+        :param ids: A list of ids (no more than max_requested_ids)
+        :return: A list of primary key values. Raises a ValueError if an id is invalid or there are too many ids
+        """
+        if len(ids) > cls.max_requested_ids:
+            raise ValueError("No more than {} ids can be requested at once".format(cls.max_requested_ids))
+
+        try:
+            return [cls._meta.pk.to_python(id) for id in ids]
+        except ValidationError, e:
+            raise ValueError(e)
+
+    @classmethod
+    def get_page_modifications(cls, page_number):
+        """
+        Gets the modification dates of the instances on a page, without reading the instances in full.
+        Used to tell whether a page has changed since it was last requested.
+
+        :param page_number: The page number given to the paginator
+        :return: A list of (primary key, date modified) tuples, or raises
+        the same exceptions as get_all() for an invalid page
+        """
+        objects = cls.objects.filter(active=1).values_list('pk', 'date_modified')
+        p = Paginator(objects, cls.pagination)
+        return list(p.page(page_number).object_list)
+
+    @classmethod
+    def get_instance_modification(cls, rest_param):
+        """
+        Gets the modification date of an endpoint instance, without reading the instance in full.
+        Models overriding get_model_instance() should override this method in the same way.
+
+        :param rest_param: The endpoint instance criteria (see get_model_instance())
+        :return: A (primary key, active, date modified) tuple, or None if the instance can't be found
+        """
+        try:
+            return cls.objects.filter(id=rest_param).values_list('pk', 'active', 'date_modified').first()
+        except ValueError:
+            return None
+
+    @classmethod
+    def get_all_by_cursor(cls, cursor, user, fields=None, expand=None):
+        """
+        Dictifies endpoint model instances following on from the cursor given.
+        Returns up to the number of instances specified by the pagination variable,
+        ordered by the cursor_ordering field.
+
+        :param cursor: An opaque cursor taken from a previous response, or None for the first page
+        :param user: The request user
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: A dictionary with the list of short dictified model instances under 'results',
+        and the cursors of the neighbouring pages under 'next' and 'prev' (None if there's no such page)
+        """
+        descending = cls.cursor_ordering.startswith('-')
+        key = cls.cursor_ordering.lstrip('-')
+        attname = cls._meta.get_field(key).attname
+
+        objects = cls.optimise_queryset(cls.objects.filter(active=1), user, fields=fields, expand=expand)
+
+        value, backwards = cls.decode_cursor(cursor) if cursor else (None, False)
+
+        # walking backwards is the same as walking forwards in the reverse order
+        if backwards:
+            descending = not descending
+
+        if value is not None:
+            objects = objects.filter(**{'{}__{}'.format(key, 'lt' if descending else 'gt'): value})
+
+        # fetch one more instance than needed to find out whether there's another page
+        objects = list(objects.order_by('{}{}'.format('-' if descending else '', key))[:cls.pagination + 1])
+        has_more = len(objects) > cls.pagination
+        objects = objects[:cls.pagination]
+
+        if backwards:
+            objects.reverse()
+
+        next_cursor = prev_cursor = None
+
+        if objects:
+            if has_more or backwards:
+                next_cursor = cls.encode_cursor(getattr(objects[-1], attname), False)
+            if (has_more and backwards) or (value is not None and not backwards):
+                prev_cursor = cls.encode_cursor(getattr(objects[0], attname), True)
+
+        return {
+            'results': cls.dictify_many(objects, user, fields=fields, expand=expand),
+            'next': next_cursor,
+            'prev': prev_cursor
+        }
+
+    @classmethod
+    def encode_cursor(cls, value, backwards):
+        """
+        Creates an opaque cursor pointing either side of an instance.
+
+        :param value: The cursor_ordering field value of the instance
+        :param backwards: Whether the cursor points to the instances before (True) or after (False) the instance
+        :return: The cursor string
+        """
+        return urlsafe_b64encode(json.dumps([value, backwards], cls=DjangoJSONEncoder))
+
+    @classmethod
+    def decode_cursor(cls, cursor):
+        """
+        Decodes a cursor created by encode_cursor()
+
+        :param cursor: The cursor string
+        :return: A tuple of (cursor_ordering field value, whether the cursor points backwards),
+        or raises an InvalidCursor exception
+        """
+        field = cls._meta.get_field(cls.cursor_ordering.lstrip('-'))
+
+        try:
+            value, backwards = json.loads(urlsafe_b64decode(str(cursor)))
+            value = field.to_python(value)
+        except (TypeError, ValueError, ValidationError), e:
+            raise InvalidCursor(e)
+
+        return value, bool(backwards)
+
+    @classmethod
+    def get_model_instance(cls, rest_param):
+        """
+        Provides a default implementation for getting an endpoint instance by its ID.
+
+        :param rest_param: The endpoint instance criteria which has been passed in via the format:
+        /<endpoint>/<endpoint_instance>/
+        :return: The endpoint instance, or raises an ObjectDoesNotExist exception
+        """
+        return cls.objects.get(id=rest_param)
+
+    @classmethod
+    def get_optimised_instance(cls, rest_param, user, fields=None, expand=None):
+        """
+        Gets an endpoint instance which will be long dictified for a user.
+        Unless the model overrides get_model_instance(), the instance is read by a single optimised
+        query (see optimise_queryset()). Otherwise the related models of the instance returned by
+        get_model_instance() are prefetched.
+
+        :param rest_param: The endpoint instance criteria (see get_model_instance())
+        :param user: The request user, used to fetch the related models of a long dictification in bulk
+        :param fields: The names of the fields requested by the client, or None for all the fields.
+        Only the columns of the requested fields are read; instances are read in full otherwise
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: The endpoint instance, or raises an ObjectDoesNotExist exception
+        """
+        if cls.get_model_instance.__func__ is not APIModel.__dict__['get_model_instance'].__func__:
+            instance = cls.get_model_instance(rest_param)
+            prefetch_lookups = cls.get_prefetch_lookups(user, False, fields, expand)
+
+            if prefetch_lookups:
+                prefetch_related_objects([instance], prefetch_lookups)
+
+            return instance
+
+        return cls.optimise_queryset(cls.objects.all(), user, short_dict=False, fields=fields, defer=fields is not None, expand=expand).get(id=rest_param)
+
+    @classmethod
+    def get_cached_instance(cls, rest_param, user=None, fields=None, expand=None):
+        """
+        Cached counterpart to get_model_instance() for models whose instances are requested
+        by primary key. Instances are looked up in process memory, then in the API cache,
+        and only read from the database if neither holds them. Ids which don't match
+        an instance are cached as missing, so that requests for them don't reach the database.
+
+        Cached instances are read in full, without their related models, so the related models
+        which will be dictified are prefetched after the instance has been looked up.
+        Instances are always read from the primary database, as the cache is shared by requests
+        reading from a replica and requests pinned to the primary (see APIDatabase.pin_to_primary()).
+
+        :param rest_param: The primary key of the instance
+        :param user: The request user, used to prefetch the related models of a long dictification
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: A copy of the cached instance, or raises an ObjectDoesNotExist exception
+        (or a ValueError if the id is invalid)
+        """
+        try:
+            pk = cls._meta.pk.to_python(rest_param)
+        except ValidationError, e:
+            raise ValueError(e)
+
+        key = make_instance_key(cls, pk)
+        local_cache = cls.get_local_instance_cache()
+        value = local_cache.get(key)
+
+        if value is None:
+            value = get_cache().get(key)
+
+            if value is None:
+                try:
+                    value = pickle.dumps(cls.objects.using(router.db_for_write(cls)).get(pk=pk), pickle.HIGHEST_PROTOCOL)
+                except cls.DoesNotExist:
+                    value = MISSING_INSTANCE
+
+                get_cache().set(key, value, cls.instance_cache_timeout)
+
+            local_cache.set(key, value, cls.instance_cache_local_timeout)
+
+        if value == MISSING_INSTANCE:
+            raise cls.DoesNotExist("{} matching query does not exist.".format(cls.__name__))
+
+        # instances are cached pickled, so that each request gets its own copy
+        instance = pickle.loads(value)
+        prefetch_lookups = cls.get_prefetch_lookups(user, False, fields, expand)
+        if prefetch_lookups:
+            prefetch_related_objects([instance], prefetch_lookups)
+
+        return instance
+
+    @classmethod
+    def get_local_instance_cache(cls):
+        """
+        Gets the cache holding the model's instances in process memory,
+        shared by proxy models (including those created for deferred fields)
+        :return: A LocalCache
+        """
+        local_cache = cls._meta.concrete_model.get_class_cache('_local_instance_cache')
+
+        if 'cache' not in local_cache:
+            local_cache['cache'] = LocalCache(cls.instance_cache_size)
+
+        return local_cache['cache']
+
+    @classmethod
+    def forget_cached_instances(cls, pks):
+        """
+        Removes instances from the instance cache (see get_cached_instance()),
+        called whenever the instances are saved, updated or deleted
+        :param pks: The primary keys of the instances
+        :return: None
+        """
+        if not cls.cache_instances:
+            return
+
+        keys = [make_instance_key(cls, pk) for pk in pks]
+        local_cache = cls.get_local_instance_cache()
+
+        for key in keys:
+            local_cache.delete(key)
+
+        get_cache().delete_many(keys)
+
+    @abstractmethod
+    def is_owner(self, request_user):
+        """
+        This method has been left intentionally abstract to allow custom ownership of models.
+        For example, a particular model may be owned by multiple users, or by a specific group of users.
+
+        :param request_user: reference to request.user
+        :return: True if the user has owner rights on the model
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def owned_ids(cls, user, objects):
+        """
+        Optional bulk counterpart to is_owner(), used when dictifying many instances at once.
+        Models can override this method to resolve ownership of a whole page of instances
+        with a single query, rather than calling is_owner() on each instance.
+
+        :param user: The (authenticated) request user
+        :param objects: A list of model instances
+        :return: The primary keys of the instances owned by the user, or None
+        to fall back to calling is_owner() on each instance
+        """
+        return None
+
+    @classmethod
+    def owner_q(cls, user):
+        """
+        Optional database counterpart to is_owner().
+        Models can override this method to describe the instances owned by a user as a Q object,
+        so that querysets served by the API are annotated with ownership by the database
+        (see annotate_ownership()) rather than calling is_owner() on each instance.
+
+        :param user: The (authenticated) request user
+        :return: A Q object matching the instances owned by the user, or None
+        to fall back to owned_ids()/is_owner()
+        """
+        return None
+
+    def set_user_auth(self, user, user_auth=None):
+        """
+        The default permission level set on all models is Public.
+        This method takes in a user object and raises the permission
+        level accordingly.
+
+        :param user: The request user object
+        :param user_auth: The UserAuthCode of the user, if it has already been resolved
+        :return: None
+        """
+        self._curr_user = user
+        if user_auth is not None:
+            self._user_auth = user_auth
+        elif user.is_authenticated():
+            self._user_auth = UserAuthCode.REGISTERED_USER
+
+            # instances fetched for the user may have had their ownership worked out by the database
+            is_owner = getattr(self, '_is_owner', None)
+            if is_owner is None:
+                is_owner = self.is_owner(user)
+
+            if is_owner:
+                self._user_auth = UserAuthCode.OWNER
+
+    @classmethod
+    def api_create(cls, request):
+        """
+        Allows a model instance to be created via the API.
+
+        By default the model is set to read only (the method returns None,
+        which at an APIView level is exposed as a 404 error).
+
+        Any model wishing to allow creation should override this method,
+        making use of the request parameter.
+
+        :param request: The request object
+        :return: The newly created object (or None if one wasn't created).
+        """
+        return None
+
+    @classmethod
+    def api_bulk_create(cls, request, items):
+        """
+        Allows many model instances to be created at once via the API,
+        from a JSON array of objects POSTed to the endpoint.
+
+        By default, instances can only be created in bulk if the model lists the fields
+        which can be set in bulk_create_fields. Otherwise the method returns None,
+        which at an APIView level is exposed as a 404 error.
+
+        Any model wishing to set fields which don't come from the request items (e.g. the owner)
+        should override this method, making use of create_in_bulk().
+
+        :param request: The request object
+        :param items: The decoded objects of the JSON array
+        :return: A list of the newly created objects (or None if they weren't created).
+        """
+        if not cls.bulk_create_fields:
+            return None
+
+        return cls.create_in_bulk(items)
+
+    @classmethod
+    def create_in_bulk(cls, items, **defaults):
+        """
+        Validates and creates model instances from a list of items, in a single transaction.
+        Instances are inserted with bulk_create() where the database gives back the primary keys
+        of the inserted rows, and one at a time (within the transaction) otherwise.
+
+        :param items: A list of dictionaries, which may only hold fields listed in bulk_create_fields
+        :param defaults: Field values set on every instance. Only fields listed in
+        bulk_create_fields are validated
+        :return: A list of the newly created instances. Raises a KeyError if an item holds
+        other fields, a ValueError if an item isn't a dictionary, or a ValidationError if an item is invalid
+        """
+        instances = []
+        # only the fields which can be set by the request are validated
+        exclude = [field.name for field in cls._meta.fields if field.name not in cls.bulk_create_fields]
+
+        for item in items:
+            if not isinstance(item, dict):
+                raise ValueError("Expected an object, got: {}".format(item))
+
+            disallowed_fields = set(item) - set(cls.bulk_create_fields)
+            if disallowed_fields:
+                raise KeyError(', '.join(sorted(disallowed_fields)))
+
+            instance = cls(**dict(item, **defaults))
+            instance.full_clean(exclude=exclude)
+            instances.append(instance)
+
+        db = router.db_for_write(cls)
+
+        with transaction.atomic(using=db):
+            if getattr(connections[db].features, 'can_return_ids_from_bulk_insert', False):
+                cls.objects.using(db).bulk_create(instances)
+            else:
+                for instance in instances:
+                    instance.save(force_insert=True, using=db)
+
+        # bulk_create() doesn't send post_save signals
+        bump_model_version(cls)
+        cls.forget_cached_instances([instance.pk for instance in instances if instance.pk is not None])
+
+        return instances
+
+    def api_update(self, request):
+        """
+        Allows a model instance to be updated via the API.
+
+        By default, it handles the process of deactivating a model instance,
+        by looking out for the 'deactivate' parameter in the request.
+
+        It also handles the save of any updates (only writing the fields which have changed,
+        see save_changes()) and returning the updated model.
+
+        The atomic operations triggered by the request (see atomic_operations) are written
+        by the database in the same UPDATE query. For versioned models, clients can pass the
+        version they last read, so that the update only goes ahead if the instance hasn't changed since.
+
+        If this method is overwritten by a subclass, the subclass should call
+        super api_update() at the END of the overwriting method to make use of this logic.
+
+        Alternatively, subclasses can fully overwrite the method as they please.
+
+        :param request: The request object
+        :return: Updated instance of the model instance. Raises a ConcurrentUpdate if the instance
+        has changed since the client (or the request) read it
+        """
+        changes, lookups = self.get_atomic_changes(request)
+
+        if self.version_field is not None and self.version_field in request.POST:
+            if request.POST[self.version_field] != str(getattr(self, self.version_field)):
+                raise ConcurrentUpdate("{} {} has changed since version {}".format(type(self).__name__, self.pk, request.POST[self.version_field]))
+
+            lookups[self.version_field] = getattr(self, self.version_field)
+
+        if self.is_owner(request.user) and request.POST.get('deactivate'):
+            self.active = 0
+            self.date_deactivated = datetime.now()
+
+        self.save_changes(changes, **lookups)
+
+        return self if self.active else None
+
+    def get_atomic_changes(self, request):
+        """
+        Compiles the atomic operations triggered by a request (see atomic_operations)
+        :param request: The request object
+        :return: A tuple of (field values or F() expressions keyed by field name,
+        lookups the row must match for them to be written)
+        """
+        changes = {}
+        lookups = {}
+
+        for param, operation in self.atomic_operations.items():
+            if param in request.POST:
+                operation_changes, operation_lookups = operation.compile(type(self), request.POST[param])
+                changes.update(operation_changes)
+                lookups.update(operation_lookups)
+
+        return changes, lookups
+
+    @classmethod
+    def api_bulk_update(cls, request, ids):
+        """
+        Allows many model instances to be updated at once via the API.
+
+        By default, handles deactivating the instances by looking out for the 'deactivate'
+        parameter in the request, and changing any of the fields listed in bulk_update_fields
+        which are in the request. Only the instances the user owns are updated
+        (see owned_instances()), with a single UPDATE query.
+
+        As the instances are updated by the database, save() isn't called and no signals are sent.
+        Subclasses needing either should override this method.
+
+        :param request: The request object
+        :param ids: The ids of the instances to update (no more than max_requested_ids)
+        :return: A list of the ids of the instances updated (or None if the instances couldn't be updated).
+        Raises a ValueError if an id is invalid, or a ValidationError if a field change is invalid
+        """
+        changes = {}
+
+        if request.POST.get('deactivate'):
+            changes['active'] = 0
+            changes['date_deactivated'] = datetime.now()
+
+        for name in cls.bulk_update_fields:
+            if name in request.POST:
+                field = cls._meta.get_field(name)
+                value = field.to_python(request.POST[name])
+                field.run_validators(value)
+                changes[field.attname] = value
+
+        return cls.update_in_bulk(request.user, ids, **changes)
+
+    @classmethod
+    def update_in_bulk(cls, user, ids, **changes):
+        """
+        Updates the active instances the user owns out of the ids given, with a single UPDATE query.
+        The date modified (and version, see version_field) of the instances is updated,
+        and cached responses showing them invalidated.
+
+        :param user: The request user
+        :param ids: The ids of the instances to update (no more than max_requested_ids)
+        :param changes: The field values to set on the instances
+        :return: A list of the ids of the instances updated. Raises a ValueError if an id is invalid
+        """
+        ids = cls.clean_ids(ids)
+
+        if not changes:
+            return []
+
+        # update() doesn't set auto_now fields
+        changes['date_modified'] = timezone.now()
+
+        # clients holding a version read before the update mustn't be able to overwrite it
+        if cls.version_field is not None:
+            changes[cls.version_field] = F(cls.version_field) + 1
+
+        with transaction.atomic(using=router.db_for_write(cls)):
+            updated_ids = cls.owned_instances(user, cls.objects.select_for_update().filter(pk__in=ids, active=1))
+            updated_ids = list(updated_ids.values_list('pk', flat=True))
+
+            if updated_ids:
+                cls.objects.filter(pk__in=updated_ids).update(**changes)
+
+        # update() doesn't send post_save signals
+        if updated_ids:
+            bump_model_version(cls)
+            cls.forget_cached_instances(updated_ids)
+
+        return updated_ids
+
+    @classmethod
+    def owned_instances(cls, user, queryset):
+        """
+        Filters a queryset down to the instances a user owns.
+        Ownership is resolved by the database if the model implements owner_q(),
+        and with owned_ids()/is_owner() otherwise.
+
+        :param user: The request user
+        :param queryset: A queryset of the model
+        :return: A queryset of the instances the user owns
+        """
+        if not user.is_authenticated():
+            return queryset.none()
+
+        owner_q = cls.owner_q(user)
+
+        if owner_q is not None:
+            return queryset.filter(owner_q)
+
+        user_auths = cls.resolve_user_auths(user, list(queryset))
+        return queryset.filter(pk__in=[pk for pk, user_auth in user_auths.items() if user_auth == UserAuthCode.OWNER])
+
+    @classmethod
+    def api_custom_request(cls, request):
+        """
+        Any "custom request" sent to the API for an endpoint will be
+        forwarded to this method. Any model overriding this method
+        will have access to the whole request so that it determine how to
+        serve the custom request.
+
+        The method defaults to returning False, which at an API level
+        translates to the endpoint not supporting custom requests by default.
+
+        :param request: The request object
+        :return: Default to False, which propagates up as a 404 error.s
         """
         return False
 
     class Meta:
-        abstract = True
\ No newline at end of file
+        abstract = True
+
+def invalidate_cached_responses(sender, **kwargs):
+    """
+    Invalidates the cached responses showing instances of a model whenever an instance is
+    saved or deleted (or its many to many relations change).
+    """
+    if issubclass(sender, APIModel):
+        bump_model_version(sender)
+
+    # many to many changes are sent by the through model, and change both sides of the relation
+    instance = kwargs.get('instance')
+    if kwargs.get('action', '').startswith('post_') and isinstance(instance, APIModel):
+        bump_model_version(type(instance))
+        if kwargs.get('model') is not None and issubclass(kwargs['model'], APIModel):
+            bump_model_version(kwargs['model'])
+
+def invalidate_cached_instance(sender, instance, **kwargs):
+    """
+    Removes an instance from the instance cache whenever it's saved or deleted.
+    Saving a new instance also removes its id from the ids cached as missing.
+    """
+    if isinstance(instance, APIModel):
+        sender.forget_cached_instances([instance.pk])
+
+post_save.connect(invalidate_cached_responses, dispatch_uid='api_tools_post_save')
+post_delete.connect(invalidate_cached_responses, dispatch_uid='api_tools_post_delete')
+m2m_changed.connect(invalidate_cached_responses, dispatch_uid='api_tools_m2m_changed')
+post_save.connect(invalidate_cached_instance, dispatch_uid='api_tools_instance_post_save')
+post_delete.connect(invalidate_cached_instance, dispatch_uid='api_tools_instance_post_delete')
@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections
+
+__author__ = 'szpytfire'
+
+# The phase time is counted towards when it isn't spent in any other phase
+ROOT_PHASE = 'app'
+
+# The timer of the request being handled by the current thread
+_local = threading.local()
+
+
+class RequestTimer(object):
+    """
+    Accumulates the time spent (and the database queries made) in each phase of handling a request.
+    Phases can be nested, in which case time spent in the inner phase isn't counted towards the outer one,
+    so that the phases add up to the total time.
+
+    Queries are counted by logging them while the timer is running, as with settings.DEBUG.
+    """
+
+    def __init__(self):
+        self.durations = OrderedDict()
+        self.query_counts = {}
+        self._phases = [ROOT_PHASE]
+        self._connections = [connections[alias] for alias in connections]
+        self._debug_cursors = [connection.use_debug_cursor for connection in self._connections]
+        self._query_logs = [len(connection.queries) for connection in self._connections]
+        self._start = self._mark = time.time()
+        self._mark_queries = 0
+        self.total = None
+        self.query_time = None
+
+        for connection in self._connections:
+            connection.use_debug_cursor = True
+
+    def count_queries(self):
+        """
+        Counts the queries made since the timer was started
+        :return: The number of queries
+        """
+        return sum(len(connection.queries) - logged for connection, logged in zip(self._connections, self._query_logs))
+
+    def _record(self):
+        """
+        Counts the time and queries since the last phase change towards the current phase
+        :return: None
+        """
+        now = time.time()
+        queries = self.count_queries()
+        name = self._phases[-1]
+
+        self.durations[name] = self.durations.get(name, 0) + now - self._mark
+        self.query_counts[name] = self.query_counts.get(name, 0) + queries - self._mark_queries
+        self._mark, self._mark_queries = now, queries
+
+    def enter(self, name):
+        """
+        Starts a phase, pausing the current one
+        :param name: The name of the phase
+        :return: None
+        """
+        self._record()
+        self._phases.append(name)
+
+    def exit(self):
+        """
+        Ends the current phase, resuming the one it was started in
+        :return: None
+        """
+        self._record()
+        self._phases.pop()
+
+    def stop(self):
+        """
+        Stops the timer, working out the total time and the time spent running queries.
+        Queries logged only for the timer are discarded.
+        :return: None
+        """
+        self._record()
+        self.total = time.time() - self._start
+        self.query_time = 0
+
+        for connection, debug_cursor, logged in zip(self._connections, self._debug_cursors, self._query_logs):
+            self.query_time += sum(float(query['time']) for query in connection.queries[logged:])
+            connection.use_debug_cursor = debug_cursor
+
+            if not (debug_cursor or settings.DEBUG):
+                del connection.queries[logged:]
+
+    def as_header(self):
+        """
+        Formats the timings as a Server-Timing header, in milliseconds
+        :return: The header value
+        """
+        metrics = ['{};dur={:.2f};desc="{} queries"'.format(name, duration * 1000, self.query_counts[name]) for name, duration in self.durations.items()]
+        metrics.append('db;dur={:.2f};desc="{} queries"'.format(self.query_time * 1000, sum(self.query_counts.values())))
+        metrics.append('total;dur={:.2f}'.format(self.total * 1000))
+
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        """
+        Gives the timings as a dictionary, in milliseconds
+        :return: A dictionary of the time spent, and queries made, in each phase and in total
+        """
+        return {
+            'phases': OrderedDict((name, {'duration': duration * 1000, 'queries': self.query_counts[name]}) for name, duration in self.durations.items()),
+            'db': {'duration': self.query_time * 1000, 'queries': sum(self.query_counts.values())},
+            'total': self.total * 1000
+        }
+
+def get_timer():
+    """
+    Gets the timer of the request being handled by the current thread
+    :return: A RequestTimer, or None if the request isn't being timed
+    """
+    return getattr(_local, 'timer', None)
+
+def start_timer():
+    """
+    Starts timing the request being handled by the current thread
+    :return: The RequestTimer
+    """
+    _local.timer = RequestTimer()
+    return _local.timer
+
+def stop_timer():
+    """
+    Stops timing the request being handled by the current thread
+    :return: The stopped RequestTimer
+    """
+    timer = _local.timer
+    _local.timer = None
+    timer.stop()
+    return timer
+
+class _Phase(object):
+    """
+    Context manager timing a phase of the current request
+    """
+    __slots__ = ('timer', 'name')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer.enter(self.name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer.exit()
+
+class _NoPhase(object):
+    """
+    Context manager standing in for _Phase when the current request isn't being timed
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+_no_phase = _NoPhase()
+
+def phase(name):
+    """
+    Times a phase of the current request (if it's being timed), e.g.
+
+    with phase('dictify'):
+        ...
+
+    :param name: The name of the phase
+    :return: A context manager
+    """
+    timer = getattr(_local, 'timer', None)
+
+    if timer is None:
+        return _no_phase
+
+    return _Phase(timer, name)
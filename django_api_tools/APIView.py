@@ -1,23 +1,38 @@
+import json
 import logging
+from calendar import timegm
+from copy import copy
 
 from django.views.generic import View
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseNotModified, QueryDict, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
 from django.core.paginator import EmptyPage, PageNotAnInteger
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.contrib.auth import authenticate, login, logout
 
+from django_api_tools.APIDatabase import get_read_database, get_request_read_database, iterate_using, pin_to_primary, use_read_database
+from django_api_tools.APICache import SingleFlight, get_cache, get_change_count, get_model_label, get_model_versions, make_digest, make_fragment_key, make_response_key
+from django_api_tools.APIEncoder import get_json_backend
+from django_api_tools.APIModel import ConcurrentUpdate, InvalidCursor
+from django_api_tools.APITiming import get_timer, phase, start_timer, stop_timer
+
 __author__ = 'szpytfire'
 
 logger = logging.getLogger(__name__)
 
+# Coalesces identical GET requests handled at the same time by the process's threads
+_single_flight = SingleFlight()
+
 
 class StatusCode(object):
     """
     Maintains verbose representations of HTTP status codes.
     """
     OK = 200
+    NOT_MODIFIED = 304
     NOT_FOUND = 404
     UNAUTHORIZED = 401
+    CONFLICT = 409
 
 class ReservedURL(object):
     """
@@ -26,6 +41,8 @@ class ReservedURL(object):
     LOGIN = 'login'
     LOGOUT = 'logout'
     CSRFTOKEN = 'csrftoken'
+    EXPORT = 'export'
+    BATCH = 'batch'
 
     @classmethod
     def all(cls):
@@ -34,16 +51,70 @@ class ReservedURL(object):
 
         :return: reserved API urls
         """
-        return (cls.LOGIN, cls.LOGOUT, cls.CSRFTOKEN)
+        return (cls.LOGIN, cls.LOGOUT, cls.CSRFTOKEN, cls.EXPORT, cls.BATCH)
 
-class UnsafeJSONResponse(JsonResponse):
+class UnsafeJSONResponse(HttpResponse):
     """
-    Subclass of JSONResponse which provides some default parameters:
+    JSON response which provides some default parameters:
     - Sets the Status code to 200
-    - Sets the safe parameter to False, allowing non-dictionary objects to be returns as JSON
+    - Allows non-dictionary objects to be returned as JSON
+    - Encodes the data with the JSON backend given (by default, the fastest one installed)
+    """
+    def __init__(self, data, status=StatusCode.OK, backend=None):
+        backend = backend or get_json_backend()
+
+        with phase('encode'):
+            content = backend.dumps(data)
+
+        super(UnsafeJSONResponse, self).__init__(content=content, status=status, content_type='application/json')
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """
+    Subclass of StreamingHttpResponse which outputs an iterable as a JSON array.
+    Each object is encoded as it is read from the iterable, so that the response can be
+    sent before the whole array has been built.
+    """
+    def __init__(self, data, status=StatusCode.OK, backend=None):
+        backend = backend or get_json_backend()
+        super(StreamingJSONResponse, self).__init__(streaming_content=self.encode_array(data, backend), status=status, content_type='application/json')
+
+    @staticmethod
+    def encode_array(data, backend):
+        """
+        Encodes an iterable piece by piece into a JSON array
+        :param data: an iterable of JSON-serialisable objects
+        :param backend: the JSONBackend to encode each object with
+        :return: A generator of JSON strings
+        """
+        yield '['
+
+        for index, item in enumerate(data):
+            if index:
+                yield ','
+            yield backend.dumps(item)
+
+        yield ']'
+
+class NDJSONResponse(StreamingHttpResponse):
+    """
+    Subclass of StreamingHttpResponse which outputs an iterable as newline-delimited JSON,
+    encoding one object per line as it is read from the iterable.
     """
-    def __init__(self, data, status=StatusCode.OK):
-        super(UnsafeJSONResponse, self).__init__(status=status, data=data, safe=False)
+    def __init__(self, data, status=StatusCode.OK, backend=None):
+        backend = backend or get_json_backend()
+        super(NDJSONResponse, self).__init__(streaming_content=self.encode_lines(data, backend), status=status, content_type='application/x-ndjson')
+
+    @staticmethod
+    def encode_lines(data, backend):
+        """
+        Encodes an iterable into newline-delimited JSON
+        :param data: an iterable of JSON-serialisable objects
+        :param backend: the JSONBackend to encode each object with
+        :return: A generator of JSON lines
+        """
+        for item in data:
+            yield backend.dumps(item)
+            yield '\n'
 
 class BadJSONResponse(UnsafeJSONResponse):
     """
@@ -52,6 +123,31 @@ class BadJSONResponse(UnsafeJSONResponse):
     def __init__(self, status, data=None):
       super(BadJSONResponse, self).__init__(status=status, data=data)
 
+class APIRouter(object):
+    """
+    Precompiled dispatch table, mapping the first component of API URLs
+    either to a reserved URL or to an endpoint model.
+    Built once from an APIView's registered_endpoints (see APIView.get_router()).
+    """
+    __slots__ = ('routes', )
+
+    def __init__(self, registered_endpoints):
+        """
+        :param registered_endpoints: A dictionary mapping endpoint names to endpoint models
+        :return: None
+        """
+        # reserved URLs take precedence over endpoints of the same name
+        self.routes = dict((name, (None, endpoint_model)) for name, endpoint_model in registered_endpoints.items())
+        self.routes.update((reserved_url, (reserved_url, None)) for reserved_url in ReservedURL.all())
+
+    def resolve(self, name):
+        """
+        Looks up the first component of an API URL
+        :param name: The URL component
+        :return: A tuple of (reserved URL, endpoint model), both of which are None for an unknown name
+        """
+        return self.routes.get(name, (None, None))
+
 class APIUrl(object):
     """
     Provides URL validation.
@@ -61,28 +157,45 @@ class APIUrl(object):
     Extracts the endpoint model, model instance (if any), and custom request fields.
     Alternatively maps to a reserved URL.
     If no match is made, it deems the URL an invalid request.
+
+    APIUrls only hold the state of the request they were created for.
     """
+    __slots__ = (
+        # The endpoint name extracted from the request URL
+        'REQUESTED_MODEL',
+        # The endpoint model the name maps to (only resolved when a router is given)
+        'ENDPOINT_MODEL',
+        # The endpoint model instance extracted from the request URL
+        'REQUESTED_MODEL_INSTANCE',
+        # Any fields extracted from the URL which are custom request fields
+        'ADDITIONAL_FIELDS',
+        # The reserved URL matched to
+        'RESERVED_URL',
+        # Any fields following the reserved URL
+        'RESERVED_URL_FIELDS'
+    )
 
-    # The endpoint model extracted from the request URL
-    REQUESTED_MODEL = None
-    # The endpoint model instance extracted from the request URL
-    REQUESTED_MODEL_INSTANCE = None
-    # Any fields extracted from the URL which are custom request fields
-    ADDITIONAL_FIELDS = list()
-    # The reserved URL matched to
-    RESERVED_URL = None
     # A list of the reserved API urls
     RESERVED_URLS = ReservedURL.all()
 
-    def __init__(self, request):
+    def __init__(self, request, router=None):
         """
         Splits the request URL on initialisation
         :param request: HTTP request object
+        :param router: The APIRouter used to resolve endpoint models. If not given,
+        any endpoint name is accepted
         :return: None
         """
-        self.split_url_components(request)
+        self.REQUESTED_MODEL = None
+        self.ENDPOINT_MODEL = None
+        self.REQUESTED_MODEL_INSTANCE = None
+        self.ADDITIONAL_FIELDS = ()
+        self.RESERVED_URL = None
+        self.RESERVED_URL_FIELDS = ()
+
+        self.split_url_components(request, router)
 
-    def split_url_components(self, request):
+    def split_url_components(self, request, router=None):
         """
         Splits the URL into separate components for URL validation.
 
@@ -94,33 +207,39 @@ class APIUrl(object):
         - instance_criteria is an id of an instance of the model or any other unique field
         - custom fields are handled by the specific model
         :param request: HTTP request object
+        :param router: The APIRouter used to resolve endpoint models (or None)
         :return: None
         """
+        # for a valid url, the first component will be a '' empty string,
+        # the second component 'api', and the third the reserved URL or endpoint
+        url_components = request.path.split("/", 4)
 
+        if len(url_components) < 3 or not url_components[2]:
+            return
 
-        url_components = request.path.split("/")
-
-        # we start from position 2, as for a valid url,
-        # the first component will be a '' empty string,
-        # and the second component 'api'.
-        for i in range(2, len(url_components)):
-            if url_components[i] == '':
-                continue
-
-            # if the request is for a reserved URL, or an specifies an endpoint
-            # model, this will be found at position 2
-            if i == 2:
-                # Check first if it's a reserved URL - if it is, there's no point
-                # continuing with the looping process
-                if url_components[i] in self.RESERVED_URLS:
-                    self.RESERVED_URL = url_components[i]
-                    break
-                # if it's not a reserved url, it must be a requested model
-                self.REQUESTED_MODEL = url_components[i]
-            elif i == 3:
-                self.REQUESTED_MODEL_INSTANCE = url_components[i]
-            else:
-                self.ADDITIONAL_FIELDS.append(url_components[i])
+        name = url_components[2]
+
+        if router is not None:
+            reserved_url, endpoint_model = router.resolve(name)
+        else:
+            reserved_url, endpoint_model = (name if name in self.RESERVED_URLS else None), None
+
+        # the remaining components of the URL, skipping empty ones
+        fields = tuple(component for component in '/'.join(url_components[3:]).split('/') if component)
+
+        if reserved_url is not None:
+            self.RESERVED_URL = reserved_url
+            self.RESERVED_URL_FIELDS = fields
+            return
+
+        self.REQUESTED_MODEL = name
+        self.ENDPOINT_MODEL = endpoint_model
+
+        if len(url_components) > 3 and url_components[3]:
+            self.REQUESTED_MODEL_INSTANCE = url_components[3]
+
+        if len(url_components) > 4:
+            self.ADDITIONAL_FIELDS = tuple(component for component in url_components[4].split('/') if component)
 
     def is_valid_request(self):
         """
@@ -174,6 +293,66 @@ class APIView(View):
     public_update_endpoints = ()
     # Endpoints which the API allows creating without user authentication
     public_create_endpoints = ()
+    # Endpoints whose lists of instances are streamed to the client as they are encoded
+    streaming_endpoints = ()
+    # Whether to stream the lists of instances of all endpoints
+    stream_responses = False
+    # Endpoints which can be exported in full via the export reserved URL
+    export_endpoints = ()
+
+    # Endpoints whose GET responses are cached
+    cache_endpoints = ()
+    # Whether to cache the GET responses of all endpoints
+    cache_responses = False
+    # The number of seconds GET responses are cached for
+    cache_timeout = 300
+
+    # Endpoints whose instances' encoded dictifications are cached one instance at a time,
+    # and spliced into the lists (and instance responses) they appear in
+    fragment_cache_endpoints = ()
+    # Whether to cache the encoded dictifications of the instances of all endpoints
+    cache_fragments = False
+
+    # Endpoints whose identical GET requests are coalesced when they're handled at the same time,
+    # so that only one thread per process reads and dictifies the response
+    coalesce_endpoints = ()
+    # Whether to coalesce the identical GET requests of all endpoints
+    coalesce_requests = False
+    # The most seconds a coalesced request waits for the response, before handling the request itself
+    coalesce_timeout = 10
+
+    # Endpoints whose GET responses carry ETag/Last-Modified validators,
+    # answering conditional requests for unchanged resources with a 304
+    conditional_endpoints = ()
+    # Whether the GET responses of all endpoints carry validators
+    conditional_responses = False
+
+    # Whether relations are dictified without the client asking for them with the expand parameter.
+    # Otherwise relations are given as bare primary keys unless expanded
+    expand_relations = False
+
+    # Whether responses carry a Server-Timing header, breaking the time spent handling the request
+    # down into routing, fetching instances, dictifying and encoding, with the queries made in each
+    server_timing = False
+    # Whether JSON responses are wrapped in an envelope holding the timings, as {"data": ..., "timing": ...}.
+    # Only meant for debugging, as it changes the shape of every response
+    timing_envelope = False
+
+    # The name of the JSON backend used to encode responses ('json', 'ujson' or 'simplejson').
+    # Defaults to the API_TOOLS_JSON_BACKEND setting, or the built-in json module
+    json_backend = None
+
+    # The handler method of each reserved URL
+    reserved_url_handlers = {
+        ReservedURL.LOGIN: 'handle_login_request',
+        ReservedURL.LOGOUT: 'handle_logout_request',
+        ReservedURL.CSRFTOKEN: 'handle_csrf_request',
+        ReservedURL.EXPORT: 'handle_export_request',
+        ReservedURL.BATCH: 'handle_batch_request'
+    }
+
+    # The most sub-requests a batch request can hold
+    max_batch_requests = 50
 
     # A string eval'd upon a successful login
     # This should contain a subclass of APIModel which can
@@ -189,6 +368,43 @@ class APIView(View):
         :return: A JSONResponse object with a 200 status code if the request was valid,
         or 404 on an invalid request.
         """
+        # reads are served by the replica (if there is one), unless the user has written recently
+        with use_read_database(get_request_read_database(request)):
+            return self._timed(self._get_handler, request)
+
+    def _timed(self, handler, request):
+        """
+        Handles a request, timing it if the view's responses are timed (see server_timing).
+        Requests handled within a timed request (e.g. batched requests) are timed as part of it.
+
+        :param handler: The method handling the request
+        :param request: the request object
+        :return: The handler's response, carrying the timings
+        """
+        if not (self.server_timing or self.timing_envelope) or get_timer() is not None:
+            return handler(request)
+
+        start_timer()
+        try:
+            response = handler(request)
+        finally:
+            timer = stop_timer()
+
+        if self.server_timing:
+            response['Server-Timing'] = timer.as_header()
+
+        # streamed responses have been timed up until they started streaming, and only successful JSON bodies are wrapped
+        if self.timing_envelope and not response.streaming and response.status_code == StatusCode.OK and response.get('Content-Type', '').startswith('application/json'):
+            response.content = '{"data":' + (response.content or 'null') + ',"timing":' + get_json_backend(self.json_backend).dumps(timer.as_dict()) + '}'
+
+        return response
+
+    def _get_handler(self, request):
+        """
+        Dispatches a GET request to the handler for its URL
+        :param request: the request object
+        :return: The handler's response, or a 404 on an invalid request
+        """
         if not self._validate_request(request):
             return self.bad_request
 
@@ -196,7 +412,8 @@ class APIView(View):
             return self._handle_reserved_url_request(request)
 
         if self._url_validator.is_model_request():
-            return self._get_all(request)
+            # instances requested by id are long dictified (see _get_many())
+            return self._coalesce(request, self._get_all, short_dict='ids' not in request.GET)
 
         if self._url_validator.is_model_instance_request():
             return self._get_instance(request)
@@ -215,7 +432,22 @@ class APIView(View):
         :return: A JSONResponse object with a 200 status code if the request was valid,
         or 404 on an invalid request.
         """
+        change_count = get_change_count()
 
+        try:
+            return self._timed(self._post_request_handler, request)
+        finally:
+            # once the request has changed a model, the user's reads are served by the primary
+            # until the replica has caught up with the write
+            if get_change_count() != change_count:
+                pin_to_primary(request)
+
+    def _post_request_handler(self, request):
+        """
+        Dispatches a POST request to the handler for its URL
+        :param request: the request object
+        :return: The handler's response, or a 404 on an invalid request
+        """
         if not self._validate_request(request):
             return self.bad_request
 
@@ -223,6 +455,9 @@ class APIView(View):
             return self._handle_reserved_url_request(request)
 
         if self._url_validator.is_model_request():
+            if 'ids' in request.GET:
+                return self._bulk_update_handler(request)
+
             return self._post_handler(request, self.public_create_endpoints, create=True)
 
         if self._url_validator.is_model_instance_request():
@@ -232,48 +467,606 @@ class APIView(View):
         # Currently no support for custom POST requests
         return self.bad_request
 
+    def _coalesce(self, request, handler, short_dict):
+        """
+        Handles a GET request, unless an identical request is already being handled by another
+        thread, in which case the other thread's response is copied (see _get_coalesce_key()).
+        Streamed responses can't be copied, so requests waiting for one are handled separately,
+        as are requests waiting for a handler which gave back no response.
+
+        :param request: the request object
+        :param handler: The method handling the request
+        :param short_dict: Whether the response holds short or long dictifications
+        :return: The response (or None if the handler gave back no response)
+        """
+        if not (self.coalesce_requests or self._endpoint_model in self.coalesce_endpoints):
+            return handler(request)
+
+        def handle():
+            response = handler(request)
+            # waiting threads copy the response as it is now, as it may change once it's been returned
+            snapshot = None if response is None or response.streaming else (response.content, response.status_code, response.items())
+            return response, snapshot
+
+        (response, snapshot), shared = _single_flight.do(self._get_coalesce_key(request, short_dict), handle, self.coalesce_timeout)
+
+        if not shared:
+            return response
+
+        if snapshot is None:
+            return handler(request)
+
+        content, status, headers = snapshot
+        response = HttpResponse(content=content, status=status)
+        for header, value in headers:
+            response[header] = value
+
+        return response
+
+    def _get_coalesce_key(self, request, short_dict):
+        """
+        Creates the key identical GET requests are coalesced by (see _coalesce()).
+
+        Requests are identical if they are for the same view, endpoint, instance and query parameters,
+        carry the same conditional headers, read from the same database, and are made by users
+        who can see the same fields (see APIModel.get_cache_tier()).
+
+        :param request: the request object
+        :param short_dict: Whether the response holds short or long dictifications
+        :return: The key
+        """
+        return make_digest(
+            type(self).__module__,
+            type(self).__name__,
+            get_read_database(),
+            get_model_label(self._endpoint_model),
+            self._url_validator.REQUESTED_MODEL_INSTANCE,
+            sorted(request.GET.lists()),
+            request.META.get('HTTP_IF_NONE_MATCH'),
+            request.META.get('HTTP_IF_MODIFIED_SINCE'),
+            self._endpoint_model.get_cache_tier(request.user, short_dict)
+        )
+
     def _get_all(self, request):
         """
-        Handles a request to get all the instances of a model.
+        Handles a request to get all the instances of a model,
+        serving it from the cache if the endpoint's responses are cached.
+
+        :param request: the request object
+        :return: Either a list of model instances, or a 404 if the page was invalid
+        """
+        if 'ids' in request.GET:
+            return self._get_many(request)
+
+        validators = self._get_page_validators(request)
+
+        if self._is_not_modified(request, validators):
+            return self.not_modified_response(validators)
+
+        cache_key = self._get_response_cache_key(request, short_dict=True)
+        response = self._get_cached_response(cache_key)
+
+        if response is None:
+            response = self._cache_response(cache_key, self._get_page(request))
+
+        return self._set_validators(response, validators)
+
+    def _get_page(self, request):
+        """
+        Handles a request to get a page of the instances of a model.
         Looks for a page number, or defaults to the first page if one isn't found.
+        Endpoints using cursor pagination look for a cursor instead, defaulting to the first page.
+        Streaming endpoints encode the instances as they are read from the database.
+        Only the fields requested by the client are dictified (see _get_requested_fields()),
+        and only the relations it asks for are expanded (see _get_expanded_fields()).
 
-        :param request: the request object containing a potential page parameter
+        :param request: the request object containing a potential page (or cursor) parameter
         :return: Either a list of model instances, or a 404 if the page was invalid,
         or no objects exist for the page number provided.
         """
+        fields = self._get_requested_fields(request)
+        expand = self._get_expanded_fields(request)
+
+        if self._endpoint_model.cursor_pagination:
+            try:
+                with phase('fetch'):
+                    model_dict = self._endpoint_model.get_all_by_cursor(request.GET.get('cursor'), request.user, fields, expand)
+            except InvalidCursor, e:
+                logger.info(e)
+                return self.bad_request
+
+            return self.valid_response(model_dict)
+
         page_number = request.GET.get('page', 1)
+        stream = self.stream_responses or self._endpoint_model in self.streaming_endpoints
+
+        if not stream and self._caches_fragments():
+            return self._get_page_from_fragments(request, page_number, fields, expand)
 
         try:
-            model_dict = self._endpoint_model.get_all(page_number, request.user)
+            with phase('fetch'):
+                if stream:
+                    model_dict = self._endpoint_model.iter_all(page_number, request.user, fields, expand)
+                else:
+                    model_dict = self._endpoint_model.get_all(page_number, request.user, fields, expand)
         except (EmptyPage, PageNotAnInteger), e:
             logger.info(e)
             return self.bad_request
 
-        return self.valid_response(model_dict)
+        return self.streaming_response(model_dict) if stream else self.valid_response(model_dict)
+
+    def _get_many(self, request):
+        """
+        Handles a request to get many instances of a model by their ids,
+        given as a comma separated 'ids' parameter, e.g. /foo/?ids=3,1,2
+
+        :param request: the request object containing the ids parameter
+        :return: A list of long dictified model instances in the order requested (None for any
+        instance which couldn't be found), or a 404 if an id is invalid or too many were requested
+        """
+        cache_key = self._get_response_cache_key(request, short_dict=False)
+        response = self._get_cached_response(cache_key)
+
+        if response is not None:
+            return response
+
+        ids = self._split_parameter(request, 'ids')
+
+        try:
+            with phase('fetch'):
+                model_dict = self._endpoint_model.get_many(ids, request.user, self._get_requested_fields(request), self._get_expanded_fields(request))
+        except ValueError, e:
+            logger.info(e)
+            return self.bad_request
+
+        return self._cache_response(cache_key, self.valid_response(model_dict))
 
     def _get_instance(self, request):
         """
         Either retrieves the model instance requested, or upon failure
         treats the request as a custom request which is handled by the
         model.
+        Only requests for instances are coalesced, as custom requests can depend on the user.
         :param request: The request object
         :return: A dictionary representation of the model instance,
         the output of a custom request, or a 404 if both of these failed.
         """
-        model_instance = self._retrieve_model_instance()
+        response = self._coalesce(request, self._get_instance_response, short_dict=False)
 
-        if model_instance is None:
+        if response is None:
             return self.handle_custom_request(request)
 
-        return self.get_json_response_for_instance(model_instance, request.user)
+        return response
+
+    def _get_instance_response(self, request):
+        """
+        Handles a request for a model instance, serving it from the cache
+        if the endpoint's responses are cached.
+
+        :param request: The request object
+        :return: A dictionary representation of the model instance,
+        or None if the instance couldn't be found
+        """
+        validators = self._get_instance_validators(request)
+
+        if self._is_not_modified(request, validators):
+            return self.not_modified_response(validators)
+
+        cache_key = self._get_response_cache_key(request, short_dict=False)
+        response = self._get_cached_response(cache_key)
+
+        if response is not None:
+            return self._set_validators(response, validators)
+
+        fields = self._get_requested_fields(request)
+        expand = self._get_expanded_fields(request)
+
+        if self._caches_fragments():
+            response = self._get_instance_from_fragments(request, fields, expand)
+
+            if response is not None:
+                response = self._cache_response(cache_key, response)
+                return self._set_validators(response, validators)
+
+        model_instance = self._retrieve_model_instance(request.user, fields, expand, cached=True)
+
+        if model_instance is None:
+            return None
+
+        response = self._cache_response(cache_key, self.get_json_response_for_instance(model_instance, request.user, fields, expand))
+        return self._set_validators(response, validators)
+
+    def _get_requested_fields(self, request):
+        """
+        Gets the fields requested by the client as a comma separated 'fields' parameter,
+        e.g. /foo/?fields=id,f1
+
+        Fields are named as they appear in dictifications (i.e. without reserved prefixes).
+        Fields which don't exist, or which the user isn't allowed to read, are ignored.
+
+        :param request: the request object containing a potential fields parameter
+        :return: A frozenset of field names, or None if the client didn't request specific fields
+        """
+        fields = self._split_parameter(request, 'fields')
+
+        return None if fields is None else frozenset(fields)
+
+    def _get_expanded_fields(self, request):
+        """
+        Gets the relations the client asked to be dictified as a comma separated 'expand' parameter,
+        e.g. /foo/?expand=owner
+
+        Relations which aren't expanded are given as bare primary keys,
+        unless the view expands all relations (see expand_relations).
+
+        :param request: the request object containing a potential expand parameter
+        :return: A frozenset of relation names, or None if all relations are expanded
+        """
+        if self.expand_relations:
+            return None
+
+        return frozenset(self._split_parameter(request, 'expand') or ())
+
+    def _split_parameter(self, request, name):
+        """
+        Splits a comma separated query parameter into its values
+        :param request: the request object
+        :param name: The name of the parameter
+        :return: A list of the (non-empty) values, or None if the parameter wasn't given
+        """
+        value = request.GET.get(name)
+
+        if value is None:
+            return None
+
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    def _is_conditional_endpoint(self):
+        """
+        :return: Whether the endpoint's GET responses carry validators
+        """
+        return self.conditional_responses or self._endpoint_model in self.conditional_endpoints
+
+    def _get_page_validators(self, request):
+        """
+        Works out the validators of a page of instances from the instances' modification dates,
+        without reading the instances in full.
+
+        Pages don't carry a last modified date, as instances leaving the page (or moving into it)
+        don't make the latest modification date of the page's instances any later.
+
+        :param request: the request object containing a potential page parameter
+        :return: A tuple of (ETag, None), or None if the endpoint's responses
+        don't carry validators or the page is invalid
+        """
+        if not self._is_conditional_endpoint() or self._endpoint_model.cursor_pagination:
+            return None
+
+        try:
+            modifications = self._endpoint_model.get_page_modifications(request.GET.get('page', 1))
+        except (EmptyPage, PageNotAnInteger):
+            return None
+
+        return self._make_validators(request, modifications, short_dict=True, dated=False)
+
+    def _get_instance_validators(self, request):
+        """
+        Works out the validators of an instance from its modification date,
+        without reading the instance in full.
+
+        :param request: the request object
+        :return: A tuple of (ETag, last modified date), or None if the endpoint's responses
+        don't carry validators or the instance can't be found
+        """
+        if not self._is_conditional_endpoint():
+            return None
+
+        modification = self._endpoint_model.get_instance_modification(self._url_validator.REQUESTED_MODEL_INSTANCE)
+
+        if modification is None:
+            return None
+
+        return self._make_validators(request, [modification], short_dict=False)
+
+    def _make_validators(self, request, modifications, short_dict, dated=True):
+        """
+        Creates the validators of a response.
+
+        The ETag changes whenever an instance in the response is modified, or the fields the user
+        can see (or has requested) change (see APIModel.get_cache_tier()). As related models are dictified alongside
+        the instances, it also changes whenever any instance of a related model is saved.
+        Views which dictify the same instances differently (e.g. see expand_relations) give different ETags.
+
+        The last modified date is only given for endpoints without related models,
+        as it only reflects the modification of the instances themselves.
+
+        :param request: the request object
+        :param modifications: The modification tuples of the instances in the response
+        :param short_dict: Whether the response holds short or long dictifications
+        :param dated: Whether the response can carry a last modified date
+        :return: A tuple of (ETag, last modified date)
+        """
+        related_models = self._endpoint_model.get_dependent_models()[1:]
+        expand = self._get_expanded_fields(request)
+
+        etag = make_digest(
+            type(self).__module__,
+            type(self).__name__,
+            get_model_label(self._endpoint_model),
+            modifications,
+            get_model_versions(related_models) if related_models else None,
+            'short' if short_dict else 'long',
+            self._endpoint_model.get_cache_tier(request.user, short_dict),
+            sorted(self._get_requested_fields(request) or ()),
+            None if expand is None else sorted(expand)
+        )
+
+        dates_modified = [modification[-1] for modification in modifications]
+        last_modified = None
+
+        if dated and not related_models and dates_modified and None not in dates_modified:
+            last_modified = max(dates_modified)
+
+        return etag, last_modified
+
+    def _is_not_modified(self, request, validators):
+        """
+        Checks a conditional request against the current validators of the resource
+        :param request: the request object
+        :param validators: A tuple of (ETag, last modified date), or None
+        :return: True if the client's copy of the resource is still current
+        """
+        if validators is None:
+            return False
+
+        etag, last_modified = validators
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+
+        # If-None-Match takes precedence over If-Modified-Since
+        if if_none_match:
+            return etag in parse_etags(if_none_match) or if_none_match.strip() == '*'
+
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+
+        if if_modified_since is None or last_modified is None:
+            return False
+
+        return int(timegm(last_modified.utctimetuple())) <= if_modified_since
+
+    def _set_validators(self, response, validators):
+        """
+        Sets the validator headers on a successful (or not modified) response
+        :param response: The response object
+        :param validators: A tuple of (ETag, last modified date), or None
+        :return: The response object
+        """
+        if validators is not None and response.status_code in (StatusCode.OK, StatusCode.NOT_MODIFIED):
+            etag, last_modified = validators
+            response['ETag'] = quote_etag(etag)
+
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(timegm(last_modified.utctimetuple()))
+
+        return response
+
+    def not_modified_response(self, validators):
+        """
+        Shorthand for returning a 304 response with no body
+        :param validators: A tuple of (ETag, last modified date) of the unchanged resource
+        :return: HttpResponseNotModified object
+        """
+        return self._set_validators(HttpResponseNotModified(), validators)
+
+    def _get_response_cache_key(self, request, short_dict):
+        """
+        Creates the cache key for a GET response of the endpoint.
+
+        The key is made up of the view and endpoint, the instance and query parameters requested,
+        the relations expanded (see expand_relations), the fields the user is allowed to see
+        (see APIModel.get_cache_tier()), and the versions of the models which could appear
+        in the response, so that saving any of them invalidates the response.
+        Responses read from a replica are cached apart from those read from the primary,
+        so that users pinned to the primary (see APIDatabase.pin_to_primary()) see their own writes.
+
+        :param request: the request object
+        :param short_dict: Whether the response holds short or long dictifications
+        :return: The cache key, or None if the endpoint's responses aren't cached
+        """
+        if not (self.cache_responses or self._endpoint_model in self.cache_endpoints):
+            return None
+
+        if self.stream_responses or self._endpoint_model in self.streaming_endpoints:
+            return None
+
+        expand = self._get_expanded_fields(request)
+
+        return make_response_key(
+            type(self).__module__,
+            type(self).__name__,
+            get_read_database(),
+            get_model_label(self._endpoint_model),
+            get_model_versions(self._endpoint_model.get_dependent_models()),
+            self._url_validator.REQUESTED_MODEL_INSTANCE,
+            sorted(request.GET.lists()),
+            None if expand is None else sorted(expand),
+            'short' if short_dict else 'long',
+            self._endpoint_model.get_cache_tier(request.user, short_dict)
+        )
+
+    def _get_cached_response(self, cache_key):
+        """
+        Looks up a cached response
+        :param cache_key: The cache key of the response (or None)
+        :return: The cached response, or None if it wasn't found
+        """
+        if cache_key is None:
+            return None
+
+        cached_response = get_cache().get(cache_key)
+
+        if cached_response is None:
+            return None
+
+        content, content_type = cached_response
+        return HttpResponse(content=content, content_type=content_type)
+
+    def _cache_response(self, cache_key, response):
+        """
+        Caches a successful response
+        :param cache_key: The cache key of the response (or None if it shouldn't be cached)
+        :param response: The response object
+        :return: The response object
+        """
+        if cache_key is not None and response.status_code == StatusCode.OK and not response.streaming:
+            get_cache().set(cache_key, (response.content, response['Content-Type']), self.cache_timeout)
+
+        return response
+
+    def _caches_fragments(self):
+        """
+        Whether the endpoint's instances are served from fragments (see _get_fragment_key())
+        :return: True if the endpoint's fragments are cached
+        """
+        return self.cache_fragments or self._endpoint_model in self.fragment_cache_endpoints
+
+    def _get_fragment_key_parts(self, user, short_dict, fields, expand):
+        """
+        Works out the parts of a fragment's cache key which are shared by all the instances of a response
+        (see _get_fragment_key()), so that the versions of the related models are only looked up once per response.
+
+        :param user: The request user
+        :param short_dict: Whether the fragments are short or long dictifications
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: A tuple of the shared key parts
+        """
+        return (
+            get_read_database(),
+            get_model_label(self._endpoint_model),
+            get_model_versions(self._endpoint_model.get_dependent_models()[1:]),
+            'short' if short_dict else 'long',
+            self._endpoint_model.get_cache_tier(user, short_dict),
+            None if fields is None else sorted(fields),
+            None if expand is None else sorted(expand)
+        )
+
+    def _get_fragment_key(self, key_parts, pk, date_modified):
+        """
+        Creates the cache key for a fragment: the encoded dictification of a single instance.
+
+        The key is made up of the instance and its modification date, the fields the user is allowed
+        to see (see APIModel.get_cache_tier()), the fields and relations requested, and the versions
+        of the related models which could appear in the dictification. Saving (or deactivating)
+        the instance, or saving a related model, therefore invalidates the fragment.
+        As with responses, fragments read from a replica are cached apart from those read from the primary.
+
+        :param key_parts: The key parts shared by the instances of the response (see _get_fragment_key_parts())
+        :param pk: The primary key of the instance
+        :param date_modified: The modification date of the instance
+        :return: The cache key
+        """
+        return make_fragment_key(pk, date_modified, *key_parts)
+
+    def _get_page_from_fragments(self, request, page_number, fields, expand):
+        """
+        Serves a page of instances out of cached fragments. Only the instances whose fragments
+        aren't cached (or are out of date) are read in full, dictified and encoded.
+
+        :param request: the request object
+        :param page_number: The page number given to the paginator
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: A JSON list of short dictified model instances, or a 404 if the page was invalid
+        """
+        model = self._endpoint_model
+
+        try:
+            with phase('fetch'):
+                modifications = model.get_page_modifications(page_number)
+        except (EmptyPage, PageNotAnInteger), e:
+            logger.info(e)
+            return self.bad_request
+
+        key_parts = self._get_fragment_key_parts(request.user, True, fields, expand)
+        keys = dict((pk, self._get_fragment_key(key_parts, pk, date_modified)) for pk, date_modified in modifications)
+        fragments = get_cache().get_many(keys.values())
+        missing_ids = [pk for pk, key in keys.items() if key not in fragments]
+
+        if missing_ids:
+            backend = get_json_backend(self.json_backend)
+            with phase('fetch'):
+                objects = model.optimise_queryset(model.objects.filter(active=1), request.user, fields=fields, expand=expand)
+                objects = objects.in_bulk(missing_ids).values()
+
+            # instances deactivated since the page was read are left out
+            object_dicts = model.dictify_many(objects, request.user, fields=fields, expand=expand)
+
+            with phase('encode'):
+                new_fragments = dict((keys[object.pk], backend.dumps(object_dict)) for object, object_dict in zip(objects, object_dicts))
+
+            get_cache().set_many(new_fragments, self.cache_timeout)
+            fragments.update(new_fragments)
+
+        content = ','.join(fragments[keys[pk]] for pk, date_modified in modifications if keys[pk] in fragments)
+        return self.fragment_response('[' + content + ']')
+
+    def _get_instance_from_fragments(self, request, fields, expand):
+        """
+        Serves an instance out of its cached fragment, reading, dictifying and encoding
+        the instance if the fragment isn't cached (or is out of date).
+
+        :param request: the request object
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :return: A JSON long dictified model instance, or None if the instance couldn't be found
+        """
+        with phase('fetch'):
+            modification = self._endpoint_model.get_instance_modification(self._url_validator.REQUESTED_MODEL_INSTANCE)
+
+        if modification is None or not modification[1]:
+            return None
+
+        pk, active, date_modified = modification
+        key = self._get_fragment_key(self._get_fragment_key_parts(request.user, False, fields, expand), pk, date_modified)
+        fragment = get_cache().get(key)
+
+        if fragment is None:
+            model_instance = self._retrieve_model_instance(request.user, fields, expand, cached=True)
+
+            with phase('dictify'):
+                object_dict = None if model_instance is None else model_instance.dictify_with_auth(request.user, short_dict=False, fields=fields, expand=expand)
+
+            if object_dict is None:
+                return None
+
+            with phase('encode'):
+                fragment = get_json_backend(self.json_backend).dumps(object_dict)
+            get_cache().set(key, fragment, self.cache_timeout)
 
-    def _retrieve_model_instance(self):
+        return self.fragment_response(fragment)
+
+    def _retrieve_model_instance(self, user=None, fields=None, expand=None, cached=False):
         """
         Wrapper for retrieving a model instance from the request URL
+        :param user: The request user object, if the instance will be dictified for the user
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
+        :param cached: Whether the instance can be read from the instance cache, if the model
+        caches its instances (see APIModel.get_cached_instance()). Instances which will be updated
+        are always read from the database
         :return: Either the model instance, or None if the request was invalid
         """
+        rest_param = self._url_validator.REQUESTED_MODEL_INSTANCE
+
         try:
-            model_instance = self._endpoint_model.get_model_instance(self._url_validator.REQUESTED_MODEL_INSTANCE)
+            with phase('fetch'):
+                if user is None:
+                    # instances which will be updated are read as they are, without their related models
+                    model_instance = self._endpoint_model.get_model_instance(rest_param)
+                elif cached and self._endpoint_model.cache_instances:
+                    model_instance = self._endpoint_model.get_cached_instance(rest_param, user, fields, expand)
+                else:
+                    model_instance = self._endpoint_model.get_optimised_instance(rest_param, user, fields, expand)
             return model_instance
         except (ValueError, ObjectDoesNotExist), e:
             logger.info(e)
@@ -288,35 +1081,99 @@ class APIView(View):
         :param public_endpoints: A list of endpoints that can be created/updated
         (depending on the request type) without user authentication
         :param create: Whether or not the request is a CREATE (False == update)
-        :return: A json representation of the instance created/updated, or
-        a 404 if the request was bad
+        :return: A json representation of the instance created/updated,
+        a 409 if the instance has been changed by another request, or a 404 if the request was bad
         """
         if not request.user.is_authenticated() and self._endpoint_model not in public_endpoints:
             return self.bad_request
+
+        if create and request.META.get('CONTENT_TYPE', '').startswith('application/json'):
+            return self._bulk_create_handler(request)
+
         try:
             if create:
-                model_instance = self._endpoint_model.api_create(request)
+                with phase('write'):
+                    model_instance = self._endpoint_model.api_create(request)
             else:
                 model_instance = self._retrieve_model_instance()
-                model_instance = model_instance.api_update(request)
-        except KeyError, e:
+                with phase('write'):
+                    model_instance = model_instance.api_update(request)
+        except ConcurrentUpdate, e:
+            logger.info(e)
+            return self.conflict
+        except (KeyError, ValueError, ValidationError), e:
             logger.info(e)
             return self.bad_request
 
         if model_instance is None:
             return self.bad_request
 
-        return self.get_json_response_for_instance(model_instance, request.user)
+        return self.get_json_response_for_instance(model_instance, request.user, expand=self._get_expanded_fields(request))
 
-    def get_json_response_for_instance(self, model_instance, user):
+    def _bulk_create_handler(self, request):
+        """
+        Handles a create POST request whose body is a JSON array,
+        creating an instance for each object of the array (see APIModel.api_bulk_create()).
+
+        :param request: The request object
+        :return: A json list of the instances created, in the order of the array,
+        or a 404 if the request was bad
+        """
+        try:
+            items = json.loads(request.body)
+        except ValueError, e:
+            logger.info(e)
+            return self.bad_request
+
+        if not isinstance(items, list):
+            return self.bad_request
+
+        try:
+            model_instances = self._endpoint_model.api_bulk_create(request, items)
+        except (KeyError, ValueError, ValidationError), e:
+            logger.info(e)
+            return self.bad_request
+
+        if model_instances is None:
+            return self.bad_request
+
+        return self.valid_response(self._endpoint_model.dictify_many(model_instances, request.user, short_dict=False, expand=self._get_expanded_fields(request)))
+
+    def _bulk_update_handler(self, request):
+        """
+        Handles an update POST request for many instances at once,
+        given as a comma separated 'ids' parameter, e.g. /foo/?ids=1,2,3 (see APIModel.api_bulk_update()).
+
+        :param request: The request object
+        :return: A json list of the ids of the instances updated, or a 404 if the request was bad
+        """
+        if not request.user.is_authenticated() and self._endpoint_model not in self.public_update_endpoints:
+            return self.bad_request
+
+        try:
+            updated_ids = self._endpoint_model.api_bulk_update(request, self._split_parameter(request, 'ids'))
+        except (ValueError, ValidationError), e:
+            logger.info(e)
+            return self.bad_request
+
+        if updated_ids is None:
+            return self.bad_request
+
+        return self.valid_response(updated_ids)
+
+    def get_json_response_for_instance(self, model_instance, user, fields=None, expand=None):
         """
         A wrapper for getting a full json dictionary of a model instance.
 
         :param model_instance: The instance to dictify.
         :param user: The request user object
+        :param fields: The names of the fields requested by the client, or None for all the fields
+        :param expand: The names of the relations to dictify, or None to dictify all of them
         :return: A json representation of the model instnace
         """
-        model_instance_dict = model_instance.dictify_with_auth(user, short_dict=False)
+        with phase('dictify'):
+            model_instance_dict = model_instance.dictify_with_auth(user, short_dict=False, fields=fields, expand=expand)
+
         return self.valid_response(model_instance_dict)
 
     def _validate_request(self, request):
@@ -328,7 +1185,8 @@ class APIView(View):
         :param request: the request object
         :return: Boolean indicating the validity of the request
         """
-        self._url_validator = APIUrl(request)
+        with phase('route'):
+            self._url_validator = APIUrl(request, self.get_router())
 
         if not self._url_validator.is_valid_request():
             return False
@@ -336,13 +1194,29 @@ class APIView(View):
         if self._url_validator.is_reserved_url():
             return True
 
-        self._endpoint_model = self.registered_endpoints.get(self._url_validator.REQUESTED_MODEL, None)
+        self._endpoint_model = self._url_validator.ENDPOINT_MODEL
 
         if self._endpoint_model is None:
             return False
 
         return True
 
+    def get_router(self):
+        """
+        Gets the APIRouter built from the view's registered endpoints.
+        The router is built once and shared by the view's requests,
+        until registered_endpoints is replaced.
+
+        :return: An APIRouter
+        """
+        router = type(self).__dict__.get('_router')
+
+        if router is None or router[0] is not self.registered_endpoints:
+            router = (self.registered_endpoints, APIRouter(self.registered_endpoints))
+            setattr(type(self), '_router', router)
+
+        return router[1]
+
     @property
     def bad_request(self):
         """
@@ -351,13 +1225,38 @@ class APIView(View):
         """
         return BadJSONResponse(status=StatusCode.NOT_FOUND)
 
+    @property
+    def conflict(self):
+        """
+        Shorthand for returning a 409 (BadJSONResponse), when an update clashes with another request
+        :return: BadJSONResponse object
+        """
+        return BadJSONResponse(status=StatusCode.CONFLICT)
+
     def valid_response(self, data):
         """
         Shorthand for returning a 200 JSON response with some data
         :param data: the data to be json-ified
         :return: UnsafeJSONResponse object
         """
-        return UnsafeJSONResponse(data=data)
+        return UnsafeJSONResponse(data=data, backend=get_json_backend(self.json_backend))
+
+    def fragment_response(self, content):
+        """
+        Shorthand for returning a 200 JSON response whose content has already been encoded
+        :param content: the JSON content
+        :return: HttpResponse object
+        """
+        return HttpResponse(content=content, content_type='application/json')
+
+    def streaming_response(self, data):
+        """
+        Shorthand for returning a 200 JSON response which streams an iterable as a JSON array
+        :param data: the iterable to be json-ified
+        :return: StreamingJSONResponse object
+        """
+        # the data is read while the response is streamed, after the request has been handled
+        return StreamingJSONResponse(data=iterate_using(get_read_database(), data), backend=get_json_backend(self.json_backend))
 
     def _handle_reserved_url_request(self, request):
         """
@@ -366,16 +1265,12 @@ class APIView(View):
         :return: Either the response of the handler, or a 404
         if the request wasn't valid
         """
-        reserved_url = self._url_validator.RESERVED_URL
+        handler = self.reserved_url_handlers.get(self._url_validator.RESERVED_URL)
 
-        if reserved_url == ReservedURL.LOGIN:
-            return self.handle_login_request(request)
-        elif reserved_url == ReservedURL.LOGOUT:
-            return self.handle_logout_request(request)
-        elif reserved_url == ReservedURL.CSRFTOKEN:
-            return self.handle_csrf_request(request)
+        if handler is None:
+            return self.bad_request
 
-        return self.bad_request
+        return getattr(self, handler)(request)
 
     def handle_login_request(self, request):
         """
@@ -394,7 +1289,7 @@ class APIView(View):
             return self.bad_request
 
         login(request, user)
-        return self.get_json_response_for_instance(eval(self.return_on_login), user)
+        return self.get_json_response_for_instance(eval(self.return_on_login), user, expand=self._get_expanded_fields(request))
 
     def handle_logout_request(self, request):
         """
@@ -413,6 +1308,93 @@ class APIView(View):
         """
         return self.valid_response(None)
 
+    def handle_export_request(self, request):
+        """
+        Streams every active instance of an export endpoint as newline-delimited JSON.
+        Expects the URL to follow the structure: /api/export/<endpoint>/
+
+        :param request: the request object
+        :return: A streamed NDJSON response of long dictified instances,
+        or a 404 if the endpoint doesn't allow exporting
+        """
+        if len(self._url_validator.RESERVED_URL_FIELDS) != 1:
+            return self.bad_request
+
+        endpoint_model = self.registered_endpoints.get(self._url_validator.RESERVED_URL_FIELDS[0], None)
+
+        if endpoint_model is None or endpoint_model not in self.export_endpoints:
+            return self.bad_request
+
+        return NDJSONResponse(data=iterate_using(get_read_database(), endpoint_model.export_all(request.user)), backend=get_json_backend(self.json_backend))
+
+    def handle_batch_request(self, request):
+        """
+        Serves many GET requests in one round-trip.
+        Expects a 'requests' parameter holding a JSON list of URLs relative to the API root, e.g.
+        /api/batch/?requests=["foo/?page=2", "foo/1/?fields=id,f1", "qux/1/custom/"]
+
+        Each sub-request is dispatched in-process as a GET request by the same user,
+        so the user is only resolved once. Repeated sub-requests are only served once,
+        and cached responses are shared as usual.
+        Sub-requests can't be for reserved URLs, and are never streamed.
+
+        :param request: the request object
+        :return: A JSON list holding the 'status' and 'data' of each sub-request's response, in order,
+        or a 404 if the sub-requests couldn't be read (or there are more than max_batch_requests)
+        """
+        params = request.POST if request.method == 'POST' else request.GET
+
+        try:
+            urls = json.loads(params['requests'])
+        except (KeyError, ValueError), e:
+            logger.info(e)
+            return self.bad_request
+
+        if not isinstance(urls, list) or len(urls) > self.max_batch_requests or not all(isinstance(url, basestring) for url in urls):
+            return self.bad_request
+
+        api_root = request.path.split('/')[1]
+        responses = {}
+        results = []
+
+        for url in urls:
+            if url not in responses:
+                responses[url] = self._get_batch_response(request, api_root, url)
+
+            status, content = responses[url]
+            # sub-responses are already encoded, so are embedded as they are
+            results.append('{{"status": {}, "data": {}}}'.format(status, content))
+
+        return HttpResponse(content='[' + ','.join(results) + ']', content_type='application/json')
+
+    def _get_batch_response(self, request, api_root, url):
+        """
+        Dispatches a sub-request of a batch request
+        :param request: the batch request object
+        :param api_root: The first component of API URLs (e.g. 'api')
+        :param url: The sub-request's URL, relative to the API root
+        :return: A tuple of (status code, JSON content) of the sub-request's response
+        """
+        path, _, query_string = url.partition('?')
+
+        sub_request = copy(request)
+        sub_request.method = 'GET'
+        sub_request.path = sub_request.path_info = '/{}/{}'.format(api_root, path.lstrip('/'))
+        sub_request.GET = QueryDict(query_string)
+        sub_request.POST = QueryDict('')
+        # the batch's own conditional headers don't apply to its sub-requests
+        sub_request.META = dict((key, value) for key, value in request.META.items() if not key.startswith('HTTP_IF_'))
+
+        if APIUrl(sub_request, self.get_router()).is_reserved_url():
+            return StatusCode.NOT_FOUND, 'null'
+
+        sub_view = copy(self)
+        sub_view.stream_responses = False
+        sub_view.streaming_endpoints = ()
+        response = sub_view.get(sub_request)
+
+        return response.status_code, response.content or 'null'
+
     def handle_custom_request(self, request):
         """
         Dispatches a custom request to the endpoint model
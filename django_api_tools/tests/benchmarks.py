@@ -0,0 +1,47 @@
+import timeit
+from uuid import uuid4
+
+from django_api_tools.APIEncoder import available_json_backends
+from django_api_tools.tests.models import Foo, TestProfile
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+__author__ = 'szpytfire'
+
+
+class JSONBackendBenchmark(TestCase):
+    """
+    Compares the installed JSON backends on get_all() payloads.
+    Not run as part of the test suite; run with:
+
+    python manage.py test django_api_tools.tests.benchmarks
+    """
+
+    fixtures = ['user_testprofile_foo.json']
+
+    # The number of instances on each get_all() page
+    page_size = 1000
+    # The number of times each page is encoded
+    repeat = 20
+
+    def test_json_backends(self):
+        user = User.objects.get(id=1)
+        owner = TestProfile.objects.get(id=1)
+        Foo.objects.bulk_create([Foo(owner=owner, f2='foo') for i in range(self.page_size)])
+
+        Foo.pagination = self.page_size
+        try:
+            short_page = Foo.get_all(1, user)
+        finally:
+            del Foo.pagination
+
+        long_page = [foo.dictify_with_auth(user, short_dict=False) for foo in Foo.objects.filter(active=1)[:self.page_size]]
+        # values which aren't JSON types are converted before some backends can encode them
+        dated_page = [dict(foo_dict, date_modified=foo.date_modified, uuid=uuid4()) for foo, foo_dict in zip(Foo.objects.filter(active=1), long_page)]
+
+        print('')
+        for name, page in (('short', short_page), ('long', long_page), ('dated', dated_page)):
+            for backend in available_json_backends():
+                seconds = timeit.timeit(lambda: backend.dumps(page), number=self.repeat)
+                print('{:>10} {:>5} page of {}: {:.2f}ms per page'.format(backend.name, name, len(page), seconds * 1000 / self.repeat))
@@ -47,9 +47,16 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    },
+    # Only read from by the API when API_TOOLS_READ_DATABASE is set to 'replica'
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db_replica.sqlite3'),
     }
 }
 
+DATABASE_ROUTERS = ['django_api_tools.APIDatabase.ReplicaRouter']
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.6/topics/i18n/
 
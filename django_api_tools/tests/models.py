@@ -1,6 +1,7 @@
-from django_api_tools.APIModel import APIModel
+from django_api_tools.APIModel import APIModel, Increment
 
 from django.db import models
+from django.db.models import Q
 from django.core.validators import MaxLengthValidator
 from django.contrib.auth.models import User
 
@@ -25,6 +26,10 @@ class Foo(APIModel):
     registered_user_fields = ('f1', 'onetoone_short_owner')
     owner_only_fields = ('f2',)
 
+    bulk_create_fields = ('f1', 'f2')
+    bulk_update_fields = ('f1', )
+
+    atomic_operations = {'f1': Increment('f1')}
 
     short_description_fields = public_fields
     long_description_fields = public_fields + registered_user_fields + owner_only_fields
@@ -32,18 +37,27 @@ class Foo(APIModel):
     def is_owner(self, request_user):
         return request_user.test_profile == self.owner
 
+    @classmethod
+    def owned_ids(cls, user, objects):
+        return Foo.objects.filter(id__in=[foo.id for foo in objects], owner__user=user).values_list('id', flat=True)
+
+    @classmethod
+    def owner_q(cls, user):
+        return Q(owner__user=user)
+
     @classmethod
     def api_create(cls, request):
         foo = Foo.objects.create(owner=request.user.test_profile, f2=request.POST['f2'])
         return foo
 
+    @classmethod
+    def api_bulk_create(cls, request, items):
+        return cls.create_in_bulk(items, owner=request.user.test_profile)
+
     def api_update(self, request):
         if not self.is_owner(request.user):
             return None
 
-        if request.POST.get('f1'):
-            self.f1 += 1
-
         return super(Foo, self).api_update(request)
 
 class BarBaz(APIModel):
@@ -51,6 +65,8 @@ class BarBaz(APIModel):
     public_fields = ('id',)
     registered_user_fields = ()
 
+    atomic_operations = {'f1': Increment('f1')}
+
     short_description_fields = public_fields
     long_description_fields = public_fields + registered_user_fields
 
@@ -66,9 +82,6 @@ class BarBaz(APIModel):
         if not self.is_owner(request.user):
             return None
 
-        if request.POST.get('f1'):
-            self.f1 += 1
-
         return super(BarBaz, self).api_update(request)
 
     class Meta:
@@ -76,8 +89,13 @@ class BarBaz(APIModel):
 
 class Bar(BarBaz):
     baz = models.ForeignKey('Baz', related_name='bars')
+    version = models.IntegerField(default=0)
     registered_user_fields = ('f1', 'fk_short_baz')
 
+    version_field = 'version'
+
+    cursor_pagination = True
+
 class Baz(BarBaz):
     registered_user_fields = ('f1', 'rel_short_bars')
 
@@ -85,6 +103,11 @@ class Qux(BarBaz):
     owner = models.ForeignKey(Baz, related_name='quxs')
     foos = models.ManyToManyField(Foo)
 
+    public_fields = ('id', 'fk_short_owner', 'm2m_short_foos')
+
+    short_description_fields = public_fields
+    long_description_fields = public_fields
+
     @classmethod
     def api_custom_request(cls, request):
         return "yo!"
\ No newline at end of file
@@ -1,15 +1,31 @@
 import json
-
-from django_api_tools.APIModel import APIModel, UserAuthCode
-from django_api_tools.APIView import APIUrl, ReservedURL, StatusCode
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from uuid import uuid4
+
+from django_api_tools.APICache import LocalCache, SingleFlight, get_cache
+from django_api_tools.APIDatabase import use_read_database
+from django_api_tools.APIEncoder import APIJSONEncoder, UltraJSONBackend, available_json_backends, get_json_backend
+from django_api_tools.APIModel import APIModel, ConcurrentUpdate, Increment, InvalidCursor, SetIf, UserAuthCode
+from django_api_tools.APIView import APIRouter, APIUrl, ReservedURL, StatusCode
 from django_api_tools.tests.models import Foo, Bar, Baz, Qux, TestProfile
 from django_api_tools.tests.views import TestAPIView
 
+from django.db import connections
+from django.db.models import F, Prefetch
+from django.db.models.signals import post_init
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
 from django.test.client import RequestFactory, Client
 from django.contrib.auth.models import AnonymousUser, User
-from django.core.paginator import EmptyPage, PageNotAnInteger
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 
 __author__ = 'szpytfire'
 
@@ -141,6 +157,25 @@ class APIModelTestCase(APIToolsTestCase):
         self.assertEqual(len(dictified_qux['foos']), qux.foos.all().count())
         self.assertDictKeysEqual(dictified_qux['foos'][0], self.remove_foreign_key_fields(qux.foos.all()[0].short_description_fields + qux.foos.all()[0].long_description_fields))
 
+    def test_get_serialization_plan(self):
+        # Test the related field prefixes and relation names are resolved
+        fields = ('id', 'fk_short_baz', 'rel_long_bars', 'f1')
+        plan = Bar.compile_serialization_plan(fields, fields, False)
+        self.assertEqual(plan, (('id', False, False, False), ('baz', True, False, True), ('bars', True, True, False), ('f1', False, False, False)))
+
+        # Test related fields are left out of the plan when ommitting related fields
+        plan = Bar.compile_serialization_plan(fields, fields, True)
+        self.assertEqual(plan, (('id', False, False, False), ('f1', False, False, False)))
+
+        # Test fields outside of the auth level are left out of the plan
+        self.assertEqual(Foo.get_serialization_plan(False, UserAuthCode.PUBLIC, False), (('id', False, False, False), ))
+        self.assertEqual(len(Foo.get_serialization_plan(False, UserAuthCode.OWNER, False)), 4)
+
+        # Test plans are cached per model class
+        plan = Foo.get_serialization_plan(True, UserAuthCode.OWNER, False)
+        self.assertIs(plan, Foo.get_serialization_plan(True, UserAuthCode.OWNER, False))
+        self.assertNotIn('_serialization_plans', APIModel.__dict__)
+
     def test_dictify_short(self):
         # Test that the method only returns the short description fields
         foo = Foo.objects.get(id=1)
@@ -206,6 +241,294 @@ class APIModelTestCase(APIToolsTestCase):
         with self.assertRaises(PageNotAnInteger):
             Bar.get_all("foo", user)
 
+    def test_get_all_fields(self):
+        owner = User.objects.get(id=1)
+
+        def deferred_columns(instance):
+            return set(field.attname for field in Foo._meta.concrete_fields if field.attname not in instance.__dict__)
+
+        # Test columns which aren't in the short dictification aren't read
+        deferred = set(Foo.get_deferrable_fields(True, UserAuthCode.OWNER))
+        self.assertEqual(deferred, set(['f1', 'f2']))
+        foo = Foo.optimise_queryset(Foo.objects.filter(active=1), owner)[0]
+        self.assertEqual(deferred_columns(foo), deferred)
+
+        # Test requested fields are intersected with the fields the user is allowed to read
+        foo = Foo.get_optimised_instance(1, owner)
+        self.assertEqual(set(foo.dictify_with_auth(owner, short_dict=False, fields=frozenset(['f2', 'owner', 'nonexistent']))), set(['f2', 'owner']))
+        self.assertEqual(set(Foo.objects.get(id=1).dictify_with_auth(User.objects.get(id=2), short_dict=False, fields=frozenset(['f2', 'owner']))), set(['owner']))
+        page = Foo.get_all(1, AnonymousUser(), fields=frozenset(['id', 'f2']))
+        self.assertEqual(page, Foo.get_all(1, AnonymousUser()))
+
+        # Test only the columns of the requested fields are read
+        foo = Foo.get_optimised_instance(1, owner, fields=frozenset(['id', 'f1']))
+        self.assertEqual(deferred_columns(foo), set(['f2']))
+        with self.assertNumQueries(0):
+            self.assertEqual(foo.dictify_with_auth(owner, short_dict=False, fields=frozenset(['id', 'f1'])), {'id': 1, 'f1': foo.f1})
+
+        # Test unrequested relations aren't joined
+        self.assertEqual(Foo.get_related_lookups(False, UserAuthCode.OWNER, frozenset(['id'])), ((), ()))
+
+        # Test instances retrieved without requested fields are read in full, as they may be updated
+        self.assertEqual(deferred_columns(Foo.get_optimised_instance(1, owner)), set())
+
+        # Test models can opt out of deferring columns
+        Foo.defer_unused_fields = False
+        try:
+            self.assertEqual(Foo.get_deferrable_fields(True, UserAuthCode.OWNER), ())
+        finally:
+            del Foo.defer_unused_fields
+
+    def test_get_all_values(self):
+        users = (AnonymousUser(), User.objects.get(id=1), User.objects.get(id=2))
+        requests = (
+            (None, None),
+            (None, frozenset()),
+            (frozenset(['id', 'owner']), frozenset()),
+            (frozenset(['id', 'owner']), frozenset(['owner'])),
+            (frozenset(['f1', 'nonexistent']), None)
+        )
+
+        # Test pages served from values_list() rows are the same as pages of dictified instances
+        for model in (TestProfile, Foo, Bar, Baz, Qux):
+            for user in users:
+                for fields, expand in requests:
+                    objects = model.optimise_queryset(model.objects.filter(active=1), user, fields=fields, expand=expand)
+                    page = Paginator(objects, model.pagination).page(1).object_list
+                    self.assertEqual(model.get_all(1, user, fields, expand), model.dictify_many(page, user, fields=fields, expand=expand))
+
+        # Test pages only reading columns don't instantiate the instances
+        user = users[1]
+        self.assertEqual(Foo.get_column_plan(True, user), (('id', 'id'),))
+        self.assertEqual(Qux.get_column_plan(True, user, frozenset(['id', 'owner']), frozenset()), (('id', 'id'), ('owner', 'owner_id')))
+        instantiated = []
+        def count_instances(sender, instance, **kwargs):
+            instantiated.append(instance)
+
+        post_init.connect(count_instances, sender=Foo)
+        try:
+            with self.assertNumQueries(2):
+                self.assertEqual(len(Foo.get_all(1, user)), Foo.pagination)
+        finally:
+            post_init.disconnect(count_instances, sender=Foo)
+        self.assertEqual(instantiated, [])
+
+        # Test pages reading properties, related models or fields only owners can read aren't served from rows
+        self.assertIsNone(Qux.get_column_plan(True, user))
+        self.assertIsNone(Qux.get_column_plan(True, user, expand=frozenset(['owner'])))
+        self.assertIsNone(Foo.get_column_plan(False, user))
+        self.assertEqual(Foo.get_column_plan(False, AnonymousUser()), (('id', 'id'),))
+
+    def test_get_many(self):
+        user = User.objects.get(id=1)
+        deactivated_foo = Foo.objects.filter(active=0)[0]
+
+        # Test instances are long dictified in the order requested, in a constant number of queries:
+        # instances (joined with the owner) + the user's profile, resolving ownership of the owners
+        with self.assertNumQueries(2):
+            dictified_foos = Foo.get_many(['3', '1', str(deactivated_foo.id), '1000', '2'], user)
+        expected = [Foo.objects.get(id=id).dictify_with_auth(user, short_dict=False) for id in (3, 1)]
+        self.assertEqual(dictified_foos, expected + [None, None, Foo.objects.get(id=2).dictify_with_auth(user, short_dict=False)])
+
+        # Test invalid ids and too many ids raise a ValueError
+        with self.assertRaises(ValueError):
+            Foo.get_many(['foo'], user)
+        with self.assertRaises(ValueError):
+            Foo.get_many(['1'] * (Foo.max_requested_ids + 1), user)
+
+    def test_get_all_by_cursor(self):
+        user = User.objects.get(id=1)
+        baz = Baz.objects.get(id=1)
+        for i in range(Bar.pagination * 2):
+            Bar.objects.create(baz=baz)
+        bar_ids = list(Bar.objects.filter(active=1).order_by('id').values_list('id', flat=True))
+
+        # Test the first page has no previous page and doesn't count the instances
+        with self.assertNumQueries(1):
+            page = Bar.get_all_by_cursor(None, user)
+        self.assertEqual([bar['id'] for bar in page['results']], bar_ids[:Bar.pagination])
+        self.assertIsNone(page['prev'])
+
+        # Test following the next cursor gives back the next page
+        page = Bar.get_all_by_cursor(page['next'], user)
+        self.assertEqual([bar['id'] for bar in page['results']], bar_ids[Bar.pagination:Bar.pagination * 2])
+
+        # Test the last page has no next page
+        last_page = Bar.get_all_by_cursor(page['next'], user)
+        self.assertEqual([bar['id'] for bar in last_page['results']], bar_ids[Bar.pagination * 2:])
+        self.assertIsNone(last_page['next'])
+
+        # Test following the prev cursor gives back the previous page
+        prev_page = Bar.get_all_by_cursor(last_page['prev'], user)
+        self.assertEqual(prev_page['results'], page['results'])
+        self.assertEqual(prev_page['next'], page['next'])
+
+        # Test walking back to the first page has no previous page
+        first_page = Bar.get_all_by_cursor(prev_page['prev'], user)
+        self.assertEqual([bar['id'] for bar in first_page['results']], bar_ids[:Bar.pagination])
+        self.assertIsNone(first_page['prev'])
+
+        # Test invalid cursors raise the expected exception
+        with self.assertRaises(InvalidCursor):
+            Bar.get_all_by_cursor("foo", user)
+
+        with self.assertRaises(InvalidCursor):
+            Bar.get_all_by_cursor(Bar.encode_cursor("foo", False), user)
+
+    def test_dictify_many(self):
+        owner = User.objects.get(id=1)
+        not_owner = User.objects.get(id=2)
+        public_user = AnonymousUser()
+        foos = list(Foo.objects.all())
+        active_foos = [foo for foo in foos if foo.active]
+
+        # Test the dictifications match dictify_with_auth, leaving out deactivated instances
+        for user in (owner, not_owner, public_user):
+            for short_dict in (True, False):
+                self.assertEqual(Foo.dictify_many(foos, user, short_dict=short_dict), [foo.dictify_with_auth(user, short_dict=short_dict) for foo in active_foos])
+
+        # Test ownership is resolved with a single query for the whole list
+        with self.assertNumQueries(1):
+            Foo.dictify_many(foos, owner, short_dict=False, ommit_related_fields=True)
+
+        # Test authentication is resolved without queries for the public
+        with self.assertNumQueries(0):
+            Foo.dictify_many(foos, public_user, short_dict=False, ommit_related_fields=True)
+
+        # Test models without owned_ids() fall back to is_owner()
+        bars = list(Bar.objects.all())
+        self.assertEqual(Bar.resolve_user_auths(owner, bars), dict((bar.id, UserAuthCode.OWNER) for bar in bars))
+
+    def test_annotate_ownership(self):
+        owner = User.objects.get(id=1)
+        not_owner = User.objects.get(id=2)
+        public_user = AnonymousUser()
+
+        # Test instances are annotated with the user's ownership
+        foos = Foo.annotate_ownership(Foo.objects.all(), owner)
+        self.assertTrue(all(foo._is_owner for foo in foos))
+        foos = Foo.annotate_ownership(Foo.objects.all(), not_owner)
+        self.assertFalse(any(foo._is_owner for foo in foos))
+
+        # Test querysets are left untouched for the public and models without owner_q()
+        self.assertFalse(hasattr(Foo.annotate_ownership(Foo.objects.all(), public_user)[0], '_is_owner'))
+        self.assertFalse(hasattr(Bar.annotate_ownership(Bar.objects.all(), owner)[0], '_is_owner'))
+
+        # Test get_all reads the ownership annotation instead of resolving ownership: count + page
+        with self.assertNumQueries(2):
+            dictified_foos = Foo.get_all(1, owner)
+        self.assertEqual(dictified_foos, [foo.dictify_with_auth(owner) for foo in Foo.objects.filter(active=1)[:Foo.pagination]])
+
+        # Test set_user_auth reads the annotation instead of calling is_owner()
+        foo = Foo.get_optimised_instance(1, not_owner)
+        with self.assertNumQueries(0):
+            foo.set_user_auth(not_owner)
+        self.assertEqual(foo._user_auth, UserAuthCode.REGISTERED_USER)
+
+        foo = Foo.get_optimised_instance(1, owner)
+        foo.set_user_auth(owner)
+        self.assertEqual(foo._user_auth, UserAuthCode.OWNER)
+
+    def test_iter_all(self):
+        user = User.objects.get(id=1)
+        baz = Baz.objects.get(id=1)
+        for i in range(5):
+            Qux.objects.create(owner=baz).foos.add(*Foo.objects.all())
+
+        # Test the lazy dictifications match get_all
+        self.assertEqual(list(Foo.iter_all(1, user)), Foo.get_all(1, user))
+        self.assertEqual(list(Qux.iter_all(1, user)), Qux.get_all(1, user))
+
+        # Test related models are prefetched once per chunk: count + page + foos prefetch per chunk
+        with self.assertNumQueries(3):
+            list(Qux.iter_all(1, user))
+
+        Qux.iterator_chunk_size = 2
+        try:
+            with self.assertNumQueries(5):
+                dictified_quxs = list(Qux.iter_all(1, user))
+            self.assertEqual(dictified_quxs, Qux.get_all(1, user))
+        finally:
+            del Qux.iterator_chunk_size
+
+        # Test invalid page numbers raise the expected exceptions straight away
+        with self.assertRaises(EmptyPage):
+            Bar.iter_all(2, user)
+
+        with self.assertRaises(PageNotAnInteger):
+            Bar.iter_all("foo", user)
+
+    def test_export_all(self):
+        user = User.objects.get(id=1)
+        active_foos = Foo.objects.filter(active=1).order_by('id')
+
+        # Test every active instance is long dictified
+        self.assertEqual(list(Foo.export_all(user)), [foo.dictify_with_auth(user, short_dict=False) for foo in active_foos])
+
+        # Test instances are read in chunks (with the owner joined and ownership annotated)
+        Foo.iterator_chunk_size = 3
+        try:
+            with self.assertNumQueries((active_foos.count() + 2) // 3):
+                dictified_foos = list(Foo.export_all(user))
+        finally:
+            del Foo.iterator_chunk_size
+        self.assertEqual(len(dictified_foos), active_foos.count())
+
+    def test_get_all_related_queries(self):
+        public_user = AnonymousUser()
+        baz = Baz.objects.get(id=1)
+        deactivated_foo = Foo.objects.filter(active=0)[0]
+
+        # Test the related models of a page are fetched in bulk:
+        # count + page (joined with the owner) + foos prefetch
+        qux = Qux.objects.get(id=1)
+        qux.foos.add(*Foo.objects.all())
+        with self.assertNumQueries(3):
+            dictified_quxs = Qux.get_all(1, public_user)
+        self.assertEqual(dictified_quxs[0]['owner'], {'id': baz.id})
+
+        # Test deactivated related models are left out
+        self.assertEqual(len(dictified_quxs[0]['foos']), Foo.objects.filter(active=1).count())
+        self.assertNotIn({'id': deactivated_foo.id}, dictified_quxs[0]['foos'])
+
+        # Test the number of queries doesn't grow with the size of the page
+        for i in range(5):
+            Qux.objects.create(owner=baz).foos.add(*Foo.objects.all())
+        with self.assertNumQueries(3):
+            Qux.get_all(1, public_user)
+
+        # Test ownership of the related models is resolved for the whole page
+        # by the prefetch query: count + page + foos prefetch
+        user = User.objects.get(id=1)
+        with self.assertNumQueries(3):
+            dictified_quxs = Qux.get_all(1, user)
+        self.assertEqual(dictified_quxs[0]['foos'], [foo.dictify_with_auth(user) for foo in Foo.objects.filter(active=1)])
+
+        # Test get_optimised_instance fetches related models in bulk
+        with self.assertNumQueries(2):
+            Qux.get_optimised_instance(qux.id, public_user).dictify_with_auth(public_user, short_dict=False)
+
+        # Test relations which aren't expanded are given as primary keys, reading foreign keys
+        # from their column: count + page (without joining the owner) + foo ids prefetch
+        active_foo_ids = list(Foo.objects.filter(active=1).values_list('id', flat=True))
+        with self.assertNumQueries(3):
+            dictified_quxs = Qux.get_all(1, user, expand=frozenset())
+        self.assertEqual(dictified_quxs[0], {'id': qux.id, 'owner': baz.id, 'foos': active_foo_ids})
+        self.assertEqual(Qux.get_related_lookups(True, UserAuthCode.OWNER, expand=frozenset()), ((), (('foos', Foo),)))
+
+        # Test expanded relations are still dictified alongside collapsed ones
+        dictified_quxs = Qux.get_all(1, user, expand=frozenset(['owner']))
+        self.assertEqual(dictified_quxs[0]['owner'], {'id': baz.id})
+        self.assertEqual(dictified_quxs[0]['foos'], active_foo_ids)
+
+        # Test reverse relations which aren't expanded only read the related models' keys
+        self.assertEqual(Baz.get_related_key_fields('bars'), ('id', 'active', 'baz'))
+        active_bar_ids = list(Bar.objects.filter(baz=baz, active=1).values_list('id', flat=True))
+        with self.assertNumQueries(2):
+            bars = Bar.objects.filter(active=1).only(*Baz.get_related_key_fields('bars'))
+            baz = Baz.objects.prefetch_related(Prefetch('bars', queryset=bars)).get(id=baz.id)
+            self.assertEqual(baz.get_related_pks('bars', True), active_bar_ids)
+
     def test_get_model_instance(self):
         # Test getting a Foo object with a valid ID
         valid_foo_id = 1
@@ -221,6 +544,219 @@ class APIModelTestCase(APIToolsTestCase):
         with self.assertRaises(ObjectDoesNotExist):
             Foo.objects.get(id=20)
 
+    def test_get_cached_instance(self):
+        get_cache().clear()
+        owner = User.objects.get(id=1)
+        Foo.cache_instances = Baz.cache_instances = True
+        Foo.get_local_instance_cache().clear()
+
+        try:
+            # Test instances are read from the database once, then from process memory
+            with self.assertNumQueries(1):
+                foo = Foo.get_cached_instance('1')
+            with self.assertNumQueries(0):
+                self.assertEqual(Foo.get_cached_instance(1).f2, foo.f2)
+
+            # Test instances are read from the API cache once process memory has lost them
+            Foo.get_local_instance_cache().clear()
+            with self.assertNumQueries(0):
+                self.assertEqual(Foo.get_cached_instance(1).f2, foo.f2)
+
+            # Test each lookup gets its own copy
+            foo.f2 = 'not saved'
+            self.assertNotEqual(Foo.get_cached_instance(1).f2, 'not saved')
+
+            # Test saving, updating or deactivating an instance removes it from the cache
+            foo.save()
+            self.assertEqual(Foo.get_cached_instance(1).f2, 'not saved')
+            foo.save_changes({'f1': F('f1') + 1})
+            self.assertEqual(Foo.get_cached_instance(1).f1, foo.f1)
+            Foo.update_in_bulk(owner, [1], active=0)
+            self.assertEqual(Foo.get_cached_instance(1).active, 0)
+
+            # Test missing ids are cached, until an instance is created with the id
+            with self.assertNumQueries(1):
+                self.assertRaises(ObjectDoesNotExist, Foo.get_cached_instance, 1000)
+            with self.assertNumQueries(0):
+                self.assertRaises(ObjectDoesNotExist, Foo.get_cached_instance, 1000)
+            Foo.objects.create(id=1000, owner=foo.owner, f2='new')
+            self.assertEqual(Foo.get_cached_instance(1000).f2, 'new')
+
+            # Test invalid ids raise a ValueError
+            with self.assertRaises(ValueError):
+                Foo.get_cached_instance('foo')
+
+            # Test the related models to be dictified are prefetched
+            baz = Baz.get_cached_instance(1, owner, expand=frozenset(['bars']))
+            with self.assertNumQueries(0):
+                baz_dict = baz.dictify_with_auth(owner, short_dict=False, expand=frozenset(['bars']))
+            self.assertEqual(baz_dict, Baz.objects.get(id=1).dictify_with_auth(owner, short_dict=False, expand=frozenset(['bars'])))
+        finally:
+            del Foo.cache_instances, Baz.cache_instances
+            Foo.get_local_instance_cache().clear()
+            Baz.get_local_instance_cache().clear()
+
+        # Test the least recently used entries are evicted from process memory
+        local_cache = LocalCache(2)
+        local_cache.set('a', 1, 60)
+        local_cache.set('b', 2, 60)
+        self.assertEqual(local_cache.get('a'), 1)
+        local_cache.set('c', 3, 60)
+        self.assertEqual((local_cache.get('a'), local_cache.get('b'), local_cache.get('c')), (1, None, 3))
+        local_cache.set('a', 1, -1)
+        self.assertIsNone(local_cache.get('a'))
+
+    def test_save_changes(self):
+        foo = Foo.objects.get(id=1)
+
+        # Test nothing is written if nothing has changed
+        self.assertEqual(foo.get_changed_fields(), [])
+        with self.assertNumQueries(0):
+            self.assertFalse(foo.save_changes())
+
+        # Test only the changed fields (and the date modified) are written
+        foo.f1 += 1
+        self.assertEqual(foo.get_changed_fields(), ['f1'])
+        with self.assertNumQueries(1) as context:
+            self.assertTrue(foo.save_changes())
+        sql = context.captured_queries[0]['sql']
+        self.assertIn('"f1"', sql)
+        self.assertIn('"date_modified"', sql)
+        self.assertNotIn('"f2"', sql)
+        self.assertEqual(Foo.objects.get(id=1).f1, foo.f1)
+        self.assertIsNotNone(Foo.objects.get(id=1).date_modified)
+
+        # Test saved changes aren't written again
+        self.assertEqual(foo.get_changed_fields(), [])
+        foo.f2 = 'changed'
+        foo.save(update_fields=['f1'])
+        self.assertEqual(foo.get_changed_fields(), ['f2'])
+
+        # Test fields saved by their attribute name are recorded
+        foo.owner_id = 2
+        foo.save(update_fields=['owner_id'])
+        self.assertEqual(foo.get_changed_fields(), ['f2'])
+        self.assertEqual(Foo.objects.get(id=1).owner_id, 2)
+
+        # Test deferred fields which have been set are treated as changed
+        foo = Foo.objects.defer('f2').get(id=1)
+        self.assertEqual(foo.get_changed_fields(), [])
+        foo.f2 = 'changed'
+        self.assertEqual(foo.get_changed_fields(), ['f2'])
+
+        # Test new instances are saved in full
+        foo = Foo(owner=foo.owner, f2='new')
+        self.assertTrue(foo.save_changes())
+        self.assertEqual(Foo.objects.get(id=foo.id).f2, 'new')
+
+    def test_atomic_updates(self):
+        owner = User.objects.get(id=1)
+        request = RequestFactory().post('/test_api/foo/1/', data={'f1': True})
+        request.user = owner
+
+        # Test increments made from stale instances aren't lost
+        foo, stale_foo = Foo.objects.get(id=1), Foo.objects.get(id=1)
+        f1 = foo.f1
+        self.assertTrue(foo.is_owner(owner))
+        with self.assertNumQueries(2):
+            foo.api_update(request)
+        stale_foo.api_update(request)
+        self.assertEqual((foo.f1, stale_foo.f1, Foo.objects.get(id=1).f1), (f1 + 1, f1 + 2, f1 + 2))
+        self.assertEqual(stale_foo.get_changed_fields(), [])
+
+        # Test changes to a versioned instance are only written if its version hasn't changed
+        bar, stale_bar = Bar.objects.get(id=1), Bar.objects.get(id=1)
+        bar.f1 = 10
+        self.assertTrue(bar.save_changes())
+        self.assertEqual(bar.version, 1)
+        stale_bar.f1 = 20
+        with self.assertRaises(ConcurrentUpdate):
+            stale_bar.save_changes()
+        self.assertEqual(Bar.objects.get(id=1).f1, 10)
+
+        # Test atomic operations on a versioned instance don't conflict, but bump the version
+        stale_bar = Bar.objects.get(id=1)
+        stale_bar.save_changes({'f1': F('f1') + 1})
+        bar.save_changes({'f1': F('f1') + 1})
+        self.assertEqual((bar.f1, bar.version), (12, 3))
+        self.assertEqual(Bar.objects.filter(id=1, f1=12, version=3).count(), 1)
+
+        # Test bulk updates bump the version, so that updates from clients holding the earlier version conflict
+        Bar.update_in_bulk(owner, ['1'], f1=42)
+        self.assertEqual(Bar.objects.get(id=1).version, 4)
+        request = RequestFactory().post('/test_api/bar/1/', data={'version': '3'})
+        request.user = owner
+        with self.assertRaises(ConcurrentUpdate):
+            Bar.objects.get(id=1).api_update(request)
+        self.assertEqual(Bar.objects.get(id=1).f1, 42)
+
+        # Test operations compile to F() expressions and lookups
+        changes, lookups = Increment('f1', amount=None).compile(Foo, '5')
+        self.assertEqual(lookups, {})
+        Foo.objects.filter(id=2).update(**changes)
+        self.assertEqual(Foo.objects.get(id=2).f1, 6)
+        with self.assertRaises(ValueError):
+            Increment('f1', amount=None).compile(Foo, 'foo')
+
+        # Test set-if only writes the value if the row matches
+        foo = Foo.objects.get(id=2)
+        changes, lookups = SetIf('f2', f1=6).compile(Foo, 'set')
+        foo.save_changes(changes, **lookups)
+        self.assertEqual(Foo.objects.get(id=2).f2, 'set')
+        with self.assertRaises(ConcurrentUpdate):
+            changes, lookups = SetIf('f2', f1=7).compile(Foo, 'not set')
+            foo.save_changes(changes, **lookups)
+        self.assertEqual(Foo.objects.get(id=2).f2, 'set')
+        with self.assertRaises(ValidationError):
+            SetIf('f2', f1=6).compile(Foo, 'far too long')
+
+    def test_create_in_bulk(self):
+        owner = TestProfile.objects.get(id=1)
+        foo_count = Foo.objects.count()
+
+        # Test instances are created from the items, with the defaults given
+        foos = Foo.create_in_bulk([{'f2': 'a'}, {'f1': 5, 'f2': 'b'}], owner=owner)
+        self.assertEqual([(foo.f1, foo.f2, foo.owner_id) for foo in foos], [(1, 'a', owner.id), (5, 'b', owner.id)])
+        self.assertEqual([Foo.objects.get(id=foo.id).f2 for foo in foos], ['a', 'b'])
+
+        # Test items are validated before any instance is created
+        with self.assertRaises(ValidationError):
+            Foo.create_in_bulk([{'f2': 'c'}, {'f2': 'far too long'}], owner=owner)
+        with self.assertRaises(ValidationError):
+            Foo.create_in_bulk([{'f1': 2}], owner=owner)
+        with self.assertRaises(KeyError):
+            Foo.create_in_bulk([{'f2': 'c'}, {'f2': 'd', 'active': 0}], owner=owner)
+        with self.assertRaises(ValueError):
+            Foo.create_in_bulk(['c'], owner=owner)
+        self.assertEqual(Foo.objects.count(), foo_count + 2)
+
+        # Test models without bulk_create_fields don't allow bulk creation
+        self.assertIsNone(Bar.api_bulk_create(None, [{'f1': 1}]))
+
+    def test_update_in_bulk(self):
+        owner = User.objects.get(id=1)
+        not_owner = User.objects.get(id=2)
+        Foo.objects.filter(id=3).update(owner=TestProfile.objects.get(id=2))
+
+        # Test only the active instances the user owns are updated, with a single UPDATE:
+        # savepoint + owned ids + update + release savepoint
+        with self.assertNumQueries(4):
+            updated_ids = Foo.update_in_bulk(owner, ['1', '2', '3', '11', '1000'], f1=7)
+        self.assertEqual(sorted(updated_ids), [1, 2])
+        self.assertEqual(list(Foo.objects.filter(f1=7).order_by('id').values_list('id', flat=True)), [1, 2])
+        self.assertIsNotNone(Foo.objects.get(id=1).date_modified)
+        self.assertIsNone(Foo.objects.get(id=4).date_modified)
+
+        # Test ownership is resolved with is_owner() if the model doesn't implement owner_q()
+        self.assertEqual(TestProfile.update_in_bulk(not_owner, ['1', '2'], active=0), [2])
+        self.assertEqual(TestProfile.update_in_bulk(AnonymousUser(), ['1'], active=0), [])
+
+        # Test invalid ids and too many ids raise a ValueError
+        with self.assertRaises(ValueError):
+            Foo.update_in_bulk(owner, ['foo'], f1=7)
+        with self.assertRaises(ValueError):
+            Foo.update_in_bulk(owner, ['1'] * (Foo.max_requested_ids + 1), f1=7)
+
 class APIViewTestCase(APIToolsTestCase):
 
     fixtures = ['user_testprofile_foo.json', 'bar_baz_qux.json']
@@ -283,14 +819,12 @@ class APIViewTestCase(APIToolsTestCase):
         user = User.objects.get(id=1)
 
         # Test post model request (create) returns 200
-        APIUrl.ADDITIONAL_FIELDS = list()
         request = self.factory.post('/test_api/foo/', data={"f2": "foo"})
         request.user = user
         response = t.post(request)
         self.assertEqual(response.status_code, StatusCode.OK)
 
         # Test post instance  (update) gives back 200
-        APIUrl.ADDITIONAL_FIELDS = list()
         foo = Foo.objects.get(id=1)
         request = self.factory.post('/test_api/foo/{}/'.format(foo.id), data={"f1": True})
         request.user = user
@@ -322,13 +856,440 @@ class APIViewTestCase(APIToolsTestCase):
         response = t._get_all(request)
         self.assertIsNone(json.loads(response.content))
 
+        # Test streaming endpoints give back the same JSON array
+        t.streaming_endpoints = (Foo, )
+        request = self.factory.get('/test_api/foo/', data={"page": 2})
+        request.user = user
+        t._endpoint_model = Foo
+        response = t._get_all(request)
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(''.join(response.streaming_content)), Foo.get_all(2, user))
+
+        # Test streaming endpoints give back 404 for an invalid page
+        request = self.factory.get('/test_api/foo/', data={"page": 3})
+        request.user = user
+        response = t._get_all(request)
+        self.assertEqual(response.status_code, StatusCode.NOT_FOUND)
+        t.streaming_endpoints = ()
+
+        # Test cursor paginated endpoints give back the results with the cursors
+        request = self.factory.get('/test_api/bar/')
+        request.user = user
+        t._endpoint_model = Bar
+        response = t._get_all(request)
+        self.assertDictEqual(json.loads(response.content), Bar.get_all_by_cursor(None, user))
+
+        # Test an invalid cursor gives back 404
+        request = self.factory.get('/test_api/bar/', data={"cursor": "foo"})
+        request.user = user
+        t._endpoint_model = Bar
+        response = t._get_all(request)
+        self.assertEqual(response.status_code, StatusCode.NOT_FOUND)
+
+    def test_response_cache(self):
+        get_cache().clear()
+        owner = User.objects.get(id=1)
+        not_owner = User.objects.get(id=2)
+        t = TestAPIView()
+        t.cache_endpoints = (Foo, Qux)
+
+        def get(url, user, data=None):
+            request = self.factory.get(url, data=data)
+            request.user = user
+            return t.get(request)
+
+        # Test a cached page is served without any queries
+        response = get('/test_api/foo/', owner)
+        with self.assertNumQueries(0):
+            cached_response = get('/test_api/foo/', owner)
+        self.assertEqual(cached_response.status_code, StatusCode.OK)
+        self.assertEqual(cached_response.content, response.content)
+
+        # Test pages are cached separately
+        self.assertEqual(len(json.loads(get('/test_api/foo/', owner, {"page": 2}).content)), 1)
+
+        # Test short dictifications are shared by registered users, as they can't vary by ownership
+        with self.assertNumQueries(0):
+            get('/test_api/foo/', not_owner)
+
+        # Test long dictifications are cached per user, as they can vary by ownership
+        response = get('/test_api/foo/1/', owner)
+        self.assertIn('f2', json.loads(response.content))
+        with self.assertNumQueries(0):
+            self.assertEqual(get('/test_api/foo/1/', owner).content, response.content)
+        self.assertNotIn('f2', json.loads(get('/test_api/foo/1/', not_owner).content))
+        self.assertNotIn('f1', json.loads(get('/test_api/foo/1/', AnonymousUser()).content))
+
+        # Test saving an instance invalidates the cached responses
+        foo = Foo.objects.get(id=1)
+        foo.f1 = 5
+        foo.save()
+        self.assertEqual(json.loads(get('/test_api/foo/1/', owner).content)['f1'], 5)
+
+        # Test updating an instance via the API invalidates the cached responses
+        request = self.factory.post('/test_api/foo/1/', data={"f1": True})
+        request.user = owner
+        t.post(request)
+        self.assertEqual(json.loads(get('/test_api/foo/1/', owner).content)['f1'], 6)
+
+        # Test changing a related model invalidates the cached responses
+        self.assertEqual(json.loads(get('/test_api/qux/', owner).content)[0]['foos'], [])
+        Qux.objects.get(id=1).foos.add(foo)
+        self.assertEqual(json.loads(get('/test_api/qux/', owner).content)[0]['foos'], [foo.id])
+
+        # Test bad requests aren't cached
+        self.assertEqual(get('/test_api/foo/', owner, {"page": 3}).status_code, StatusCode.NOT_FOUND)
+        with self.assertNumQueries(1):
+            get('/test_api/foo/', owner, {"page": 3})
+
+        # Test views which expand all relations don't share cached responses or ETags with views which don't
+        expand_view = TestAPIView()
+        expand_view.cache_endpoints = (Foo,)
+        expand_view.expand_relations = True
+        t.conditional_endpoints = expand_view.conditional_endpoints = (Foo,)
+        response = get('/test_api/foo/1/', owner)
+        request = self.factory.get('/test_api/foo/1/')
+        request.user = owner
+        expanded_response = expand_view.get(request)
+        self.assertEqual(json.loads(response.content)['owner'], 1)
+        self.assertIsInstance(json.loads(expanded_response.content)['owner'], dict)
+        self.assertNotEqual(expanded_response['ETag'], response['ETag'])
+
+    def test_fragment_cache(self):
+        get_cache().clear()
+        owner = User.objects.get(id=1)
+        not_owner = User.objects.get(id=2)
+        t = TestAPIView()
+        t.fragment_cache_endpoints = (Foo, Qux)
+
+        def get(url, user, data=None, view=t):
+            request = self.factory.get(url, data=data)
+            request.user = user
+            return view.get(request)
+
+        # instances read with deferred fields are instances of a subclass
+        instantiated = []
+        def count_instances(sender, instance, **kwargs):
+            if isinstance(instance, Foo):
+                instantiated.append(instance)
+
+        post_init.connect(count_instances)
+        try:
+            # Test pages and instances served from fragments match the dictified responses
+            for url, user in (('/test_api/foo/', owner), ('/test_api/foo/1/', owner), ('/test_api/foo/1/', not_owner), ('/test_api/qux/', owner)):
+                self.assertEqual(json.loads(get(url, user).content), json.loads(get(url, user, view=TestAPIView()).content))
+            self.assertEqual(len(json.loads(get('/test_api/foo/', owner, {"page": 2}).content)), 1)
+
+            # Test cached fragments are spliced into the page without instantiating the instances
+            del instantiated[:]
+            with self.assertNumQueries(2):
+                response = get('/test_api/foo/', owner)
+            self.assertEqual(response.status_code, StatusCode.OK)
+            self.assertEqual(instantiated, [])
+
+            # Test a page makes the same cache round-trips whatever its size: related model versions + fragments
+            cache = get_cache()
+            lookups = []
+
+            def get_many(keys, *args, **kwargs):
+                lookups.append(keys)
+                return dict((key, type(cache).get(cache, key)) for key in keys if type(cache).get(cache, key) is not None)
+
+            cache.get, cache.get_many = lambda key, *args, **kwargs: get_many([key]).get(key), get_many
+            try:
+                self.assertEqual(get('/test_api/foo/', owner).content, response.content)
+            finally:
+                del cache.get, cache.get_many
+            self.assertEqual(len(lookups), 2)
+
+            # Test saving an instance only re-dictifies that instance
+            foo = Foo.objects.get(id=2)
+            foo.f1 = 5
+            foo.save()
+            del instantiated[:]
+            self.assertEqual(json.loads(get('/test_api/foo/', owner).content), json.loads(response.content))
+            self.assertEqual([foo.id for foo in instantiated], [2])
+
+            # Test cached instance fragments are served without reading the instance in full
+            del instantiated[:]
+            with self.assertNumQueries(1):
+                self.assertEqual(json.loads(get('/test_api/foo/1/', owner).content)['f1'], 1)
+            self.assertEqual(instantiated, [])
+        finally:
+            post_init.disconnect(count_instances)
+
+        # Test updating an instance via the API invalidates its fragments
+        request = self.factory.post('/test_api/foo/1/', data={"f1": True})
+        request.user = owner
+        t.post(request)
+        self.assertEqual(json.loads(get('/test_api/foo/1/', owner).content)['f1'], 2)
+
+        # Test deactivated instances aren't served from their fragments
+        request = self.factory.post('/test_api/foo/1/', data={"deactivate": True})
+        request.user = owner
+        t.post(request)
+        self.assertIsNone(json.loads(get('/test_api/foo/1/', owner).content))
+        self.assertNotIn({'id': 1}, json.loads(get('/test_api/foo/', owner).content))
+
+        # Test changing a related model invalidates the fragments
+        self.assertEqual(json.loads(get('/test_api/qux/', owner).content)[0]['foos'], [])
+        Qux.objects.get(id=1).foos.add(foo)
+        self.assertEqual(json.loads(get('/test_api/qux/', owner).content)[0]['foos'], [foo.id])
+
+        # Test invalid pages give back 404
+        self.assertEqual(get('/test_api/foo/', owner, {"page": 3}).status_code, StatusCode.NOT_FOUND)
+
+    def test_coalesce_requests(self):
+        user = User.objects.get(id=1)
+        handled = []
+
+        class SlowAPIView(TestAPIView):
+            coalesce_endpoints = (Foo, )
+
+            def _get_all(self, request):
+                handled.append(request)
+                # keeps the request in flight while the identical requests arrive
+                time.sleep(0.2)
+                return super(SlowAPIView, self)._get_all(request)
+
+        def get():
+            request = self.factory.get('/test_api/foo/')
+            request.user = user
+            return SlowAPIView().get(request)
+
+        # the threads share the test database's connection
+        connection = connections['default']
+        connection.allow_thread_sharing = True
+        start = threading.Event()
+        responses = []
+
+        def get_in_thread():
+            connections['default'] = connection
+            start.wait()
+            responses.append(get())
+
+        try:
+            # Test identical concurrent requests are handled once, and each gets a copy of the response
+            threads = [threading.Thread(target=get_in_thread) for i in range(5)]
+            with CaptureQueriesContext(connection) as coalesced_queries:
+                for thread in threads:
+                    thread.start()
+                start.set()
+                for thread in threads:
+                    thread.join()
+        finally:
+            connection.allow_thread_sharing = False
+
+        self.assertEqual(len(handled), 1)
+        with CaptureQueriesContext(connection) as queries:
+            response = get()
+        self.assertEqual(len(coalesced_queries), len(queries))
+        self.assertEqual([(r.status_code, r.content, r['Content-Type']) for r in responses], [(response.status_code, response.content, response['Content-Type'])] * 5)
+        self.assertEqual(len(set(id(r) for r in responses)), 5)
+
+        # Test requests for instances by id aren't coalesced across users who can see different fields
+        not_owner = User.objects.get(id=2)
+
+        class SlowManyAPIView(TestAPIView):
+            coalesce_endpoints = (Foo, )
+
+            def _get_many(self, request):
+                time.sleep(0.2)
+                return super(SlowManyAPIView, self)._get_many(request)
+
+        def get_many(user):
+            request = self.factory.get('/test_api/foo/', data={'ids': '1'})
+            request.user = user
+            return SlowManyAPIView().get(request)
+
+        start.clear()
+        responses = {}
+
+        def get_many_in_thread(user):
+            connections['default'] = connection
+            start.wait()
+            responses[user.id] = get_many(user).content
+
+        connection.allow_thread_sharing = True
+        try:
+            threads = [threading.Thread(target=get_many_in_thread, args=(u,)) for u in (user, not_owner)]
+            for thread in threads:
+                thread.start()
+            start.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            connection.allow_thread_sharing = False
+
+        self.assertIn('f2', json.loads(responses[user.id])[0])
+        self.assertNotIn('f2', json.loads(responses[not_owner.id])[0])
+
+        # Test requests waiting too long handle the request themselves
+        single_flight = SingleFlight()
+        release = threading.Event()
+        thread = threading.Thread(target=single_flight.do, args=('key', release.wait, 10))
+        thread.start()
+        time.sleep(0.05)
+        self.assertEqual(single_flight.do('key', lambda: 'handled', 0.01), ('handled', False))
+        release.set()
+        thread.join()
+        self.assertEqual(single_flight.do('key', lambda: 'handled', 0.01), ('handled', False))
+
+        # Test custom requests answered in place of a missing instance aren't coalesced, as they can depend on the user
+        coalesced = []
+
+        class CustomAPIView(TestAPIView):
+            coalesce_endpoints = (Qux, )
+
+            def _coalesce(self, request, handler, short_dict):
+                response = super(CustomAPIView, self)._coalesce(request, handler, short_dict)
+                coalesced.append(response)
+                return response
+
+        request = self.factory.get('/test_api/qux/custom/')
+        request.user = user
+        self.assertEqual(json.loads(CustomAPIView().get(request).content), Qux.api_custom_request(request))
+        self.assertEqual(coalesced, [None])
+
+        # Test requests reading from different databases aren't coalesced
+        t = TestAPIView()
+        t._validate_request(request)
+        with use_read_database('replica'):
+            replica_key = t._get_coalesce_key(request, short_dict=False)
+        self.assertNotEqual(t._get_coalesce_key(request, short_dict=False), replica_key)
+
+    def test_server_timing(self):
+        owner = User.objects.get(id=1)
+        connection = connections['default']
+        t = TestAPIView()
+
+        def get(url, view=t):
+            request = self.factory.get(url)
+            request.user = owner
+            return view.get(request)
+
+        # Test responses aren't timed by default
+        self.assertNotIn('Server-Timing', get('/test_api/foo/1/'))
+
+        # Test each phase is timed, along with the queries made in it
+        t.server_timing = True
+        with CaptureQueriesContext(connection) as queries:
+            response = get('/test_api/foo/1/')
+        metrics = [metric.split(';', 1) for metric in response['Server-Timing'].split(', ')]
+        self.assertEqual([name for name, metric in metrics], ['app', 'route', 'fetch', 'dictify', 'encode', 'db', 'total'])
+        metrics = dict(metrics)
+        self.assertIn('desc="1 queries"', metrics['fetch'])
+        self.assertIn('desc="{} queries"'.format(len(queries)), metrics['db'])
+        self.assertEqual(response.content, get('/test_api/foo/1/', TestAPIView()).content)
+
+        # Test queries are only logged while a request is timed
+        logged_queries = len(connection.queries)
+        get('/test_api/foo/')
+        self.assertEqual((len(connection.queries), connection.use_debug_cursor), (logged_queries, False))
+
+        # Test the timings can be given in an envelope around the response
+        t.server_timing = False
+        t.timing_envelope = True
+        response = get('/test_api/foo/')
+        content = json.loads(response.content)
+        self.assertEqual(content['data'], json.loads(get('/test_api/foo/', TestAPIView()).content))
+        self.assertEqual(sorted(content['timing']), ['db', 'phases', 'total'])
+        self.assertIn('fetch', content['timing']['phases'])
+        self.assertNotIn('Server-Timing', response)
+
+        # Test responses which aren't successful aren't wrapped, including not modified responses without a body
+        self.assertIsNone(json.loads(get('/test_api/foo/1000/').content))
+        t.conditional_endpoints = (Foo, )
+        request = self.factory.get('/test_api/foo/1/', HTTP_IF_NONE_MATCH=get('/test_api/foo/1/')['ETag'])
+        request.user = owner
+        response = t.get(request)
+        self.assertEqual(response.status_code, StatusCode.NOT_MODIFIED)
+        self.assertEqual(response.content, '')
+
+    def test_conditional_get(self):
+        get_cache().clear()
+        owner = User.objects.get(id=1)
+        not_owner = User.objects.get(id=2)
+        t = TestAPIView()
+        t.conditional_endpoints = (Foo, Bar)
+
+        def get(url, user, **headers):
+            request = self.factory.get(url, **headers)
+            request.user = user
+            return t.get(request)
+
+        # Test an unchanged instance gives back 304 without being dictified
+        response = get('/test_api/foo/1/', owner)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = get('/test_api/foo/1/', owner, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, StatusCode.NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, '')
+
+        # Test users seeing different fields get different validators
+        self.assertEqual(get('/test_api/foo/1/', not_owner, HTTP_IF_NONE_MATCH=etag).status_code, StatusCode.OK)
+
+        # Test requesting specific fields gives back a different representation with a different ETag
+        response = get('/test_api/foo/1/?fields=id,f1', owner, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, StatusCode.OK)
+        self.assertEqual(json.loads(response.content), {'id': 1, 'f1': 1})
+
+        # Test a modified instance gives back 200 with a new ETag
+        foo = Foo.objects.get(id=1)
+        foo.save()
+        response = get('/test_api/foo/1/', owner, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, StatusCode.OK)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+
+        # Test modifying a related model changes the ETag
+        foo.owner.save()
+        self.assertEqual(get('/test_api/foo/1/', owner, HTTP_IF_NONE_MATCH=etag).status_code, StatusCode.OK)
+
+        # Test an unchanged page gives back 304, and a changed page 200
+        etag = get('/test_api/foo/', owner)['ETag']
+        self.assertEqual(get('/test_api/foo/', owner, HTTP_IF_NONE_MATCH=etag).status_code, StatusCode.NOT_MODIFIED)
+        self.assertEqual(get('/test_api/foo/', owner, data={"page": 2}, HTTP_IF_NONE_MATCH=etag).status_code, StatusCode.OK)
+        Foo.objects.get(id=2).save()
+        self.assertEqual(get('/test_api/foo/', owner, HTTP_IF_NONE_MATCH=etag).status_code, StatusCode.OK)
+
+        # Test models without related models give back a Last-Modified date
+        bar = Bar.objects.get(id=1)
+        bar.save()
+        response = get('/test_api/bar/1/', owner)
+        last_modified = response['Last-Modified']
+        self.assertEqual(get('/test_api/bar/1/', owner, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, StatusCode.NOT_MODIFIED)
+
+        # Test models with related models don't give back a Last-Modified date
+        self.assertFalse(get('/test_api/foo/1/', owner).has_header('Last-Modified'))
+
+        # Test pages don't give back a Last-Modified date, as instances leaving the page don't make it later
+        t.conditional_endpoints = (Foo, Bar, TestProfile)
+        TestProfile.objects.update(date_modified=timezone.now() - timedelta(days=1))
+        TestProfile.pagination = 1
+        try:
+            # the instance on the first page is the latest modified, and is replaced by an older one
+            (profile_id, date_modified), = TestProfile.get_page_modifications(1)
+            TestProfile.objects.filter(id=profile_id).update(date_modified=timezone.now())
+            response = get('/test_api/profile/', owner)
+            self.assertFalse(response.has_header('Last-Modified'))
+            TestProfile.objects.filter(id=profile_id).update(active=0)
+            self.assertNotEqual(TestProfile.get_page_modifications(1)[0][0], profile_id)
+            self.assertEqual(get('/test_api/profile/', owner, HTTP_IF_MODIFIED_SINCE=http_date()).status_code, StatusCode.OK)
+        finally:
+            del TestProfile.pagination
+
+        # Test missing instances aren't validated
+        self.assertFalse(get('/test_api/foo/22/', owner).has_header('ETag'))
+
     def test_get_instance(self):
         user = User.objects.get(id=1)
         t = TestAPIView()
 
         # Test Foo ID = 1 gives back 200/ correct Foo
         foo = Foo.objects.get(id=1)
-        foo_dict = foo.dictify_with_auth(user, short_dict=False)
+        foo_dict = foo.dictify_with_auth(user, short_dict=False, expand=frozenset())
         request = self.factory.get('/test_api/foo/{}/'.format(foo.id))
         request.user = user
         t._endpoint_model = Foo
@@ -337,6 +1298,14 @@ class APIViewTestCase(APIToolsTestCase):
         self.assertDictEqual(json.loads(response.content), foo_dict)
         self.assertEqual(response.status_code, StatusCode.OK)
 
+        # Test relations are given as bare primary keys unless they're expanded
+        self.assertEqual(foo_dict['owner'], foo.owner_id)
+        request = self.factory.get('/test_api/foo/{}/'.format(foo.id), data={'expand': 'owner'})
+        request.user = user
+        t._url_validator = APIUrl(request)
+        response = t._get_instance(request)
+        self.assertDictEqual(json.loads(response.content), foo.dictify_with_auth(user, short_dict=False))
+
         # Test Foo ID = 22 gives back 404/ none
         request = self.factory.get('/test_api/foo/22/')
         request.user = user
@@ -364,6 +1333,43 @@ class APIViewTestCase(APIToolsTestCase):
         self.assertEqual(response.status_code, StatusCode.OK)
         self.assertEqual(json.loads(response.content), Qux.api_custom_request(request))
 
+        # Test cached instances are served like instances read from the database, and updates read fresh instances
+        get_cache().clear()
+        Foo.get_local_instance_cache().clear()
+        Foo.cache_instances = True
+        try:
+            def get(url):
+                request = self.factory.get(url)
+                request.user = user
+                return t.get(request)
+
+            response = get('/test_api/foo/1/')
+            self.assertEqual(json.loads(response.content), Foo.objects.get(id=1).dictify_with_auth(user, short_dict=False, expand=frozenset()))
+            self.assertEqual(get('/test_api/foo/1/').content, response.content)
+            self.assertEqual(get('/test_api/foo/1000/').status_code, StatusCode.NOT_FOUND)
+
+            Foo.objects.filter(id=1).update(f1=10)
+            request = self.factory.post('/test_api/foo/1/', data={"f2": "changed"})
+            request.user = user
+            self.assertEqual(json.loads(t.post(request).content)['f1'], 10)
+        finally:
+            del Foo.cache_instances
+
+        # Test models overriding get_model_instance() are still called with the instance criteria alone
+        Foo.get_model_instance = classmethod(lambda cls, rest_param: cls.objects.get(id=rest_param))
+        try:
+            request = self.factory.get('/test_api/foo/1/', data={'fields': 'id,owner', 'expand': 'owner'})
+            request.user = user
+            self.assertEqual(json.loads(t.get(request).content), Foo.objects.get(id=1).dictify_with_auth(user, short_dict=False, fields=frozenset(['id', 'owner'])))
+
+            request = self.factory.post('/test_api/foo/1/', data={"f2": "changed"})
+            request.user = user
+            response = t.post(request)
+            self.assertEqual(response.status_code, StatusCode.OK)
+            self.assertEqual(json.loads(response.content)['id'], 1)
+        finally:
+            del Foo.get_model_instance
+
     def test_post_handler(self):
         t = TestAPIView()
 
@@ -386,7 +1392,7 @@ class APIViewTestCase(APIToolsTestCase):
         foo_dict = json.loads(response.content)
         self.assertEqual(response.status_code, StatusCode.OK)
         self.assertEqual(foo_dict['f2'], f2_val)
-        self.assertEqual(foo_dict, Foo.objects.get(id=foo_dict['id']).dictify_with_auth(user, short_dict=False))
+        self.assertEqual(foo_dict, Foo.objects.get(id=foo_dict['id']).dictify_with_auth(user, short_dict=False, expand=frozenset()))
 
         # Test create Foo with bad/missing fields returns 404
         f1_val = "hello"
@@ -407,7 +1413,7 @@ class APIViewTestCase(APIToolsTestCase):
         response_content = json.loads(response.content)
         self.assertEqual(response_content['f1'], f1_before + 1)
         new_foo = Foo.objects.get(id=1)
-        self.assertDictEqual(new_foo.dictify_with_auth(user, False), response_content)
+        self.assertDictEqual(new_foo.dictify_with_auth(user, False, expand=frozenset()), response_content)
 
         # Test update with non owner returns 404
         request = self.factory.post(foo1_url, data={"f1": True})
@@ -421,6 +1427,54 @@ class APIViewTestCase(APIToolsTestCase):
         response = t._post_handler(request, public_endpoints, create=False)
         self.assertEqual(response.status_code, StatusCode.NOT_FOUND)
 
+        # Test deactivating many instances at once gives back the ids deactivated
+        request = self.factory.post('/test_api/foo/?ids=4,5,6', data={"deactivate": True})
+        request.user = user
+        response = t.post(request)
+        self.assertEqual(response.status_code, StatusCode.OK)
+        self.assertEqual(sorted(json.loads(response.content)), [4, 5, 6])
+        self.assertFalse(Foo.objects.filter(id__in=[4, 5, 6], active=1).exists())
+        self.assertEqual(Foo.objects.filter(id__in=[4, 5, 6], date_deactivated__isnull=True).count(), 0)
+
+        # Test only fields listed in bulk_update_fields are changed, and invalid changes give back 404
+        request = self.factory.post('/test_api/foo/?ids=7', data={"f1": 3, "f2": "changed"})
+        request.user = user
+        self.assertEqual(json.loads(t.post(request).content), [7])
+        self.assertEqual((Foo.objects.get(id=7).f1, Foo.objects.get(id=7).f2), (3, Foo.objects.get(id=8).f2))
+        request = self.factory.post('/test_api/foo/?ids=7', data={"f1": "foo"})
+        request.user = user
+        self.assertEqual(t.post(request).status_code, StatusCode.NOT_FOUND)
+
+        # Test updating a versioned instance from a stale version gives back 409
+        bar = Bar.objects.get(id=1)
+        request = self.factory.post('/test_api/bar/1/', data={"f1": True, "version": bar.version})
+        request.user = user
+        self.assertEqual(t.post(request).status_code, StatusCode.OK)
+        self.assertEqual(t.post(request).status_code, StatusCode.CONFLICT)
+        self.assertEqual(Bar.objects.get(id=1).f1, bar.f1 + 1)
+
+        # Test the public can't update many instances at once
+        request = self.factory.post('/test_api/foo/?ids=7', data={"deactivate": True})
+        request.user = AnonymousUser()
+        self.assertEqual(t.post(request).status_code, StatusCode.NOT_FOUND)
+
+        # Test creating from a JSON array gives back each instance created
+        request = self.factory.post('/test_api/foo/', data=json.dumps([{"f2": "a"}, {"f2": "b"}]), content_type='application/json')
+        request.user = user
+        response = t._post_handler(request, public_endpoints)
+        self.assertEqual(response.status_code, StatusCode.OK)
+        foo_dicts = json.loads(response.content)
+        self.assertEqual([foo_dict['f2'] for foo_dict in foo_dicts], ['a', 'b'])
+        self.assertEqual(foo_dicts, [Foo.objects.get(id=foo_dict['id']).dictify_with_auth(user, short_dict=False, expand=frozenset()) for foo_dict in foo_dicts])
+
+        # Test invalid items, or endpoints which don't allow bulk creation, give back 404
+        for endpoint_model, body in ((Foo, '[{"f2": "far too long"}]'), (Foo, '[{"f3": "a"}]'), (Foo, '{"f2": "a"}'), (Foo, '['), (Bar, '[{"f1": 1}]')):
+            request = self.factory.post('/test_api/foo/', data=body, content_type='application/json')
+            request.user = user
+            t._endpoint_model = endpoint_model
+            response = t._post_handler(request, public_endpoints)
+            self.assertEqual(response.status_code, StatusCode.NOT_FOUND)
+
     def test_get_json_response_for_instance(self):
         foo = Foo.objects.get(id=1)
         t = TestAPIView()
@@ -479,6 +1533,17 @@ class APIViewTestCase(APIToolsTestCase):
         session_val_after = response.cookies['sessionid'].value
         self.assertNotEqual(session_val_before, session_val_after)
 
+        # Test relations of the login object are given as ids unless they're expanded, as with other responses
+        return_on_login = TestAPIView.return_on_login
+        TestAPIView.return_on_login = 'user.test_profile.foos.get(id=1)'
+        try:
+            response = c.post(login_url, data={"username": valid_user.username, "password": new_password})
+            self.assertEqual(json.loads(response.content)['owner'], valid_user.test_profile.id)
+            response = c.post(login_url + '?expand=owner', data={"username": valid_user.username, "password": new_password})
+            self.assertIsInstance(json.loads(response.content)['owner'], dict)
+        finally:
+            TestAPIView.return_on_login = return_on_login
+
         # Test an invalid login returns 404
         response = c.post(login_url, data={"username": valid_user.username, "password": "badpassword"})
         self.assertEqual(response.status_code, StatusCode.NOT_FOUND)
@@ -495,6 +1560,86 @@ class APIViewTestCase(APIToolsTestCase):
         response = c.get("/test_api/{}".format(ReservedURL.CSRFTOKEN))
         self.assertIsNotNone(response.cookies['csrftoken'].value)
 
+    def test_handle_export_request(self):
+        user = User.objects.get(id=1)
+        t = TestAPIView()
+
+        # Test an export endpoint streams each active instance on its own line
+        request = self.factory.get('/test_api/{}/foo/'.format(ReservedURL.EXPORT))
+        request.user = user
+        response = t.get(request)
+        self.assertEqual(response.status_code, StatusCode.OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = ''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], list(Foo.export_all(user)))
+
+        # Test an endpoint which doesn't allow exporting gives back 404
+        request = self.factory.get('/test_api/{}/qux/'.format(ReservedURL.EXPORT))
+        request.user = user
+        response = t.get(request)
+        self.assertEqual(response.status_code, StatusCode.NOT_FOUND)
+
+        # Test a missing endpoint gives back 404
+        request = self.factory.get('/test_api/{}/'.format(ReservedURL.EXPORT))
+        request.user = user
+        response = t.get(request)
+        self.assertEqual(response.status_code, StatusCode.NOT_FOUND)
+
+    def test_get_many(self):
+        user = User.objects.get(id=1)
+        t = TestAPIView()
+
+        def get(url, **data):
+            request = self.factory.get(url, data=data)
+            request.user = user
+            return t.get(request)
+
+        # Test instances are given back in the order requested
+        response = get('/test_api/foo/', ids='2,1', fields='id,f1')
+        self.assertEqual(response.status_code, StatusCode.OK)
+        self.assertEqual(json.loads(response.content), [{'id': 2, 'f1': 1}, {'id': 1, 'f1': 1}])
+
+        # Test invalid ids give back 404
+        self.assertEqual(get('/test_api/foo/', ids='1,foo').status_code, StatusCode.NOT_FOUND)
+
+    def test_handle_batch_request(self):
+        user = User.objects.get(id=1)
+        t = TestAPIView()
+        t.streaming_endpoints = (Foo, )
+
+        def get(url, **data):
+            request = self.factory.get(url, data=data)
+            request.user = user
+            return t.get(request)
+
+        # Test each sub-request gives back the same status and data as it would on its own
+        urls = ['foo/?page=2', 'foo/1/?fields=id,f1', 'qux/1/custom/', 'foo/1000/', 'foo/?page=2', '{}/'.format(ReservedURL.LOGOUT)]
+        response = get('/test_api/{}/'.format(ReservedURL.BATCH), requests=json.dumps(urls))
+        self.assertEqual(response.status_code, StatusCode.OK)
+        results = json.loads(response.content)
+        self.assertEqual(len(results), len(urls))
+
+        for url, result in zip(urls[:4], results):
+            path, _, query_string = url.partition('?')
+            response = get('/test_api/' + path, **dict(pair.split('=') for pair in query_string.split('&') if pair))
+            content = ''.join(response.streaming_content) if response.streaming else response.content
+            self.assertEqual(result, {'status': response.status_code, 'data': json.loads(content)})
+
+        # Test repeated sub-requests are answered alike, and reserved URLs can't be batched
+        self.assertEqual(results[4], results[0])
+        self.assertEqual(results[5], {'status': StatusCode.NOT_FOUND, 'data': None})
+
+        # Test repeated sub-requests are only served once
+        with self.assertNumQueries(1):
+            get('/test_api/{}/'.format(ReservedURL.BATCH), requests=json.dumps(['foo/1/?fields=id', 'foo/1/?fields=id']))
+
+        # Test unreadable or oversized batches give back 404
+        self.assertEqual(get('/test_api/{}/'.format(ReservedURL.BATCH), requests='foo/').status_code, StatusCode.NOT_FOUND)
+        self.assertEqual(get('/test_api/{}/'.format(ReservedURL.BATCH), requests='{"foo": 1}').status_code, StatusCode.NOT_FOUND)
+        self.assertEqual(get('/test_api/{}/'.format(ReservedURL.BATCH)).status_code, StatusCode.NOT_FOUND)
+        too_many = json.dumps(['foo/'] * (t.max_batch_requests + 1))
+        self.assertEqual(get('/test_api/{}/'.format(ReservedURL.BATCH), requests=too_many).status_code, StatusCode.NOT_FOUND)
+
     def test_handle_custom_request(self):
         t = TestAPIView()
 
@@ -510,6 +1655,88 @@ class APIViewTestCase(APIToolsTestCase):
         response = t.handle_custom_request(request)
         self.assertEqual(response.status_code, StatusCode.NOT_FOUND)
 
+class APIDatabaseTestCase(APIToolsTestCase):
+
+    fixtures = ['user_testprofile_foo.json', 'bar_baz_qux.json']
+    urls = 'django_api_tools.tests.urls'
+    multi_db = True
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        get_cache().clear()
+
+    @override_settings(API_TOOLS_READ_DATABASE='replica')
+    def test_read_replica(self):
+        user = User.objects.get(id=1)
+        other_user = User.objects.get(id=2)
+        t = TestAPIView()
+
+        def get(url, user):
+            request = self.factory.get(url)
+            request.user = user
+            return json.loads(t.get(request).content)
+
+        def get_streamed(url, user):
+            request = self.factory.get(url)
+            request.user = user
+            return json.loads(''.join(t.get(request).streaming_content))
+
+        # the replica lags behind the primary
+        Foo.objects.using('default').filter(id=1).update(f1=5)
+        Foo.objects.using('replica').filter(id=2).update(active=0)
+
+        # Test GET requests (including streamed ones) read from the replica
+        self.assertEqual(get('/test_api/foo/1/', user)['f1'], 1)
+        self.assertNotIn({'id': 2}, get('/test_api/foo/', user))
+        t.stream_responses = True
+        self.assertNotIn({'id': 2}, get_streamed('/test_api/foo/', user))
+        t.stream_responses = False
+
+        # Test POST requests read from and write to the primary
+        request = self.factory.post('/test_api/foo/1/', data={'f1': True})
+        request.user = user
+        self.assertEqual(json.loads(t.post(request).content)['f1'], 6)
+        self.assertEqual(Foo.objects.using('replica').get(id=1).f1, 1)
+
+        # Test the user's reads are pinned to the primary after a write, but other users' aren't
+        self.assertEqual(get('/test_api/foo/1/', user)['f1'], 6)
+        self.assertIn({'id': 2}, get('/test_api/foo/', user))
+        self.assertEqual(get('/test_api/foo/1/', other_user)['f1'], 1)
+
+        # Test reads go back to the replica when the pin expires
+        get_cache().clear()
+        self.assertEqual(get('/test_api/foo/1/', user)['f1'], 1)
+
+        # Test POST requests which don't change any model (failed logins, batches, empty updates) don't pin the user's reads
+        for url, data in (('/test_api/login/', {'username': 'foo1', 'password': 'wrong'}), ('/test_api/batch/', {'requests': '["foo/1/"]'}), ('/test_api/foo/1/', {})):
+            request = self.factory.post(url, data=data)
+            request.user = user
+            t.post(request)
+            self.assertEqual(get('/test_api/foo/1/', user)['f1'], 1, url)
+
+        # Test users pinned to the primary aren't served responses cached from the replica
+        t.cache_endpoints = (Foo,)
+        request = self.factory.post('/test_api/foo/3/', data={'deactivate': True})
+        request.user = user
+        t.post(request)
+        self.assertIn({'id': 3}, get('/test_api/foo/', other_user))
+        self.assertNotIn({'id': 3}, get('/test_api/foo/', user))
+        t.cache_endpoints = ()
+
+        # Test reads stay on the primary when no replica is set
+        with self.settings(API_TOOLS_READ_DATABASE=None):
+            self.assertEqual(get('/test_api/foo/1/', other_user)['f1'], 6)
+
+        # Test the instance cache is filled from the primary, so that it never holds an instance read from the replica
+        get_cache().clear()
+        Foo.get_local_instance_cache().clear()
+        Foo.cache_instances = True
+        try:
+            self.assertEqual(get('/test_api/foo/1/', other_user)['f1'], 6)
+        finally:
+            del Foo.cache_instances
+            Foo.get_local_instance_cache().clear()
+
 class APIUrlTestCase(APIToolsTestCase):
 
     def setUp(self):
@@ -546,10 +1773,107 @@ class APIUrlTestCase(APIToolsTestCase):
         self.assertTrue(splitter.is_reserved_url())
         self.assertEqual(reserved_url, splitter.RESERVED_URL)
 
+        # Test the fields following a reserved URL
+        request = self.factory.get("/api/{}/{}/".format(ReservedURL.EXPORT, MODEL_NAME))
+        splitter = APIUrl(request)
+        self.assertTrue(splitter.is_reserved_url())
+        self.assertEqual(splitter.RESERVED_URL_FIELDS, (MODEL_NAME, ))
+
         # Test a custom request
         reserved_url = ReservedURL.LOGOUT
         request = self.factory.get("/api/{}/".format(reserved_url))
         splitter = APIUrl(request)
         self.assertTrue(splitter.is_valid_request())
         self.assertTrue(splitter.is_reserved_url())
-        self.assertEqual(reserved_url, splitter.RESERVED_URL)
\ No newline at end of file
+        self.assertEqual(reserved_url, splitter.RESERVED_URL)
+
+        # Test custom request fields belong to the request they were sent with
+        request = self.factory.get("/api/{}/{}/custom/field/".format(MODEL_NAME, MODEL_INSTANCE))
+        splitter = APIUrl(request)
+        self.assertTrue(splitter.is_custom_request())
+        self.assertEqual(splitter.ADDITIONAL_FIELDS, ('custom', 'field'))
+        splitter = APIUrl(self.factory.get("/api/{}/{}/".format(MODEL_NAME, MODEL_INSTANCE)))
+        self.assertFalse(splitter.is_custom_request())
+        self.assertTrue(splitter.is_model_instance_request())
+
+        # Test APIUrls don't hold any state other than the request's URL components
+        with self.assertRaises(AttributeError):
+            splitter.extra_state = True
+
+    def test_router(self):
+        router = APIRouter({'foo': Foo, ReservedURL.LOGIN: Bar})
+
+        # Test endpoint names are resolved to their models
+        splitter = APIUrl(self.factory.get("/api/foo/1/"), router)
+        self.assertEqual(splitter.ENDPOINT_MODEL, Foo)
+        self.assertTrue(splitter.is_model_instance_request())
+
+        # Test unknown endpoints aren't resolved, and reserved URLs take precedence over endpoints
+        self.assertIsNone(APIUrl(self.factory.get("/api/bar/"), router).ENDPOINT_MODEL)
+        splitter = APIUrl(self.factory.get("/api/{}/".format(ReservedURL.LOGIN)), router)
+        self.assertEqual(splitter.RESERVED_URL, ReservedURL.LOGIN)
+        self.assertIsNone(splitter.ENDPOINT_MODEL)
+
+        # Test views build their router once
+        t = TestAPIView()
+        self.assertIs(t.get_router(), TestAPIView().get_router())
+        self.assertEqual(t.get_router().resolve('qux'), (None, Qux))
+
+class APIEncoderTestCase(APIToolsTestCase):
+
+    fixtures = ['user_testprofile_foo.json', 'bar_baz_qux.json']
+
+    def test_json_backends(self):
+        data = [{
+            'id': 1,
+            'datetime': datetime(2015, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc),
+            'date': date(2015, 1, 2),
+            'decimal': Decimal('1.10'),
+            'uuid': uuid4(),
+            'text': mark_safe(u'caf\xe9 </a>'),
+            'related': [{'id': 2}, None],
+            'ordered': OrderedDict([('id', 3), ('ids', (4, 5))])
+        }]
+        expected = json.loads(json.dumps(data, cls=APIJSONEncoder))
+
+        # Test every installed backend encodes the same way as the stdlib encoder
+        for backend in available_json_backends():
+            self.assertEqual(json.loads(backend.dumps(data)), expected, backend.name)
+
+        # Test the stdlib backend is always available, and is the default
+        self.assertIn('json', [backend.name for backend in available_json_backends()])
+        self.assertEqual(get_json_backend().name, 'json')
+
+
+        # Test an unknown backend raises the expected exception
+        with self.assertRaises(ValueError):
+            get_json_backend('foo')
+
+        # Test the backend can be chosen with a setting
+        with override_settings(API_TOOLS_JSON_BACKEND='json'):
+            self.assertEqual(get_json_backend().name, 'json')
+
+        # Test ujson is given a copy of the data wherever it holds values which aren't JSON types
+        backend = UltraJSONBackend.__new__(UltraJSONBackend)
+        backend._default = APIJSONEncoder().default
+        page = [{'id': 1, 'related': [{'id': 2}]}, {'id': 3, 'decimal': Decimal('1.10')}]
+        self.assertIsNone(backend.convert(page[:1]))
+        converted = backend.convert(page)
+        self.assertIs(converted[0], page[0])
+        self.assertEqual(converted[1], {'id': 3, 'decimal': '1.10'})
+        self.assertIsInstance(page[1]['decimal'], Decimal)
+
+    def test_view_json_backend(self):
+        user = User.objects.get(id=1)
+        t = TestAPIView()
+        request = RequestFactory().get('/test_api/foo/1/')
+        request.user = user
+
+        # Test each backend chosen on the view gives back the same response
+        contents = []
+        for backend in available_json_backends():
+            t.json_backend = backend.name
+            response = t.get(request)
+            self.assertEqual(response.status_code, StatusCode.OK)
+            contents.append(json.loads(response.content))
+        self.assertTrue(all(content == contents[0] for content in contents))
@@ -1,5 +1,5 @@
 from django_api_tools.APIView import APIView
-from django_api_tools.tests.models import Foo, Qux, TestProfile
+from django_api_tools.tests.models import Foo, Bar, Qux, TestProfile
 
 __author__ = 'szpytfire'
 
@@ -8,9 +8,12 @@ class TestAPIView(APIView):
     registered_endpoints = {
         'profile': TestProfile,
         'foo': Foo,
+        'bar': Bar,
         'qux': Qux
     }
 
     public_create_endpoints = (TestProfile, )
 
+    export_endpoints = (Foo, )
+
     return_on_login = 'user.test_profile'
\ No newline at end of file